@@ -44,8 +44,9 @@ class AppFactory:
     
     def _setup_components(self):
         """设置应用组件"""
-        # 这里可以添加其他组件的初始化代码
-        pass
+        # 按配置设置数据存储的持久化方式
+        self.repo_manager.configure(self.app.config)
+        self.service_manager.configure(self.app.config)
     
     def _setup_request_handlers(self):
         """设置请求处理器"""
@@ -56,20 +57,22 @@ class AppFactory:
             g.data_modified = False
             g.service_manager = self.service_manager
             g.repo_manager = self.repo_manager
+            # 多进程部署时先读入其他 worker 写入的变更
+            self.repo_manager.refresh()
+            # 服务层不再立即保存，请求内的全部变更在响应生成后统一写入
+            self.repo_manager.defer_saves()
         
-        # @self.app.after_request
-        # def after_request(response):
-        #     """请求后处理 - 确保数据正确保存"""
-        #     if hasattr(g, 'data_modified') and g.data_modified:
-        #         print("检测到数据修改，正在保存...")  # 调试信息
-        #         try:
-        #             # 保存所有仓储的数据
-        #             self.repo_manager.save_all()
-        #             print("数据保存成功")  # 调试信息
-        #         except Exception as e:
-        #             print(f"数据保存失败: {e}")  # 调试信息
-        #     return response
+        @self.app.after_request
+        def after_request(response):
+            """请求后处理 - 一次性保存本请求中有变更的表"""
+            if not self.repo_manager.flush():
+                print("❌ 请求结束时保存数据失败，将在下一次保存时重试")
+            return response
         
+        @self.app.teardown_request
+        def teardown_request(error=None):
+            """请求异常结束时 after_request 不会执行，保证推迟的变更仍被写入"""
+            self.repo_manager.flush()
         
         @self.app.errorhandler(BusinessException)
         def handle_business_exception(error):
@@ -160,23 +163,47 @@ class AppFactory:
         """获取仓储实例"""
         return getattr(self.repo_manager, repo_name, None)
 
-class DevelopmentConfig:
+class Config:
+    """各环境共用的配置，环境配置只覆盖不同的项"""
+    DEBUG = False
+    TESTING = False
+    DATA_FILE = 'app_data.json'
+    STORAGE_BACKEND = 'json'  # 'json' 或 'sqlite'
+    SQLITE_FILE = 'app_data.db'
+    PERSISTENCE_MODE = 'snapshot'  # 'snapshot' 或 'journal'（变更追加写入 <数据文件>.wal，改变磁盘格式，见 readme.md）
+    STORAGE_LAYOUT = 'single'  # 'single' 或 'split'（每张表一个文件，首次启动时迁移数据，见 readme.md）
+    DATA_DIR = 'data'
+    BINARY_SNAPSHOT = False  # 可选：每次保存时在JSON快照旁另写一份二进制快照，加快启动（较新的一份优先加载）
+    MULTI_PROCESS = False  # 多个 worker 进程共用数据文件（强制 journal 模式）
+    FILE_WATCH_INTERVAL = 2.0  # 检查数据文件是否被手工修改的间隔（秒），0 为不检查
+    ATTENDANCE_PARTITIONS = False  # 考勤按月分区（数据文件中的 attendances 改为 attendances@YYYY-MM），开启后不能再关闭
+    ARCHIVE_KEEP_MONTHS = 0  # 需开启考勤分区：保留为普通分区的最近月数（含本月），更早的月份封存到数据文件旁的 *_segments 目录，该目录须与数据文件一同备份和提交；0 为不封存
+    COUNTER_RECONCILE_INTERVAL = 600  # 核对物化选课人数的间隔（秒），0 为不定期核对
+    ENROLLMENT_RUSH_MODE = False  # 选课高峰模式，在选课开放期间临时开启：原子分配名额，选课记录由后台批量写入，保存前显示为待确认（仅单进程）
+    ENROLLMENT_ALLOCATION = 'first_come'  # 'first_come' 先到先得，或 'lottery' 开放期间登记志愿、关闭时抽签分配
+    ENROLLMENT_LOTTERY_MAX_CHOICES = 5  # 抽签模式下每个学生最多登记的志愿数，0 为不限
+
+class DevelopmentConfig(Config):
     """开发环境配置"""
     DEBUG = True
     TESTING = False
     DATA_FILE = 'app_data_dev.json'
 
-class ProductionConfig:
+class ProductionConfig(Config):
     """生产环境配置"""
     DEBUG = False
     TESTING = False
     DATA_FILE = 'app_data.json'
+    GROUP_COMMIT_WINDOW = 0.005
+    FILE_WATCH_INTERVAL = 5.0
 
-class TestingConfig:
+class TestingConfig(Config):
     """测试环境配置"""
     TESTING = True
     DEBUG = True
     DATA_FILE = 'app_data_test.json'
+    FILE_WATCH_INTERVAL = 0
+    COUNTER_RECONCILE_INTERVAL = 0
 
 class ConfigManager:
     """配置管理器"""
@@ -191,7 +218,8 @@ class ConfigManager:
         }
         
         config_class = configs.get(environment, DevelopmentConfig)
-        return {key: value for key, value in config_class.__dict__.items() 
+        # 包含从 Config 继承的共用配置项
+        return {key: getattr(config_class, key) for key in dir(config_class)
                 if not key.startswith('_')}
 
 class AppInitializer:
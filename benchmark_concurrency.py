@@ -0,0 +1,82 @@
+"""并发读写基准：写入进行时的读取吞吐量。
+
+用法：python benchmark_concurrency.py [秒数]（默认每组 2 秒）
+在含 20000 条学生记录的存储上，分别用 0/1/4 个写线程持续更新记录，
+4 个读线程同时反复执行按ID读取、按班级查找和分页查询，统计每秒完成的读操作数。
+读者每次读取都会核对记录的一致性（姓名与学号同时更新，必须始终匹配）。
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from models import QueryCondition, Student
+from repositories import StudentRepository
+from storage import DataStore
+
+
+RECORDS = 20000
+READERS = 4
+
+
+def build_table(data_file: str):
+    repo = StudentRepository(store=DataStore(data_file))
+    for i in range(1, RECORDS + 1):
+        repo.table.insert(Student(id=i, name=f'S{i}', gender='男', age=16, student_id=f'S{i}',
+                                  class_name=f'班级{i % 50}').to_dict())
+    return repo.table
+
+
+def run(table, writers: int, seconds: float):
+    """返回 (读操作数/秒, 写操作数/秒, 不一致的记录数)"""
+    stop = threading.Event()
+    reads = []
+    writes = []
+    torn = []
+
+    def reader(seed):
+        count = 0
+        n = seed
+        while not stop.is_set():
+            n = (n * 1103515245 + 12345) % RECORDS + 1
+            rows = [table.get(n)]
+            rows += table.find({'class_name': f'班级{n % 50}'}, limit=20)
+            rows += table.query([QueryCondition('age', 16)], order_by='student_id', limit=20, offset=n % 100)
+            torn.extend(row for row in rows if row['name'] != row['student_id'])
+            count += 3
+        reads.append(count)
+
+    def writer(seed):
+        count = 0
+        n = seed
+        while not stop.is_set():
+            n = (n * 1103515245 + 12345) % RECORDS + 1
+            code = f'S{n}-{count}'
+            table.update(n, {'name': code, 'student_id': code})
+            count += 1
+        writes.append(count)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(READERS)]
+    threads += [threading.Thread(target=writer, args=(100 + i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(reads) / seconds, sum(writes) / seconds, len(torn)
+
+
+def main(seconds: float):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        table = build_table(os.path.join(tmp_dir, 'app_data.json'))
+        print(f"{'writers':>8} {'reads/s':>10} {'writes/s':>10} {'torn':>6}")
+        for writers in (0, 1, 4):
+            read_rate, write_rate, torn = run(table, writers, seconds)
+            print(f"{writers:>8} {read_rate:>10.0f} {write_rate:>10.0f} {torn:>6}")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
@@ -0,0 +1,87 @@
+"""选课高峰基准：大量学生同时选课时的选课吞吐量和超额情况。
+
+用法：python benchmark_enrollment_rush.py [学生数]（默认 2000）
+20 门课程各 50 个名额，16 个线程代表同时提交的请求，每个学生依次尝试选 3 门课程。
+普通模式按选课服务原有流程加锁"检查容量 → 写入"，每次选课后保存一次（对应每个请求结束时写盘）；
+高峰模式原子占用名额，选课记录由后台批量写入。统计到全部记录写入为止的每秒选课数，
+并核对每门课程的选课人数是否超出容量。
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from enrollment_rush import EnrollmentRush
+from models import Course, Enrollment
+from repositories import EnrollmentRepository
+from storage import DataStore
+
+
+COURSES = 20
+CAPACITY = 50
+THREADS = 16
+CHOICES = 3
+
+
+def plain_enroll(repo, lock):
+    def enroll(student_id, course):
+        with lock:
+            if repo.get_enrollment(student_id, course.id):
+                return False
+            if repo.get_enrollment_count(course.id) >= course.capacity:
+                return False
+            repo.create(Enrollment(id=repo.get_next_id(), student_id=student_id, course_id=course.id))
+        repo.save_data()
+        return True
+    return enroll
+
+
+def run(data_file: str, students: int, rush: bool):
+    """返回 (成功选课数/秒, 成功选课数, 超额的课程数)"""
+    repo = EnrollmentRepository(store=DataStore(data_file))
+    courses = [Course(id=i, name=f'课程{i}', description='', credits=2, capacity=CAPACITY)
+               for i in range(1, COURSES + 1)]
+    if rush:
+        enroller = EnrollmentRush(repo)
+        enroll = lambda student_id, course: enroller.enroll(student_id, course)[0]
+    else:
+        enroll = plain_enroll(repo, threading.Lock())
+    succeeded = []
+
+    def worker(offset):
+        count = 0
+        for student_id in range(offset + 1, students + 1, THREADS):
+            for k in range(CHOICES):
+                count += enroll(student_id, courses[(student_id * 7 + k) % COURSES])
+        succeeded.append(count)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if rush:
+        enroller.drain()
+    elapsed = time.perf_counter() - start
+
+    reloaded = EnrollmentRepository(store=DataStore(data_file))
+    oversubscribed = sum(1 for course in courses if reloaded.get_enrollment_count(course.id) > course.capacity)
+    return sum(succeeded) / elapsed, sum(succeeded), oversubscribed
+
+
+def main(students: int):
+    print(f"{'mode':>8} {'enroll/s':>10} {'enrolled':>9} {'oversub':>8}")
+    for rush in (False, True):
+        # 屏蔽每次保存打印的日志
+        with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+            rate, enrolled, oversubscribed = run(os.path.join(tmp_dir, 'app_data.json'), students, rush)
+        print(f"{'rush' if rush else 'plain':>8} {rate:>10.0f} {enrolled:>9} {oversubscribed:>8}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,60 @@
+"""启动耗时基准：JSON快照与二进制快照的加载时间对比。
+
+用法：python benchmark_startup.py [记录数 ...]（默认 10000 100000 1000000）
+每个规模生成一张考勤表，分别只用JSON快照、以及JSON+二进制快照启动，
+计时范围为创建存储到第一次访问考勤表（加载快照并建立索引）。
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from models import Attendance
+from repositories import AttendanceRepository
+from storage import DataStore
+
+
+STATUSES = ['present', 'absent', 'leave']
+REASONS = ['学生自主签到', '', '请假（审批通过）: 生病']
+
+
+def build_data_file(data_file: str, count: int):
+    """生成含 count 条考勤记录的数据文件，同时写出二进制快照"""
+    store = DataStore(data_file)
+    store.binary_snapshot = True
+    repo = AttendanceRepository(store=store)
+    rng = random.Random(42)
+    for i in range(1, count + 1):
+        repo.table.insert(Attendance(
+            id=i,
+            student_id=rng.randint(1, 5000),
+            date=f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            status=rng.choice(STATUSES),
+            reason=rng.choice(REASONS),
+        ).to_dict())
+    store.save()
+
+
+def time_startup(data_file: str) -> float:
+    start = time.perf_counter()
+    repo = AttendanceRepository(store=DataStore(data_file))
+    repo.count()
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    print(f"{'records':>10} {'json (s)':>10} {'binary (s)':>11} {'speedup':>8}")
+    for count in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_file = os.path.join(tmp_dir, 'app_data.json')
+            build_data_file(data_file, count)
+            binary_time = time_startup(data_file)
+            os.remove(os.path.splitext(data_file)[0] + '.bin')
+            json_time = time_startup(data_file)
+        print(f"{count:>10} {json_time:>10.3f} {binary_time:>11.3f} {json_time / binary_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,154 @@
+# enrollment_lottery.py
+"""
+抽签选课模式
+
+先到先得的选课让全部请求集中在开放的那一秒。抽签模式下，选课开放期间学生只登记排好顺序的志愿，
+请求分散在整个开放期；关闭选课时一次性分配全部名额，全部选课记录在一个事务中写入。
+
+分配按志愿轮次进行：先满足全部学生的第一志愿，再满足第二志愿，以此类推，名额用完的课程跳过。
+每一轮中已分到课程较少的学生优先，同样多时按抽签顺序。抽签顺序只由种子决定，
+相同的志愿和种子总是得到相同的结果，便于复核。
+"""
+import random
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models import CoursePreference, Enrollment
+
+
+def draw(preferences: Iterable[Tuple[Any, Any, int]], seats: Dict[Any, Optional[int]],
+         seed: int) -> List[Tuple[Any, Any]]:
+    """按志愿轮次抽签分配名额
+
+    preferences 为 (学生ID, 课程ID, 志愿顺序)，seats 为 课程ID -> 剩余名额（None 表示不限，
+    不在其中的课程不分配），返回分配结果 [(学生ID, 课程ID)]。
+    """
+    choices: Dict[Any, List[Tuple[int, Any]]] = {}
+    for student_id, course_id, rank in preferences:
+        choices.setdefault(student_id, []).append((rank, course_id))
+    ranked = {student_id: [course_id for _, course_id in sorted(items)] for student_id, items in choices.items()}
+    # 先排序再洗牌，抽签顺序与志愿的读取顺序无关
+    order = sorted(ranked)
+    random.Random(seed).shuffle(order)
+
+    position = {student_id: index for index, student_id in enumerate(order)}
+    received = dict.fromkeys(order, 0)
+
+    remaining = dict(seats)
+    assigned = []
+    rounds = max((len(courses) for courses in ranked.values()), default=0)
+    for round_index in range(rounds):
+        for student_id in sorted(order, key=lambda s: (received[s], position[s])):
+            courses = ranked[student_id]
+            if round_index >= len(courses) or courses[round_index] not in remaining:
+                continue
+            course_id = courses[round_index]
+            left = remaining[course_id]
+            if left is None or left > 0:
+                assigned.append((student_id, course_id))
+                received[student_id] += 1
+                if left is not None:
+                    remaining[course_id] = left - 1
+    return assigned
+
+
+class EnrollmentLottery:
+    """抽签选课：开放期间登记志愿，关闭时 allocate() 统一分配
+
+    max_choices 为每个学生最多登记的志愿数，0 表示不限。
+    """
+
+    def __init__(self, preference_repo, enrollment_repo, course_repo, status_repo, max_choices: int = 5):
+        self.preference_repo = preference_repo
+        self.enrollment_repo = enrollment_repo
+        self.course_repo = course_repo
+        self.status_repo = status_repo
+        self.max_choices = max_choices
+        # 串行执行同一进程内的"检查志愿 → 登记"，保证志愿顺序连续
+        self._lock = threading.Lock()
+
+    def submit(self, student_id: int, course) -> Tuple[bool, Optional[Enrollment], str]:
+        """登记志愿，排在该学生已有志愿之后（学生、课程和选课开放状态由调用方检查）"""
+        with self._lock:
+            if self.enrollment_repo.get_enrollment(student_id, course.id):
+                return False, None, '该学生已经选修此课程'
+            existing = self.preference_repo.get_by_student_id(student_id)
+            if any(p.course_id == course.id for p in existing):
+                return False, None, '已登记该课程的志愿'
+            if self.max_choices and len(existing) >= self.max_choices:
+                return False, None, f'最多登记 {self.max_choices} 个志愿'
+            rank = len(existing) + 1
+            self.preference_repo.create(CoursePreference(
+                id=self.preference_repo.get_next_id(),
+                student_id=student_id,
+                course_id=course.id,
+                rank=rank
+            ))
+        return True, None, f'已登记为第 {rank} 志愿，选课关闭后统一抽签分配'
+
+    def withdraw(self, student_id: int, course_id: int) -> Tuple[bool, str]:
+        """撤回志愿，排在其后的志愿依次提前"""
+        with self._lock:
+            preferences = self.preference_repo.get_by_student_id(student_id)
+            target = next((p for p in preferences if p.course_id == course_id), None)
+            if target is None:
+                return False, '未登记该课程的志愿'
+            try:
+                with self.preference_repo.store.transaction():
+                    self.preference_repo.delete(target.id)
+                    for preference in preferences:
+                        if preference.rank > target.rank:
+                            self.preference_repo.update(preference.id, rank=preference.rank - 1)
+            except BaseException:
+                self.preference_repo._invalidate()
+                raise
+        return True, '已撤回志愿'
+
+    def rank_of(self, student_id: int, course_id: int) -> Optional[int]:
+        """学生对课程的志愿顺序，未登记时为 None"""
+        preference = self.preference_repo.get_preference(student_id, course_id)
+        return preference.rank if preference else None
+
+    def open_window(self) -> int:
+        """开放选课时生成并记录本次的抽签种子"""
+        seed = random.SystemRandom().randrange(2 ** 32)
+        self.status_repo.get_enrollment_status()
+        self.status_repo.update(1, lottery_seed=seed)
+        self.status_repo.save_data()
+        return seed
+
+    def allocate(self) -> List[Enrollment]:
+        """按登记的志愿分配全部名额，一次写入全部选课记录并清空志愿，返回创建的选课记录"""
+        status = self.status_repo.get_enrollment_status()
+        seed = status.lottery_seed
+        if seed is None:
+            seed = self.open_window()
+
+        store = self.enrollment_repo.store
+        try:
+            # 分配与写入在同一个事务中，期间不会有新的志愿或选课记录插入
+            with store.transaction():
+                preferences = [p for p in self.preference_repo.get_all()
+                               if not self.enrollment_repo.get_enrollment(p.student_id, p.course_id)]
+                seats: Dict[Any, Optional[int]] = {}
+                for course_id in {p.course_id for p in preferences}:
+                    course = self.course_repo.get_by_id(course_id)
+                    if course is None:
+                        continue
+                    seats[course_id] = None if course.capacity is None else \
+                        max(course.capacity - self.enrollment_repo.get_enrollment_count(course_id), 0)
+                assigned = draw(((p.student_id, p.course_id, p.rank) for p in preferences), seats, seed)
+
+                ids = self.enrollment_repo.reserve_ids(len(assigned))
+                enrollments = [Enrollment(id=enrollment_id, student_id=student_id, course_id=course_id)
+                               for enrollment_id, (student_id, course_id) in zip(ids, assigned)]
+                for enrollment in enrollments:
+                    self.enrollment_repo.create(enrollment)
+                self.preference_repo.delete_all()
+        except BaseException:
+            # 回滚后标识映射中可能缓存了未提交的模型
+            self.enrollment_repo._invalidate()
+            self.preference_repo._invalidate()
+            raise
+        print(f"✅ 按志愿抽签分配了 {len(enrollments)} 个名额（{len(preferences)} 个志愿，种子 {seed}）")
+        return enrollments
@@ -0,0 +1,211 @@
+# enrollment_rush.py
+"""
+选课高峰模式
+
+选课开放的瞬间大量学生同时提交选课，逐条"统计人数 → 比较容量 → 写入"既会在并发下超出容量，
+又让每次选课都等待一次保存。高峰模式下：
+名额由按课程的原子计数分配，比较剩余名额和占用名额在同一把锁内完成，不会超出容量；
+占到名额的选课记录放入写后队列，由后台线程按批在一个事务中写入，每批只保存一次，写入失败时退还名额。
+占到名额时选课记录尚未保存，页面显示为"待确认"；写入失败的选课标记为失败，学生重新提交即可。
+名额计数只在本进程内有效，多进程共享数据文件时不启用，适合在选课开放期间临时开启。
+"""
+import atexit
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from models import Enrollment
+
+
+class SeatCounters:
+    """按课程的名额计数
+
+    剩余名额 = 容量 - 已写入的选课人数（物化计数）- 已占用尚未写入的名额。
+    已写入人数随选课表的变更事件更新（退课、删除学生或课程时同样减少），
+    占用的名额在记录写入、计数更新之后才交还，期间同一名额至多被计算两次，只会偏少不会超额。
+    """
+
+    def __init__(self, counts):
+        self.counts = counts
+        # 课程ID -> 已占用尚未写入的名额
+        self._held: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+
+    def take(self, course_id: Any, capacity: Optional[int]) -> bool:
+        """有剩余名额时占用一个并返回 True（比较并递减，capacity 为空表示不限）"""
+        with self._lock:
+            held = self._held.get(course_id, 0)
+            if capacity is not None and self.counts.get(course_id) + held >= capacity:
+                return False
+            self._held[course_id] = held + 1
+            return True
+
+    def give_back(self, course_id: Any):
+        """交还一个占用的名额（记录已写入或写入失败）"""
+        with self._lock:
+            held = self._held.get(course_id, 0) - 1
+            if held > 0:
+                self._held[course_id] = held
+            else:
+                self._held.pop(course_id, None)
+
+    def held(self, course_id: Any) -> int:
+        """已占用尚未写入的名额"""
+        return self._held.get(course_id, 0)
+
+    def remaining(self, course_id: Any, capacity: Optional[int]) -> Optional[int]:
+        """剩余名额，不限容量时为 None"""
+        if capacity is None:
+            return None
+        with self._lock:
+            return max(capacity - self.counts.get(course_id) - self._held.get(course_id, 0), 0)
+
+
+class EnrollmentRush:
+    """高峰模式的选课：占用名额后把选课记录交给写后队列，立即返回
+
+    同一学生对同一课程的重复提交在排队期间同样会被拒绝。state() 给出尚未确认的选课状态：
+    排队中为 'pending'，写入失败为 'failed'（直到重新提交）。drain() 等待队列中的记录全部写入
+    （关闭选课、进程退出时调用）。
+    """
+
+    def __init__(self, enrollment_repo, batch_size: int = 200, batch_window: float = 0.005):
+        self.repo = enrollment_repo
+        self.seats = SeatCounters(enrollment_repo.counts)
+        # 每批最多写入的记录数，以及收到第一条记录后等待凑批的时间（秒）
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._queue: queue.Queue = queue.Queue()
+        # 已排队尚未写入的 (学生ID, 课程ID)
+        self._pending: Set[Tuple[Any, Any]] = set()
+        # 写入失败的 (学生ID, 课程ID) -> 错误信息
+        self._failures: Dict[Tuple[Any, Any], str] = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self.written = 0
+        self.failed = 0
+
+    def enroll(self, student_id: int, course) -> Tuple[bool, Optional[Enrollment], str]:
+        """为学生占用课程名额并排队写入（学生、课程和选课开放状态由调用方检查）"""
+        key = (student_id, course.id)
+        with self._lock:
+            if key in self._pending:
+                return False, None, '该学生已经选修此课程'
+            self._pending.add(key)
+            self._failures.pop(key, None)
+        queued = False
+        try:
+            if self.repo.get_enrollment(student_id, course.id):
+                return False, None, '该学生已经选修此课程'
+            if not self.seats.take(course.id, course.capacity):
+                return False, None, '课程已满，无法选课'
+            try:
+                enrollment = Enrollment(
+                    id=self.repo.get_next_id(),
+                    student_id=student_id,
+                    course_id=course.id,
+                    exam_score=None,
+                    performance_score=None
+                )
+                self._start()
+                self._queue.put(enrollment)
+            except BaseException:
+                self.seats.give_back(course.id)
+                raise
+            queued = True
+            return True, enrollment, '已占到名额，选课记录正在保存，请稍后刷新确认'
+        finally:
+            if not queued:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def is_pending(self, student_id: int, course_id: int) -> bool:
+        """选课记录是否已排队尚未写入"""
+        return (student_id, course_id) in self._pending
+
+    def state(self, student_id: int, course_id: int) -> Optional[str]:
+        """尚未确认的选课状态：'pending' 排队待写入，'failed' 写入失败，其他情况为 None"""
+        key = (student_id, course_id)
+        if key in self._pending:
+            return 'pending'
+        return 'failed' if key in self._failures else None
+
+    def held(self, course_id: int) -> int:
+        """课程已占用尚未写入的名额"""
+        return self.seats.held(course_id)
+
+    def drain(self):
+        """等待已排队的选课记录全部写入"""
+        self._queue.join()
+
+    def _start(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='enrollment-writer', daemon=True)
+                self._writer.start()
+                # 进程正常退出前写完队列中的记录
+                atexit.register(self.drain)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"❌ 写入选课记录时发生错误: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Enrollment]):
+        """一个事务写入整批记录；失败时逐条重试，仍失败的退还名额"""
+        try:
+            self._commit(batch)
+            failed = []
+        except Exception as e:
+            print(f"⚠️ 批量写入 {len(batch)} 条选课记录失败，改为逐条写入: {e}")
+            failed = []
+            for enrollment in batch:
+                try:
+                    self._commit([enrollment])
+                except Exception as e:
+                    print(f"❌ 写入选课记录 {enrollment.id} 失败，已退还名额: {e}")
+                    failed.append((enrollment, str(e)))
+        # 记录已写入、物化计数已更新（同步订阅在提交后立即执行），再交还占用的名额
+        for enrollment in batch:
+            self.seats.give_back(enrollment.course_id)
+        with self._lock:
+            for enrollment in batch:
+                self._pending.discard((enrollment.student_id, enrollment.course_id))
+            # 学生已收到占到名额的提示，失败的选课保留标记，页面据此提示重新选课
+            for enrollment, error in failed:
+                self._failures[(enrollment.student_id, enrollment.course_id)] = error
+            self.written += len(batch) - len(failed)
+            self.failed += len(failed)
+
+    def _commit(self, batch: List[Enrollment]):
+        store = self.repo.store
+        try:
+            with store.transaction():
+                for enrollment in batch:
+                    self.repo.create(enrollment)
+        except BaseException:
+            # 回滚后标识映射中可能缓存了未提交的模型
+            self.repo._invalidate()
+            raise
+        # 事务提交时的保存不返回结果，这里确认记录已写盘（已写入时不会再次写盘）
+        if not store.save():
+            # 没能写盘：撤销这批记录，按写入失败处理，由调用方退还名额
+            with store.transaction():
+                for enrollment in batch:
+                    self.repo.delete(enrollment.id)
+            raise IOError('选课记录保存失败')
@@ -0,0 +1,134 @@
+# events.py
+"""
+进程内的数据变更事件（变更数据捕获）
+
+仓储在创建、更新、删除记录后向事件总线发布 ChangeEvent，
+缓存、增量统计、搜索索引等订阅所关心的表，按变更增量维护，而不必重新扫描整张表。
+事务中的变更在提交后才发布，回滚时丢弃。
+多进程共享存储时只能收到本进程的变更。
+"""
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+@dataclass(frozen=True, slots=True)
+class ChangeEvent:
+    """一条记录的变更
+
+    op 为 insert / update / delete；before、after 为变更前后的记录字典，不存在时为 None；
+    source 为写入的数据存储，进程中有多个存储时订阅者据此区分。
+    同一事件会交给所有订阅者，处理时不要修改其中的字典。
+    """
+    table: str
+    op: str
+    id: Any
+    before: Optional[Dict[str, Any]] = None
+    after: Optional[Dict[str, Any]] = None
+    source: Any = field(default=None, compare=False, repr=False)
+
+
+# 通知队列订阅者的后台线程退出
+_STOP = object()
+
+
+class Subscription:
+    """事件订阅：tables 为空时订阅全部表
+
+    同步订阅在发布事件的线程中依次调用；队列订阅（queued）把事件放入自己的队列，
+    由独立的后台线程按发布顺序处理，不拖慢写入。处理函数抛出的异常只打印，不影响写入和其他订阅者。
+    """
+
+    def __init__(self, bus: 'EventBus', handler: Callable[[ChangeEvent], None],
+                 tables: Optional[Iterable[str]] = None, queued: bool = False):
+        self.bus = bus
+        self.handler = handler
+        self.tables = frozenset(tables) if tables is not None else None
+        self._queue: Optional[queue.Queue] = None
+        if queued:
+            self._queue = queue.Queue()
+            name = f'events-{getattr(handler, "__name__", "handler")}'
+            threading.Thread(target=self._run, name=name, daemon=True).start()
+
+    def accepts(self, table: str) -> bool:
+        return self.tables is None or table in self.tables
+
+    def deliver(self, event: ChangeEvent):
+        if self._queue is not None:
+            self._queue.put(event)
+        else:
+            self._call(event)
+
+    def _call(self, event: ChangeEvent):
+        try:
+            self.handler(event)
+        except Exception as e:
+            print(f"❌ 处理变更事件 {event.table}/{event.op}/{event.id} 时发生错误: {e}")
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            try:
+                if event is _STOP:
+                    return
+                self._call(event)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """等待队列中已发布的事件处理完（同步订阅立即返回）"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def cancel(self):
+        """取消订阅，队列中已有的事件仍会处理完"""
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """进程内的事件总线
+
+    订阅列表写时复制：发布时不加锁，没有订阅者的表不需要准备事件（见 wants）。
+    """
+
+    def __init__(self):
+        self._subscriptions: tuple = ()
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: Callable[[ChangeEvent], None], tables: Optional[Iterable[str]] = None,
+                  queued: bool = False) -> Subscription:
+        """订阅变更事件，返回的订阅对象可以 cancel()"""
+        subscription = Subscription(self, handler, tables, queued)
+        with self._lock:
+            self._subscriptions += (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+        if subscription._queue is not None:
+            subscription._queue.put(_STOP)
+
+    def wants(self, table: str) -> bool:
+        """是否有订阅者关心该表的变更"""
+        return any(s.accepts(table) for s in self._subscriptions)
+
+    def publish(self, events: Iterable[ChangeEvent]):
+        """按顺序把事件交给订阅了对应表的订阅者"""
+        subscriptions = self._subscriptions
+        for event in events:
+            for subscription in subscriptions:
+                if subscription.accepts(event.table):
+                    subscription.deliver(event)
+
+    def join(self):
+        """等待所有队列订阅处理完已发布的事件"""
+        for subscription in self._subscriptions:
+            subscription.join()
+
+
+# 全部仓储默认共用的事件总线
+bus = EventBus()
@@ -1,6 +1,15 @@
-"""Locust 测试脚本：模拟登录 + 核心查询场景。"""
+"""Locust 测试脚本：模拟登录 + 核心查询场景，以及选课高峰场景（RushUser）。"""
 
-from locust import HttpUser, task, between
+import collections
+import itertools
+import os
+import random
+import re
+import time
+
+import requests
+from locust import HttpUser, task, between, events
+from locust.exception import StopUser
 
 
 # 预置可用账号（teacher/admin），密码与存量 hash 匹配，避免登录失败
@@ -51,4 +60,96 @@ class WebsiteUser(HttpUser):
     @task(1)
     def list_notices(self):
         """浏览通知列表（部分页面重用首页数据）。"""
-        self.client.get("/notices", name="notices:list")
\ No newline at end of file
+        self.client.get("/notices", name="notices:list")
+
+# ---- 选课高峰场景 ----
+# 用法：locust -f locustfile.py RushUser --host http://127.0.0.1:5000 --users 500 --spawn-rate 500
+# 压测前由管理员开放选课。RUSH_USERS 指向学生账号文件（每行"用户名,密码"，每个虚拟用户一个账号），
+# RUSH_COURSES 为争抢的课程ID（逗号分隔），RUSH_TARGET 为目标每秒选课数，RUSH_ADMIN 为"用户名,密码"。
+# 开始和结束时以管理员身份读取课程列表中的"已选 / 容量"：任何课程超出容量、已选人数的增量与
+# 成功响应数不一致（记录丢失）或未达到目标速率时，locust 以非零状态退出。仅统计单进程 locust 的结果。
+
+RUSH_COURSES = [int(c) for c in os.environ.get("RUSH_COURSES", "1,2,3").split(",") if c.strip()]
+RUSH_TARGET = float(os.environ.get("RUSH_TARGET", "200"))
+RUSH_ADMIN = os.environ.get("RUSH_ADMIN", "admin,adminpass").split(",", 1)
+
+
+def _load_rush_users():
+    path = os.environ.get("RUSH_USERS")
+    if not path:
+        return [{"username": "student", "password": "studentpass"}]
+    with open(path, encoding="utf-8") as f:
+        pairs = [line.strip().split(",", 1) for line in f if line.strip()]
+    return [{"username": name, "password": password} for name, password in pairs]
+
+
+RUSH_POOL = _load_rush_users()
+_rush_accounts = itertools.count()
+_rush = {"enrolled": collections.Counter(), "first": None, "last": None, "before": {}, "failed": False}
+
+
+def _course_counts(host):
+    """以管理员身份读取课程列表，返回 课程ID -> (已选人数, 容量)"""
+    session = requests.Session()
+    session.post(f"{host}/login", data={"username": RUSH_ADMIN[0], "password": RUSH_ADMIN[1]})
+    html = session.get(f"{host}/courses").text
+    rows = re.findall(r"(\d+) / (\d+)\s*<div class=\"progress[\s\S]*?editCourseModal(\d+)", html)
+    return {int(course_id): (int(enrolled), int(capacity)) for enrolled, capacity, course_id in rows}
+
+
+class RushUser(HttpUser):
+    """选课开放瞬间的争抢：每个学生依次尝试选修 RUSH_COURSES 中的课程，全部尝试后退出"""
+    wait_time = between(0, 0.05)
+
+    def on_start(self) -> None:
+        creds = RUSH_POOL[next(_rush_accounts) % len(RUSH_POOL)]
+        self.client.post("/login", data=creds, name="login")
+        self.courses = random.sample(RUSH_COURSES, len(RUSH_COURSES))
+
+    @task
+    def enroll(self):
+        """提交选课并按提示区分成功、已满和重复选课。"""
+        if not self.courses:
+            raise StopUser()
+        course_id = self.courses.pop()
+        with self.client.post(f"/course/{course_id}/enroll", name="course:enroll", catch_response=True) as resp:
+            if "选课成功" in resp.text or "已占到名额" in resp.text:
+                now = time.time()
+                _rush["enrolled"][course_id] += 1
+                _rush["first"] = _rush["first"] or now
+                _rush["last"] = now
+            elif "课程已满" not in resp.text and "已经选修" not in resp.text:
+                resp.failure(f"enroll failed: status {resp.status_code}")
+
+
+@events.test_start.add_listener
+def rush_start(environment, **kwargs):
+    if RushUser in environment.user_classes:
+        _rush["before"] = _course_counts(environment.host)
+
+
+@events.test_stop.add_listener
+def rush_check(environment, **kwargs):
+    if RushUser not in environment.user_classes:
+        return
+    # 等待写后队列把最后一批选课记录写入
+    time.sleep(1)
+    after = _course_counts(environment.host)
+    for course_id in RUSH_COURSES:
+        enrolled, capacity = after.get(course_id, (0, 0))
+        added = enrolled - _rush["before"].get(course_id, (0, 0))[0]
+        print(f"课程 {course_id}: 已选 {enrolled} / 容量 {capacity}，本次成功 {_rush['enrolled'][course_id]}，新增记录 {added}")
+        if enrolled > capacity or added != _rush["enrolled"][course_id]:
+            _rush["failed"] = True
+    total = sum(_rush["enrolled"].values())
+    elapsed = (_rush["last"] - _rush["first"]) if total > 1 else 0
+    rate = total / elapsed if elapsed else 0
+    print(f"成功选课 {total} 次，{rate:.0f} 次/秒（目标 {RUSH_TARGET:.0f} 次/秒）")
+    if rate < RUSH_TARGET:
+        _rush["failed"] = True
+
+
+@events.quitting.add_listener
+def rush_exit_code(environment, **kwargs):
+    if _rush["failed"]:
+        environment.process_exit_code = 1
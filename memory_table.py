@@ -0,0 +1,1008 @@
+# memory_table.py
+"""
+内存数据表
+
+MemoryTable 保存一张表的全部记录，维护主键位置、哈希索引、有序索引和搜索倒排索引，
+并根据索引为查询选择访问路径；CompactRow 是记录数很大的表使用的紧凑记录。
+数据表由 DataStore 创建和持久化（见 storage.py），按月分区的表见 partitions.py。
+"""
+import functools
+import gc
+import heapq
+import itertools
+import keyword
+import sys
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from operator import attrgetter, itemgetter
+from typing import Callable, Dict, Any, List, Optional, Sequence
+
+
+
+@contextmanager
+def _gc_paused():
+    """批量加载记录时暂停循环垃圾回收
+
+    记录之间没有循环引用，加载百万条记录时反复触发的回收只会白白扫描，拖慢数倍。
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class IdBlock:
+    """已预留的一段连续ID [start, stop)，take() 不加锁地依次取出，用完后返回 None
+
+    itertools.count 的 next() 由解释器一次完成，多个线程同时取号也不会重复。
+    """
+
+    __slots__ = ('_counter', 'start', 'stop')
+
+    def __init__(self, start: int = 0, stop: int = 0):
+        self._counter = itertools.count(start)
+        self.start = start
+        self.stop = stop
+
+    def take(self) -> Optional[int]:
+        item_id = next(self._counter)
+        return item_id if item_id < self.stop else None
+
+
+
+# 不超过该长度的字符串取值会被驻留（状态、日期、班级等大量重复的短字符串）
+INTERN_MAX_LENGTH = 64
+
+
+def _intern(value: Any) -> Any:
+    if value.__class__ is str and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def _field_reader(fields: tuple) -> Callable[[Any], Any]:
+    """按字段读取记录（字典或 CompactRow）：单字段返回取值，多字段返回取值元组，缺失字段为 None"""
+    by_key = itemgetter(*fields)
+    by_attr = attrgetter(*fields)
+    single = len(fields) == 1
+
+    def read(item):
+        try:
+            return by_key(item) if item.__class__ is dict else by_attr(item)
+        except (KeyError, AttributeError):
+            if single:
+                return item.get(fields[0])
+            return tuple(item.get(field) for field in fields)
+
+    return read
+
+
+_read_id = _field_reader(('id',))
+
+
+def _in_range(value: Any, lo: Any, hi: Any) -> bool:
+    return value is not None and (lo is None or value >= lo) and (hi is None or value <= hi)
+
+
+def _range_bounds(conditions: Sequence[Any]) -> tuple:
+    """比较条件的取值范围 (lo, hi)，按闭区间取最紧的边界，严格比较交由条件本身再核对"""
+    lows = [c.value for c in conditions if c.operator in ('gt', 'ge')]
+    highs = [c.value for c in conditions if c.operator in ('lt', 'le')]
+    return (max(lows) if lows else None), (min(highs) if highs else None)
+
+
+def _sorted_by(items: list, field: str, descending: bool = False) -> list:
+    """按字段排序，取值为空的记录始终排在最后，取值相同时保持原有顺序"""
+    present = [item for item in items if item.get(field) is not None]
+    missing = [item for item in items if item.get(field) is None]
+    return sorted(present, key=lambda item: item.get(field), reverse=descending) + missing
+
+
+class _Keyset:
+    """键集分页的游标条件：按 (排序字段, id) 排在游标之后的记录
+
+    排序字段为空的记录排在最后，同一取值内按 id 升序（降序排列时同样如此）。
+    """
+
+    def __init__(self, field: str, after: tuple, descending: bool = False):
+        self.field = field
+        self.value, self.item_id = after
+        self.descending = descending
+
+    def matches(self, item: Any) -> bool:
+        value = item.get(self.field)
+        if self.value is None:
+            return value is None and _read_id(item) > self.item_id
+        if value is None:
+            return True
+        if value == self.value:
+            return _read_id(item) > self.item_id
+        return value < self.value if self.descending else value > self.value
+
+    def __repr__(self):
+        return f'({self.field}, id) after ({self.value!r}, {self.item_id!r})'
+
+
+def _search_text(value: Any) -> str:
+    return str(value or '').lower()
+
+
+def _grams(text: str) -> set:
+    """文本的二元组集合（按字符切分，适合中文姓名），单个字符的文本以自身作为唯一分片"""
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _search_rank(item: Any, fields: Sequence[str], keyword: str) -> Optional[tuple]:
+    """记录对关键字（已转小写）的匹配等级，不匹配时返回 None
+
+    等级为 (匹配方式, 字段序号)：完全相等 0、前缀 1、包含 2，取各字段中最好的一个，
+    越小越靠前；字段按声明顺序，靠前的字段权重更高。
+    """
+    best = None
+    for i, field in enumerate(fields):
+        text = _search_text(item.get(field))
+        if keyword in text:
+            rank = (0 if text == keyword else 1 if text.startswith(keyword) else 2, i)
+            if best is None or rank < best:
+                best = rank
+    return best
+
+
+class CompactRow:
+    """紧凑记录：用 slots 按字段保存取值，对外提供与字典相同的读取接口
+
+    每条记录一个 dict 的开销在百万级的表（如考勤）上非常可观。
+    字段组合相同的记录共用一个动态生成的 slots 子类，实例只保存各字段的引用；
+    短字符串取值统一驻留，重复的状态、日期在内存中只有一份。
+    """
+
+    __slots__ = ()
+    _fields: tuple = ()
+    _field_set: frozenset = frozenset()
+    # 字段元组 -> 生成的记录类
+    _classes: Dict[tuple, type] = {}
+
+    @classmethod
+    def row_class(cls, fields: tuple) -> Optional[type]:
+        """获取字段组合对应的记录类；字段名不能用作属性名时返回 None"""
+        row_class = cls._classes.get(fields)
+        if row_class is None:
+            if not all(isinstance(field, str) and field.isidentifier() and not keyword.iskeyword(field)
+                       and not hasattr(cls, field) for field in fields):
+                return None
+            # 与 dataclass 一样生成按位置赋值的 __init__，比逐个 setattr 快得多
+            source = f"def __init__(self, {', '.join(fields)}):\n"
+            source += ''.join(f"    self.{field} = {field}\n" for field in fields) or "    pass\n"
+            namespace: Dict[str, Any] = {}
+            exec(source, namespace)
+            row_class = type('CompactRow', (cls,), {
+                '__slots__': fields,
+                '__init__': namespace['__init__'],
+                '_fields': fields,
+                '_field_set': frozenset(fields),
+            })
+            row_class = cls._classes.setdefault(fields, row_class)
+        return row_class
+
+    @classmethod
+    def pack(cls, item: Dict[str, Any]):
+        """把字典转换为紧凑记录；无法转换时原样返回字典"""
+        row_class = cls.row_class(tuple(item))
+        if row_class is None:
+            return item
+        intern = sys.intern
+        return row_class(*[intern(value) if value.__class__ is str and len(value) <= INTERN_MAX_LENGTH else value
+                           for value in item.values()])
+
+    def has_fields(self, fields) -> bool:
+        return self._field_set.issuperset(fields)
+
+    def update(self, values: Dict[str, Any]):
+        """更新已有字段的取值（新增字段需由数据表重新打包）"""
+        for field, value in values.items():
+            setattr(self, field, _intern(value))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._field_set:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._field_set:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._field_set
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (CompactRow, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def keys(self):
+        return self._fields
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, field) for field in self._fields)
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self._fields]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self._fields}
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+def _binary_rows(items: list) -> list:
+    """转换为二进制快照中的记录列表
+
+    紧凑记录保存为 (字段元组, 取值元组)，加载时直接构造 CompactRow，不经过字典；
+    marshal 对同一对象只写一次，共享的字段元组和驻留字符串加载后仍然共享。
+    """
+    return [(item._fields, item.values()) if isinstance(item, CompactRow) else item
+            for item in items if item is not None]
+
+
+def _restore_rows(items: list) -> list:
+    """把二进制快照中的记录还原为字典或 CompactRow"""
+    rows = []
+    append = rows.append
+    fields = row_class = None
+    for item in items:
+        if item.__class__ is tuple:
+            # 同一字段组合的元组在加载后是同一个对象，按身份比较即可
+            if item[0] is not fields:
+                fields = item[0]
+                row_class = CompactRow.row_class(fields)
+            append(row_class(*item[1]))
+        else:
+            append(item)
+    return rows
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, CompactRow):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _reading(method):
+    """数据表的读操作：在存储的读锁内执行，首次访问时先加载记录"""
+    @functools.wraps(method)
+    def read(self, *args, **kwargs):
+        lock = self.store.lock
+        lock.acquire_read()
+        try:
+            if not self._loaded:
+                self._load()
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return read
+
+
+class MemoryTable:
+    """内存数据表，为仓储提供按字典记录操作的统一接口
+
+    与 SqliteTable 接口一致，仓储不关心底层是哪种存储。
+    维护 id -> 列表位置 的主键索引，按ID查找、更新、删除均为 O(1)；
+    删除时把对应位置置为墓碑(None)而不是重建列表，墓碑过多或写快照前再统一清理。
+    仓储声明的字段（或组合字段）会建立哈希二级索引，find 自动选用覆盖字段最多的索引，
+    二级索引在第一次被查询用到时才建立。
+    有序索引在单字段哈希索引之外再维护一份排好序的不同取值列表，范围查询二分定位边界后
+    只访问范围内的取值桶，代价为 O(log n + k)。
+    搜索字段维护二元组倒排索引（分片 -> ID），子串搜索先求关键字各分片的ID交集，
+    再对少量候选记录核对子串并排序，无需逐条转换全表文本。
+    query 按 QueryCondition 列表执行查询，由 _plan 在上述索引中选择访问路径。
+    紧凑表(compact)中的记录为 CompactRow，读取接口与字典相同。
+    读操作持有存储的读锁，写操作持有写锁；记录对象写入后不再修改，更新时整条替换。
+    next_id 从预留的ID段中无锁取号，每 ID_BLOCK 个ID才加一次写锁、记录一次新的 next_id。
+    记录在首次读写时才加载。
+    """
+
+    # 墓碑数量超过有效记录的该比例（且超过最小数量）时清理
+    VACUUM_RATIO = 0.25
+    VACUUM_MIN = 64
+    # 可以使用有序索引的比较运算
+    RANGE_OPERATORS = ('gt', 'lt', 'ge', 'le')
+    # 每次预留的ID数量
+    ID_BLOCK = 32
+
+    def __init__(self, store: 'DataStore', name: str):
+        self.store = store
+        self.name = name
+        self.compact = False
+        # 已建立的二级索引：字段元组 -> {键: {id: None}}，单字段索引的键为字段值，组合索引为取值元组
+        self._indexes: Dict[tuple, Dict[Any, Dict[Any, None]]] = {}
+        # 声明的索引字段 -> 读取索引键的函数
+        self._readers: Dict[tuple, Callable[[Any], Any]] = {}
+        # 声明了有序索引的字段元组，及已建立的有序取值列表（不含 None）
+        self._ordered = set()
+        self._sorted_keys: Dict[tuple, list] = {}
+        # 声明的搜索字段，及已建立的倒排索引：字段 -> {二元组: {id: None}}
+        self._search_fields = set()
+        self._gram_indexes: Dict[str, Dict[str, Dict[Any, None]]] = {}
+        # 已预留、尚未分配完的ID段；分区表的ID由所属的基础表统一分配
+        self._ids = IdBlock()
+        self.id_table = self
+        self._loaded = False
+
+    def _load(self):
+        """首次访问时加载记录、建立主键索引并同步 next_id"""
+        with self.store.lock.read(), self.store._load_lock:
+            if self._loaded:
+                return
+            with _gc_paused():
+                self._load_rows()
+            self._sync_next_id()
+            self._loaded = True
+
+    def _load_rows(self):
+        """按表是否紧凑转换记录，并建立主键索引"""
+        items = self._items()
+        if self.compact:
+            items[:] = [CompactRow.pack(item) if item.__class__ is dict else item for item in items]
+        elif any(isinstance(item, CompactRow) for item in items):
+            # 二进制快照中按紧凑记录保存，但当前表不再使用紧凑记录
+            items[:] = [item.to_dict() if isinstance(item, CompactRow) else item for item in items]
+        self._reindex()
+
+    def _items(self) -> list:
+        return self.store._rows(self.name)
+
+    def _reindex(self):
+        """重建主键索引（二级索引只记录ID，与位置无关，不需要重建）"""
+        items = self._items()
+        self._positions = {_read_id(item): i for i, item in enumerate(items) if item is not None}
+        self._tombstones = len(items) - len(self._positions)
+
+    def make_compact(self):
+        """把表中记录转换为紧凑记录，之后插入的记录同样转换"""
+        with self.store.lock:
+            if self.compact:
+                return
+            self.compact = True
+            if self._loaded:
+                items = self._items()
+                # 整体替换列表内容，位置不变，主键索引和二级索引无需重建
+                items[:] = [CompactRow.pack(item) if item.__class__ is dict else item for item in items]
+
+    def _pack(self, item: Dict[str, Any]):
+        return CompactRow.pack(item) if self.compact else item
+
+    def ensure_indexes(self, indexes: Sequence[Any]):
+        """声明字段（或组合字段）上的哈希索引，查询用到时再建立"""
+        with self.store.lock:
+            for index in indexes:
+                fields = (index,) if isinstance(index, str) else tuple(index)
+                if fields not in self._readers:
+                    self._readers[fields] = _field_reader(fields)
+
+    def ensure_range_indexes(self, fields: Sequence[str]):
+        """声明字段上的有序索引（基于同字段的哈希索引），查询用到时再建立"""
+        with self.store.lock:
+            for field in fields:
+                self.ensure_indexes([field])
+                self._ordered.add((field,))
+
+    def ensure_search_indexes(self, fields: Sequence[str]):
+        """声明字段上的二元组倒排索引，第一次搜索时再建立"""
+        with self.store.lock:
+            self._search_fields.update(fields)
+
+    def _index(self, fields: tuple) -> Dict[Any, Dict[Any, None]]:
+        """获取二级索引，尚未建立时在加载锁内建立（调用方需持有读锁或写锁）"""
+        buckets = self._indexes.get(fields)
+        if buckets is None:
+            with self.store._load_lock:
+                if fields not in self._indexes:
+                    self._build_index(fields)
+                buckets = self._indexes[fields]
+        return buckets
+
+    def _build_index(self, fields: tuple):
+        buckets = self._buckets(fields, self._items(), self._positions)
+        if fields in self._ordered:
+            # 先就绪有序列表，看到索引时有序列表一定已存在
+            self._sorted_keys[fields] = sorted(key for key in buckets if key is not None)
+        self._indexes[fields] = buckets
+
+    def _buckets(self, fields: tuple, items: list, positions: Dict[Any, int]) -> Dict[Any, Dict[Any, None]]:
+        buckets: Dict[Any, Dict[Any, None]] = {}
+        read = self._readers[fields]
+        for item_id, pos in positions.items():
+            key = read(items[pos])
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = bucket = {}
+            bucket[item_id] = None
+        return buckets
+
+    def _gram_index(self, field: str) -> Dict[str, Dict[Any, None]]:
+        """获取字段的倒排索引，尚未建立时在加载锁内建立（调用方需持有读锁或写锁）"""
+        postings = self._gram_indexes.get(field)
+        if postings is None:
+            with self.store._load_lock:
+                if field not in self._gram_indexes:
+                    self._gram_indexes[field] = self._postings(field, self._items(), self._positions)
+                postings = self._gram_indexes[field]
+        return postings
+
+    @staticmethod
+    def _postings(field: str, items: list, positions: Dict[Any, int]) -> Dict[str, Dict[Any, None]]:
+        postings: Dict[str, Dict[Any, None]] = {}
+        for item_id, pos in positions.items():
+            for gram in _grams(_search_text(items[pos].get(field))):
+                bucket = postings.get(gram)
+                if bucket is None:
+                    postings[gram] = bucket = {}
+                bucket[item_id] = None
+        return postings
+
+    def _index_add(self, item: Dict[str, Any], fields_changed: Optional[set] = None):
+        for fields, buckets in self._indexes.items():
+            if fields_changed is None or fields_changed.intersection(fields):
+                key = self._readers[fields](item)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = bucket = {}
+                    if key is not None and fields in self._sorted_keys:
+                        insort(self._sorted_keys[fields], key)
+                bucket[_read_id(item)] = None
+        for field, postings in self._gram_indexes.items():
+            if fields_changed is None or field in fields_changed:
+                item_id = _read_id(item)
+                for gram in _grams(_search_text(item.get(field))):
+                    bucket = postings.get(gram)
+                    if bucket is None:
+                        postings[gram] = bucket = {}
+                    bucket[item_id] = None
+
+    def _index_remove(self, item: Dict[str, Any], fields_changed: Optional[set] = None):
+        for fields, buckets in self._indexes.items():
+            if fields_changed is None or fields_changed.intersection(fields):
+                key = self._readers[fields](item)
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    bucket.pop(_read_id(item), None)
+                    if not bucket:
+                        del buckets[key]
+                        if key is not None and fields in self._sorted_keys:
+                            keys = self._sorted_keys[fields]
+                            del keys[bisect_left(keys, key)]
+        for field, postings in self._gram_indexes.items():
+            if fields_changed is None or field in fields_changed:
+                item_id = _read_id(item)
+                for gram in _grams(_search_text(item.get(field))):
+                    bucket = postings.get(gram)
+                    if bucket is not None:
+                        bucket.pop(item_id, None)
+                        if not bucket:
+                            del postings[gram]
+
+    def _index_for(self, filters: Dict[str, Any]) -> Optional[tuple]:
+        """选择被查询条件完全覆盖、且字段最多的索引"""
+        best = None
+        for fields in self._readers:
+            if all(field in filters for field in fields):
+                if best is None or len(fields) > len(best):
+                    best = fields
+        return best
+
+    def vacuum(self):
+        """清理墓碑（调用方需持有锁）"""
+        if not self._loaded or not self._tombstones:
+            return
+        items = self._items()
+        items[:] = [item for item in items if item is not None]
+        self._reindex()
+
+    def _scan(self) -> list:
+        """表中的有效记录（调用方需持有锁，没有墓碑时直接返回内部列表）"""
+        items = self._items()
+        if self._tombstones:
+            return [item for item in items if item is not None]
+        return items
+
+    @_reading
+    def rows(self) -> List[Dict[str, Any]]:
+        """获取全部记录（新列表，之后的写入不会改变它）"""
+        items = self._scan()
+        return list(items) if items is self._items() else items
+
+    def _get(self, item_id: Any) -> Optional[Dict[str, Any]]:
+        pos = self._positions.get(item_id)
+        return self._items()[pos] if pos is not None else None
+
+    @_reading
+    def get(self, item_id: Any) -> Optional[Dict[str, Any]]:
+        """根据ID获取记录"""
+        return self._get(item_id)
+
+    @staticmethod
+    def _matches(item: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+        return all(item.get(key) == value for key, value in filters.items())
+
+    @_reading
+    def find(self, filters: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取满足全部等值条件的记录"""
+        if 'id' in filters:
+            item = self._get(filters['id'])
+            return [item] if item is not None and self._matches(item, filters) else []
+
+        fields = self._index_for(filters)
+        if fields is not None:
+            bucket = self._index(fields).get(self._readers[fields](filters), {})
+            # 按记录在表中的位置排序，结果顺序与全表扫描一致
+            ids = sorted(bucket, key=lambda item_id: self._positions.get(item_id, -1))
+            candidates = (self._get(item_id) for item_id in ids)
+        else:
+            candidates = self._scan()
+
+        results = []
+        for item in candidates:
+            if item is not None and self._matches(item, filters):
+                results.append(item)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    @_reading
+    def find_range(self, field: str, lo: Any = None, hi: Any = None) -> List[Dict[str, Any]]:
+        """获取字段取值在 [lo, hi] 内的记录（边界为 None 表示不限），按取值升序排列"""
+        if (field,) not in self._ordered:
+            # 未声明有序索引时退化为全表扫描
+            matched = [item for item in self._scan() if _in_range(item.get(field), lo, hi)]
+            return sorted(matched, key=lambda item: item.get(field))
+        return [item for item in self._ordered_walk(field, lo, hi)
+                if item is not None and _in_range(item.get(field), lo, hi)]
+
+    def _by_position(self, ids) -> list:
+        """按记录在表中的位置排序ID，结果顺序与全表扫描一致"""
+        return sorted(ids, key=lambda item_id: self._positions.get(item_id, -1))
+
+    def _ordered_walk(self, field: str, lo: Any = None, hi: Any = None, descending: bool = False,
+                      by_id: bool = False, missing: Optional[bool] = None):
+        """按有序索引的取值顺序逐条产出 [lo, hi] 内的记录，同一取值内按表中位置（by_id 时按ID）排列
+
+        missing 为真时最后产出该字段为空的记录，默认在两端都不限时产出。
+        调用方需在持有锁期间读完产出的记录。
+        """
+        order = sorted if by_id else self._by_position
+        if missing is None:
+            missing = lo is None and hi is None
+        fields = (field,)
+        buckets = self._index(fields)
+        keys = self._sorted_keys[fields]
+        start = 0 if lo is None else bisect_left(keys, lo)
+        end = len(keys) if hi is None else bisect_right(keys, hi)
+        selected = keys[start:end]
+        if descending:
+            selected.reverse()
+        for key in selected:
+            for item_id in order(buckets.get(key, ())):
+                yield self._get(item_id)
+        if missing:
+            for item_id in order(buckets.get(None, ())):
+                yield self._get(item_id)
+
+    def _search_candidates(self, field: str, keyword: str) -> set:
+        """倒排索引中可能包含关键字的记录ID（需再核对子串）"""
+        postings = self._gram_index(field)
+        if len(keyword) == 1:
+            # 单个字符：合并所有含该字符的分片
+            ids = set()
+            for gram, bucket in postings.items():
+                if keyword in gram:
+                    ids.update(bucket)
+            return ids
+        buckets = sorted((postings.get(gram, {}) for gram in _grams(keyword)), key=len)
+        ids = set(buckets[0])
+        for bucket in buckets[1:]:
+            if not ids:
+                break
+            ids.intersection_update(bucket)
+        return ids
+
+    @_reading
+    def search(self, fields: Sequence[str], keyword: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """在指定字段中做不区分大小写的子串搜索，按匹配等级（见 _search_rank）排序
+
+        字段都声明了搜索索引时由倒排索引筛选候选记录，否则全表扫描。
+        同等级的记录按在表中的位置排列；limit 限制返回数量。
+        """
+        keyword = keyword.lower()
+        if not keyword:
+            rows = self._scan()
+            return list(rows) if limit is None else rows[:limit]
+
+        if all(field in self._search_fields for field in fields):
+            ids = set()
+            for field in fields:
+                ids.update(self._search_candidates(field, keyword))
+            candidates = (self._get(item_id) for item_id in ids)
+        else:
+            candidates = self._scan()
+
+        ranked = []
+        for item in candidates:
+            if item is None:
+                continue
+            rank = _search_rank(item, fields, keyword)
+            if rank is not None:
+                ranked.append((rank, self._positions.get(_read_id(item), -1), item))
+        key = itemgetter(0, 1)
+        ranked = sorted(ranked, key=key) if limit is None else heapq.nsmallest(limit, ranked, key=key)
+        return [item for _, _, item in ranked]
+
+    def _plan(self, conditions: Sequence[Any], order_by: Optional[str] = None,
+              limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        """为查询选择访问路径（调用方需已加载表）
+
+        候选路径：主键、被等值条件覆盖的哈希索引、比较条件字段的有序索引、contains 条件字段的
+        倒排索引，取估计行数最少的一个，都不可用时全表扫描；其余条件作为剩余过滤条件。
+        排序字段有有序索引、且访问路径为全表扫描或同一字段的范围时，直接按有序索引顺序读取，
+        limit/offset 取够即停，不需要先排序全部结果。
+        """
+        # 与 QueryCondition.matches 一致，字段或取值为空的条件不起作用
+        conditions = [c for c in conditions if c.field and c.value is not None]
+        plan = {'table': self.name, 'access': 'scan', 'index': None, 'using': [],
+                'estimated_rows': len(self._positions)}
+
+        def consider(access, index, using, estimate):
+            if estimate < plan['estimated_rows']:
+                plan.update(access=access, index=index, using=using, estimated_rows=estimate)
+
+        equals = {c.field: c.value for c in conditions if c.operator == 'eq'}
+        if 'id' in equals:
+            consider('primary', ('id',), [c for c in conditions if c.operator == 'eq' and c.field == 'id'], 1)
+        fields = self._index_for(equals)
+        if fields is not None:
+            bucket = self._index(fields).get(self._readers[fields](equals), ())
+            consider('index', fields, [c for c in conditions if c.operator == 'eq' and c.field in fields],
+                     len(bucket))
+        for field in dict.fromkeys(c.field for c in conditions if c.operator in self.RANGE_OPERATORS):
+            if (field,) in self._ordered:
+                using = [c for c in conditions if c.field == field and c.operator in self.RANGE_OPERATORS]
+                consider('range', (field,), using, self._range_estimate(field, *_range_bounds(using)))
+        for c in conditions:
+            if c.operator == 'contains' and c.field in self._search_fields and isinstance(c.value, str) and c.value:
+                consider('search', (c.field,), [c], self._search_estimate(c.field, c.value.lower()))
+
+        plan['order'] = None
+        if order_by is not None:
+            plan['order'] = 'sort'
+            if (order_by,) in self._ordered and (plan['access'] == 'scan' or plan['index'] == (order_by,)):
+                if plan['access'] == 'scan':
+                    plan.update(access='range', index=(order_by,))
+                plan['order'] = 'index'
+        plan['residual'] = [c for c in conditions if c not in plan['using']]
+        plan['limit'] = limit
+        plan['offset'] = offset
+        return plan
+
+    def _range_estimate(self, field: str, lo: Any, hi: Any) -> int:
+        """按范围内不同取值的个数估计行数"""
+        self._index((field,))
+        keys = self._sorted_keys[(field,)]
+        if not keys:
+            return 0
+        start = 0 if lo is None else bisect_left(keys, lo)
+        end = len(keys) if hi is None else bisect_right(keys, hi)
+        return max(end - start, 0) * len(self._positions) // len(keys)
+
+    def _search_estimate(self, field: str, keyword: str) -> int:
+        """倒排索引候选数量的上界"""
+        postings = self._gram_index(field)
+        if len(keyword) == 1:
+            return sum(len(bucket) for gram, bucket in postings.items() if keyword in gram)
+        return min(len(postings.get(gram, ())) for gram in _grams(keyword))
+
+    def _plan_rows(self, plan: Dict[str, Any], descending: bool = False, after: Optional[_Keyset] = None):
+        """按执行计划的访问路径产出候选记录（可能为 None）
+
+        按有序索引读取键集分页时，从游标所在的取值开始读取。
+        """
+        access = plan['access']
+        if access == 'primary':
+            return [self._get(plan['using'][0].value)]
+        if access == 'index':
+            fields = plan['index']
+            equals = {c.field: c.value for c in plan['using']}
+            bucket = self._index(fields).get(self._readers[fields](equals), ())
+            return (self._get(item_id) for item_id in self._by_position(bucket))
+        if access == 'range':
+            lo, hi = _range_bounds(plan['using'])
+            if after is None or plan['order'] != 'index':
+                ordered = plan['order'] == 'index'
+                return self._ordered_walk(plan['index'][0], lo, hi, descending and ordered, by_id=ordered)
+            missing = lo is None and hi is None
+            if after.value is not None:
+                if descending:
+                    hi = after.value if hi is None or after.value < hi else hi
+                else:
+                    lo = after.value if lo is None or after.value > lo else lo
+            return self._ordered_walk(plan['index'][0], lo, hi, descending, by_id=True, missing=missing)
+        if access == 'search':
+            condition = plan['using'][0]
+            ids = self._search_candidates(condition.field, condition.value.lower())
+            return (self._get(item_id) for item_id in self._by_position(ids))
+        return self._scan()
+
+    @_reading
+    def query(self, conditions: Sequence[Any], order_by: Optional[str] = None, descending: bool = False,
+              limit: Optional[int] = None, offset: int = 0, after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """执行查询：conditions 为 QueryCondition 列表（全部满足），order_by 为排序字段
+
+        排序字段为空的记录排在最后，同一取值内按 id 升序，分页结果稳定；不指定排序字段时按访问路径的自然顺序返回。
+        after 为键集分页游标 (上一页最后一条的排序字段取值, id)，只返回排在其后的记录；未指定排序字段时按 id 排序。
+        """
+        if after is not None and order_by is None:
+            order_by = 'id'
+        plan = self._plan(conditions, order_by, limit, offset)
+        conditions = plan['using'] + plan['residual']
+        keyset = _Keyset(order_by, after, descending) if after is not None else None
+        # 结果顺序已确定时取够 offset + limit 条即停
+        stop = None if limit is None or plan['order'] == 'sort' else offset + limit
+        results = []
+        for item in self._plan_rows(plan, descending, keyset):
+            if item is not None and all(c.matches(item) for c in conditions):
+                if keyset is not None and not keyset.matches(item):
+                    continue
+                results.append(item)
+                if stop is not None and len(results) >= stop:
+                    break
+        if plan['order'] == 'sort':
+            # 同一取值内按 id 排列，与有序索引和游标的顺序一致
+            results.sort(key=_read_id)
+            results = _sorted_by(results, order_by, descending)
+        return results[offset:] if limit is None else results[offset:offset + limit]
+
+    @_reading
+    def count_where(self, conditions: Sequence[Any]) -> int:
+        """满足查询条件的记录数量，哈希索引能完全覆盖条件时直接取桶大小"""
+        plan = self._plan(conditions)
+        if not plan['residual'] and plan['access'] in ('scan', 'index'):
+            return plan['estimated_rows']
+        conditions = plan['using'] + plan['residual']
+        return sum(1 for item in self._plan_rows(plan)
+                   if item is not None and all(c.matches(item) for c in conditions))
+
+    @_reading
+    def distinct(self, field: str) -> List[Any]:
+        """字段的不同取值（不含空值），升序排列；有哈希索引时直接取索引的键"""
+        if (field,) in self._readers:
+            values = [key for key in self._index((field,)) if key is not None]
+        else:
+            values = {item.get(field) for item in self._scan()} - {None}
+        return sorted(values)
+
+    @_reading
+    def explain(self, conditions: Sequence[Any], order_by: Optional[str] = None, descending: bool = False,
+                limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        """返回查询的执行计划（不执行查询）"""
+        plan = self._plan(conditions, order_by, limit, offset)
+        plan['using'] = [repr(c) for c in plan['using']]
+        plan['residual'] = [repr(c) for c in plan['residual']]
+        return plan
+
+    @_reading
+    def count(self) -> int:
+        """获取记录数量"""
+        return len(self._positions)
+
+    def _put(self, item_id: Any, row: Any):
+        """写入整条记录：ID不存在时追加，存在时替换原记录（调用方需持有写锁）"""
+        items = self._items()
+        pos = self._positions.get(item_id)
+        if pos is None:
+            self._positions[item_id] = len(items)
+            items.append(row)
+        else:
+            self._index_remove(items[pos])
+            items[pos] = row
+        self._index_add(row)
+
+    def _patch(self, item_id: Any, values: Dict[str, Any]) -> Any:
+        """用合并了新取值的新记录替换原记录，返回新记录（调用方需持有写锁）"""
+        pos = self._positions[item_id]
+        items = self._items()
+        item = items[pos]
+        changed = set(values)
+        self._index_remove(item, changed)
+        # 不原地修改：读者手中的旧记录保持不变，只会看到更新前或更新后的完整记录
+        items[pos] = row = self._pack({**item, **values})
+        self._index_add(row, changed)
+        return row
+
+    def _drop(self, item_id: Any):
+        """把记录所在位置置为墓碑（调用方需持有写锁）"""
+        pos = self._positions.pop(item_id)
+        items = self._items()
+        self._index_remove(items[pos])
+        items[pos] = None
+        self._tombstones += 1
+
+    def insert(self, item: Dict[str, Any]):
+        """插入记录（ID已存在时替换原记录）"""
+        if not self._loaded:
+            self._load()
+        with self.store.lock:
+            item_id = item.get('id')
+            old = self._get(item_id)
+            if old is None:
+                self.store._remember(self.name, 'insert', item_id)
+            else:
+                self.store._remember(self.name, 'replace', item_id, dict(old.items()))
+            self._put(item_id, self._pack(item))
+            self.store.record(self.name, 'insert', item_id, item)
+
+    def update(self, item_id: Any, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新记录，返回更新后的记录"""
+        if not self._loaded:
+            self._load()
+        with self.store.lock:
+            item = self._get(item_id)
+            if item is None:
+                return None
+            self.store._remember(self.name, 'replace', item_id, dict(item.items()))
+            row = self._patch(item_id, values)
+            self.store.record(self.name, 'update', item_id, values)
+            return row
+
+    def _remove(self, item_id: Any):
+        """删除记录并写变更日志（调用方需持有锁）"""
+        pos = self._positions[item_id]
+        self.store._remember(self.name, 'delete', item_id, (pos, dict(self._items()[pos].items())))
+        self._drop(item_id)
+        self.store.record(self.name, 'delete', item_id)
+
+    def _undo_change(self, op: str, item_id: Any, before: Any):
+        """回滚事务时撤销一次变更，不写变更日志（调用方需持有锁）"""
+        if op == 'unseal':
+            # 重新装回的分区还没有写入快照，移除后该月份仍以封存分段为准
+            self.store._drop_table(self.name)
+        elif op == 'insert':
+            self._drop(item_id)
+        elif op == 'replace':
+            self._put(item_id, self._pack(before))
+        elif op == 'delete':
+            pos, item = before
+            self._items()[pos] = row = self._pack(item)
+            self._positions[item_id] = pos
+            self._tombstones -= 1
+            self._index_add(row)
+
+    def _apply_log(self, entries: List[Dict[str, Any]]):
+        """应用其他进程写入的变更日志，不再记录日志和撤销信息（调用方需持有写锁）"""
+        for entry in entries:
+            op = entry['op']
+            item_id = entry.get('id')
+            if op == 'insert':
+                self._put(item_id, self._pack(entry['v']))
+            elif item_id in self._positions:
+                if op == 'update':
+                    self._patch(item_id, entry['v'])
+                elif op == 'delete':
+                    self._drop(item_id)
+
+    def _replace_rows(self, items: list):
+        """用重新加载的记录替换整张表（调用方需持有写锁）"""
+        if not self._loaded:
+            self._items()[:] = items
+            return
+        self._install(self._prepare(items))
+
+    def _prepare(self, items: list) -> Dict[str, Any]:
+        """为重新加载的记录准备好记录列表、主键索引和已建立的各类索引，不修改当前状态
+
+        只读取表的声明，可以在锁外进行；之后由 _install 在写锁内一次性替换。
+        """
+        if self.compact:
+            rows = [CompactRow.pack(item) if item.__class__ is dict else item for item in items]
+        else:
+            rows = [item.to_dict() if isinstance(item, CompactRow) else item for item in items]
+        positions = {_read_id(item): i for i, item in enumerate(rows)}
+        indexes = {fields: self._buckets(fields, rows, positions) for fields in list(self._indexes)}
+        return {
+            'rows': rows,
+            'positions': positions,
+            'indexes': indexes,
+            'sorted_keys': {fields: sorted(key for key in buckets if key is not None)
+                            for fields, buckets in indexes.items() if fields in self._ordered},
+            'gram_indexes': {field: self._postings(field, rows, positions) for field in list(self._gram_indexes)},
+        }
+
+    def _install(self, state: Dict[str, Any]):
+        """换上 _prepare 准备好的记录和索引（调用方需持有写锁）
+
+        准备之后才声明或建立的索引不在其中，下次查询时再建立。
+        """
+        self.store.data['in_memory_data'][self.name] = state['rows']
+        self._positions = state['positions']
+        self._tombstones = 0
+        self._indexes = state['indexes']
+        self._sorted_keys = state['sorted_keys']
+        self._gram_indexes = state['gram_indexes']
+        self._sync_next_id()
+
+    def delete_where(self, filters: Dict[str, Any]) -> int:
+        """删除满足条件的所有记录，返回删除数量"""
+        with self.store.lock:
+            matched = [item.get('id') for item in self.find(filters)]
+            for item_id in matched:
+                self._remove(item_id)
+            # 事务中不清理墓碑，回滚时被删除的记录要放回原位置
+            if not self.store.in_transaction() and \
+                    self._tombstones > max(self.VACUUM_MIN, len(self._positions) * self.VACUUM_RATIO):
+                self.vacuum()
+            return len(matched)
+
+    def next_id(self) -> int:
+        """分配下一个ID：从本表预留的ID段中取号，不加锁；用完时再预留 ID_BLOCK 个"""
+        if not self._loaded:
+            self._load()
+        while True:
+            block = self._ids
+            item_id = block.take()
+            if item_id is not None:
+                return item_id
+            with self.store.lock:
+                # 同时用完的线程中只有一个重新预留
+                if self._ids is block:
+                    ids = self._reserve(self.ID_BLOCK)
+                    self._ids = IdBlock(ids.start, ids.stop)
+
+    def reserve_ids(self, count: int) -> range:
+        """一次预留 count 个连续的ID（批量创建时使用）"""
+        if not self._loaded:
+            self._load()
+        with self.store.lock:
+            return self._reserve(count)
+
+    def _reserve(self, count: int) -> range:
+        """把 next_id 向后推 count 个，只记录新的上限（调用方需持有写锁）
+
+        预留不随事务撤销；重启后未用完的ID会留下空缺，但不会重复分配。
+        """
+        next_ids = self.store.data['next_id']
+        start = next_ids.get(self.name, 1)
+        next_ids[self.name] = start + count
+        self.store._remember(self.name, 'reserve', start + count)
+        self.store.record(self.name, 'next_id', values=start + count)
+        return range(start, start + count)
+
+    def sync_next_id(self):
+        """Ensure next_id is at least max existing id + 1 after manual edits."""
+        if not self._loaded:
+            # 加载时会同步
+            return
+        with self.store.lock:
+            self._sync_next_id()
+
+    def _sync_next_id(self):
+        max_id = max((item_id for item_id in self._positions if isinstance(item_id, int)), default=0)
+        next_ids = self.store.data['next_id']
+        owner = self.id_table
+        # If manual additions use higher IDs, bump next_id forward.
+        if max_id >= next_ids.get(owner.name, 1):
+            next_ids[owner.name] = max_id + 1
+        if max_id >= owner._ids.start:
+            # 手工添加的记录可能占用了已预留的ID，放弃当前ID段，下次从 next_id 重新预留
+            owner._ids = IdBlock()
@@ -1,9 +1,18 @@
 # models.py
 import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from typing import Optional, List, Dict, Any
 
-@dataclass
+
+def _fields_dict(obj) -> Dict[str, Any]:
+    """按字段浅拷贝为字典
+
+    模型字段都是标量，不需要 asdict 的递归深拷贝；字段值直接复用，不产生新对象。
+    """
+    return {name: getattr(obj, name) for name in obj.__dataclass_fields__}
+
+# 实体模型使用 slots：实例不再携带 __dict__，大表的模型缓存占用显著减少
+@dataclass(slots=True)
 class User:
     id: int
     username: str
@@ -12,9 +21,9 @@ class User:
     student_info_id: Optional[int] = None
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class Student:
     id: int
     name: str
@@ -27,9 +36,9 @@ class Student:
     homeroom_teacher: str = ""
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class Course:
     id: int
     name: str
@@ -38,9 +47,9 @@ class Course:
     capacity: Optional[int] = None
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class Enrollment:
     id: int
     student_id: int
@@ -49,9 +58,9 @@ class Enrollment:
     performance_score: Optional[float] = None
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class Attendance:
     id: int
     student_id: int
@@ -60,9 +69,9 @@ class Attendance:
     reason: str
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class LeaveRequest:
     id: int
     student_id: int
@@ -75,9 +84,9 @@ class LeaveRequest:
     updated_at: str = ''
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class RewardPunishment:
     id: int
     student_id: int
@@ -86,9 +95,9 @@ class RewardPunishment:
     date: str
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class Parent:
     id: int
     student_id: int
@@ -99,9 +108,9 @@ class Parent:
     address: str = ""
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class Notice:
     id: int
     title: str
@@ -111,9 +120,9 @@ class Notice:
     date: str
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class Schedule:
     id: int
     course_id: int
@@ -125,16 +134,29 @@ class Schedule:
     semester: str
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
 
-@dataclass
+@dataclass(slots=True)
 class EnrollmentStatus:
     """选课状态模型类"""
     id: int = 1
     enrollment_open: bool = False
+    # 抽签选课模式下本次开放期的抽签种子，开放时生成，用于复核分配结果
+    lottery_seed: Optional[int] = None
     
     def to_dict(self):
-        return asdict(self)
+        return _fields_dict(self)
+
+@dataclass(slots=True)
+class CoursePreference:
+    """选课志愿（抽签选课模式下学生登记的课程，rank 越小越优先）"""
+    id: int
+    student_id: int
+    course_id: int
+    rank: int
+    
+    def to_dict(self):
+        return _fields_dict(self)
 
 # 数据初始化类
 class DataInitializer:
@@ -339,7 +361,7 @@ class QueryCondition:
     def __init__(self, field=None, value=None, operator='eq'):
         self.field = field
         self.value = value
-        self.operator = operator  # eq, ne, gt, lt, contains等
+        self.operator = operator  # eq, ne, gt, lt, ge, le, in, contains等
     
     def matches(self, item_dict):
         """检查字典是否满足查询条件"""
@@ -352,22 +374,53 @@ class QueryCondition:
             return item_value == self.value
         elif self.operator == 'ne':
             return item_value != self.value
+        elif self.operator == 'contains':
+            return self.value.lower() in str(item_value).lower()
+        elif self.operator == 'in':
+            return item_value in self.value
+        elif item_value is None:
+            # 缺失的字段不参与大小比较
+            return False
         elif self.operator == 'gt':
             return item_value > self.value
         elif self.operator == 'lt':
             return item_value < self.value
-        elif self.operator == 'contains':
-            return self.value.lower() in str(item_value).lower()
+        elif self.operator == 'ge':
+            return item_value >= self.value
+        elif self.operator == 'le':
+            return item_value <= self.value
         
         return False
 
+    def __repr__(self):
+        return f'{self.field} {self.operator} {self.value!r}'
+
 class QueryBuilder:
+    """查询构建器，交给 BaseRepository.query 执行（explain 查看执行计划）"""
+
     def __init__(self):
         self.conditions = []
+        self.sort_field = None
+        self.descending = False
+        self.limit_count = None
+        self.offset_count = 0
     
     def where(self, field, value, operator='eq'):
         self.conditions.append(QueryCondition(field, value, operator))
         return self
+
+    def order_by(self, field, descending=False):
+        self.sort_field = field
+        self.descending = descending
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def offset(self, count):
+        self.offset_count = count
+        return self
     
     def build(self):
         return self.conditions
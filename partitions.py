@@ -0,0 +1,520 @@
+# partitions.py
+"""
+按月分区的数据表
+
+PartitionedTable 把记录按日期字段的月份分到各月的 MemoryTable，
+较早的月份可以封存为只读的压缩分段（<数据文件>_segments/ 或按表分文件目录下的 segments/），
+需要时再载入。
+"""
+import gzip
+import heapq
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence
+
+from memory_table import MemoryTable, _read_id, _search_rank, _sorted_by
+from storage import DataStore
+
+
+class _SegmentStore(DataStore):
+    """封存分段的只读存储：记录在创建时给定，不读写任何文件"""
+
+    def __init__(self, table_name: str, rows: list):
+        super().__init__(os.devnull)
+        self._data = {'in_memory_data': {table_name: rows}, 'next_id': {}}
+        self._loaded = True
+
+    def record(self, table: str, op: str, item_id: Any = None, values: Optional[Dict[str, Any]] = None):
+        raise RuntimeError("封存的分段是只读的")
+
+    def save(self) -> bool:
+        raise RuntimeError("封存的分段是只读的")
+
+    compact = save
+
+
+class PartitionedTable:
+    """按月分区的数据表，与 MemoryTable 接口一致
+
+    记录按分区字段（日期字符串）的前 7 个字符 YYYY-MM 分到各月的分区，每个分区是存储中名为
+    <表名>@<月份> 的普通表，保存时只重写有变更的分区；分区字段为空的记录留在与表同名的基础表中，
+    整张表的ID也由基础表分配。查询条件限定了分区字段的取值或范围时只访问重叠的分区，
+    按分区字段排序时按月份顺序逐个分区读取，取够即停。
+
+    seal() 把已结束月份的分区封存为只读的压缩分段（分段目录下的 <表名>@<月份>.jsonl.gz），
+    移出快照和内存，清单文件 <表名>.manifest.json 记录各分段的记录数和ID范围；
+    查询用到分段时才解压加载，最多缓存 COLD_CACHE 个。写入已封存的月份时先把分段装回为普通分区。
+    同一月份同时存在普通分区和分段时以普通分区为准（封存后又装回的月份即是如此）。
+    """
+
+    # 同时保留在内存中的封存分段数量，超出时释放最久未用的
+    COLD_CACHE = 12
+
+    def __init__(self, store: DataStore, name: str, field: str):
+        self.store = store
+        self.name = name
+        self.field = field
+        self.compact = False
+        self._declaration: Dict[str, Any] = {'indexes': [], 'compact': False, 'range_indexes': [], 'search_fields': []}
+        # 基础表：保存分区字段为空的记录，并为整张表分配ID
+        self.base = store.table(name)
+        # 封存清单：月份 -> {'count', 'min_id', 'max_id'}，首次访问时读取
+        self._manifest: Optional[Dict[str, Dict[str, Any]]] = None
+        # 已加载的封存分段：月份 -> 只读表，按最近使用排列
+        self._cold: 'OrderedDict[str, MemoryTable]' = OrderedDict()
+        self._cold_lock = threading.Lock()
+        self._seal_lock = threading.Lock()
+        self._ready = False
+
+    def declare(self, indexes: Sequence[Any] = (), compact: bool = False,
+                range_indexes: Sequence[str] = (), search_fields: Sequence[str] = ()):
+        """登记仓储声明的索引和紧凑存储，应用到基础表和各分区（调用方需持有写锁）"""
+        declaration = self._declaration
+        for key, values in (('indexes', indexes), ('range_indexes', range_indexes), ('search_fields', search_fields)):
+            declaration[key] += [value for value in values if value not in declaration[key]]
+        declaration['compact'] = self.compact = declaration['compact'] or compact
+        prefix = self.name + '@'
+        for table_name in [self.name] + [name for name in self.store._tables if name.startswith(prefix)]:
+            self.store.table(table_name, **declaration)
+
+    # ---- 分区 ----
+
+    def _month(self, value: Any) -> Optional[str]:
+        """取值所属的月份 YYYY-MM，不是日期字符串时为 None（记录保存在基础表中）"""
+        return value[:7] if isinstance(value, str) and len(value) >= 7 else None
+
+    def _hot_months(self) -> List[str]:
+        """存储中有普通分区的月份"""
+        prefix = self.name + '@'
+        return sorted(name[len(prefix):] for name in self.store.table_names() if name.startswith(prefix))
+
+    def _partition(self, month: str, create: bool = False) -> Optional[MemoryTable]:
+        """月份的普通分区，create 为真时不存在则创建（调用方需持有写锁）"""
+        name = f'{self.name}@{month}'
+        table = self.store._tables.get(name)
+        if table is None and create:
+            table = self.store.table(name, **self._declaration)
+            table.id_table = self.base
+        return table
+
+    def _open(self):
+        """首次访问时读取封存清单，并把基础表中有日期的记录迁移到各月分区；之后登记新出现的分区"""
+        if self._ready and all(f'{self.name}@{month}' in self.store._tables for month in self._hot_months()):
+            return
+        with self.store.lock:
+            if self._manifest is None:
+                self._manifest = self._read_manifest()
+            for month in self._hot_months():
+                self._partition(month, create=True)
+            if not self._ready:
+                self._migrate()
+                # 事务中的迁移可能被回滚，提交之后再确认完成
+                self._ready = not self.store.in_transaction()
+
+    def _migrate(self):
+        """把基础表中分区字段有日期的记录移到所属月份的分区（调用方需持有写锁）"""
+        base = self.base
+        if not base._loaded:
+            base._load()
+        moved = [item for item in base._scan() if self._month(item.get(self.field)) is not None]
+        for item in moved:
+            base._remove(_read_id(item))
+            self._writable(self._month(item.get(self.field))).insert(dict(item.items()))
+        if moved:
+            if not self.store.in_transaction():
+                base.vacuum()
+            print(f"✅ 已把 {len(moved)} 条 {self.name} 记录按月迁移到分区")
+
+    def _months(self, conditions: Sequence[Any] = ()) -> List[Optional[str]]:
+        """按分区字段上的条件裁剪后要访问的月份（升序，含封存的月份），基础表记为 None 排在最后
+
+        比较条件的取值不是日期字符串时不裁剪。
+        """
+        wanted = None
+        lo = hi = None
+        base = True
+        for c in conditions:
+            if c.field != self.field or c.value is None:
+                continue
+            if c.operator in ('eq', 'in'):
+                months = {self._month(value) for value in (c.value if c.operator == 'in' else [c.value])}
+                wanted = months if wanted is None else wanted & months
+            elif c.operator in MemoryTable.RANGE_OPERATORS:
+                month = self._month(c.value)
+                if month is None:
+                    continue
+                # 分区字段为空的记录不满足比较条件
+                base = False
+                if c.operator in ('gt', 'ge'):
+                    lo = month if lo is None else max(lo, month)
+                else:
+                    hi = month if hi is None else min(hi, month)
+        if wanted is not None:
+            base = base and None in wanted
+        months = sorted(set(self._hot_months()) | set(self._manifest))
+        months = [month for month in months if (wanted is None or month in wanted)
+                  and (lo is None or month >= lo) and (hi is None or month <= hi)]
+        if base:
+            months.append(None)
+        return months
+
+    def _source(self, month: Optional[str]) -> MemoryTable:
+        """月份对应的表：基础表、普通分区或（按需加载的）封存分段"""
+        if month is None:
+            return self.base
+        return self._partition(month) or self._cold_table(month)
+
+    def _writable(self, month: Optional[str]) -> MemoryTable:
+        """写入月份时使用的表：已封存的月份先装回为普通分区（调用方需持有写锁）"""
+        if month is None:
+            return self.base
+        table = self._partition(month)
+        if table is None:
+            if month in self._manifest:
+                return self._unseal(month)
+            table = self._partition(month, create=True)
+        return table
+
+    def _lookup(self, item_id: Any) -> tuple:
+        """按ID查找记录，返回 (所在月份, 记录)，基础表中的月份为 None，找不到时记录为 None"""
+        item = self.base.get(item_id)
+        if item is not None:
+            return None, item
+        hot = self._hot_months()
+        for month in hot:
+            table = self._partition(month)
+            item = table.get(item_id) if table is not None else None
+            if item is not None:
+                return month, item
+        for month, meta in list(self._manifest.items()):
+            if month not in hot and isinstance(item_id, int) and meta['min_id'] <= item_id <= meta['max_id']:
+                item = self._cold_table(month).get(item_id)
+                if item is not None:
+                    return month, item
+        return None, None
+
+    # ---- 封存分段 ----
+
+    def _manifest_file(self) -> str:
+        return os.path.join(self.store.segment_dir(), f'{self.name}.manifest.json')
+
+    def _segment_file(self, month: str) -> str:
+        return os.path.join(self.store.segment_dir(), f'{self.name}@{month}.jsonl.gz')
+
+    def _read_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._manifest_file(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def read_segment(path: str) -> list:
+        """读取封存分段文件中的记录"""
+        with open(path, 'rb') as f:
+            text = gzip.decompress(f.read()).decode('utf-8')
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    def _cold_table(self, month: str) -> MemoryTable:
+        """加载（或从缓存取得）封存分段，放在独立的只读存储中"""
+        with self._cold_lock:
+            table = self._cold.get(month)
+            if table is not None:
+                self._cold.move_to_end(month)
+                return table
+        rows = self.read_segment(self._segment_file(month))
+        store = _SegmentStore(self.name, rows)
+        table = store.table(self.name, **self._declaration)
+        with self._cold_lock:
+            table = self._cold.setdefault(month, table)
+            self._cold.move_to_end(month)
+            while len(self._cold) > self.COLD_CACHE:
+                self._cold.popitem(last=False)
+        return table
+
+    def _unseal(self, month: str) -> MemoryTable:
+        """把封存的月份装回为普通分区，之后的写入照常记录（调用方需持有写锁）
+
+        装回的记录全部作为变更写入，下次保存时重新进入快照；封存分段保留，回滚时移除装回的分区即可。
+        """
+        rows = self._cold_table(month).rows()
+        table = self._partition(month, create=True)
+        self.store._remember(table.name, 'unseal', None)
+        table._replace_rows(list(rows))
+        for row in rows:
+            self.store.record(table.name, 'insert', _read_id(row), dict(row.items()))
+        self.store._dirty.add(table.name)
+        with self._cold_lock:
+            self._cold.pop(month, None)
+        return table
+
+    def seal(self, before: str) -> List[str]:
+        """把早于 before（YYYY-MM）的月份分区封存为压缩分段，返回封存的月份
+
+        先压缩快照清空WAL，再逐月写出分段和清单，最后在写锁内移除分区；
+        写出分段期间该分区又有写入时保留普通分区，留待下次封存。共享模式下不封存。
+        """
+        if self.store.shared:
+            return []
+        self._open()
+        months = [month for month in self._hot_months() if month < before]
+        if not months:
+            return []
+        sealed = []
+        with self._seal_lock:
+            # 之后未变更的分区不会再有WAL记录，移除分区不会在重启时被WAL重建
+            self.store.compact()
+            os.makedirs(self.store.segment_dir(), exist_ok=True)
+            for month in months:
+                table = self._partition(month)
+                if table is None or table.name in self.store._dirty:
+                    continue
+                rows = table.rows()
+                ids = [item_id for item_id in map(_read_id, rows) if isinstance(item_id, int)]
+                self.store._atomic_write(self._segment_file(month), gzip.compress(self.store._dump_rows(rows).encode('utf-8')))
+                self._manifest[month] = {'count': len(rows), 'min_id': min(ids, default=0), 'max_id': max(ids, default=0)}
+                self.store._atomic_write(self._manifest_file(), json.dumps(self._manifest, ensure_ascii=False, indent=4))
+                with self.store._io_lock, self.store.lock:
+                    # 记录写入后不再原地修改，分区中仍是同一批记录对象说明期间没有写入
+                    current = table._scan()
+                    if table.name in self.store._dirty or len(current) != len(rows) or \
+                            any(a is not b for a, b in zip(current, rows)):
+                        continue
+                    self.store._drop_table(table.name)
+                with self._cold_lock:
+                    self._cold.pop(month, None)
+                sealed.append(month)
+            if sealed and self.store.layout == 'single':
+                # 从快照文件中去掉已封存的分区
+                self.store.compact()
+        if sealed:
+            print(f"📦 已封存 {self.name} 的 {len(sealed)} 个月份: {', '.join(sealed)}")
+        return sealed
+
+    # ---- 读操作 ----
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """获取全部记录（按月份排列，分区字段为空的记录在最后）"""
+        self._open()
+        with self.store.lock.read():
+            results = []
+            for month in self._months():
+                results += self._source(month).rows()
+            return results
+
+    def get(self, item_id: Any) -> Optional[Dict[str, Any]]:
+        """根据ID获取记录，按清单中的ID范围定位封存分段"""
+        self._open()
+        with self.store.lock.read():
+            return self._lookup(item_id)[1]
+
+    def find(self, filters: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取满足全部等值条件的记录，条件含分区字段时只访问对应月份的分区"""
+        self._open()
+        with self.store.lock.read():
+            if 'id' in filters:
+                item = self._lookup(filters['id'])[1]
+                return [item] if item is not None and MemoryTable._matches(item, filters) else []
+            months = self._months()
+            if self.field in filters:
+                month = self._month(filters[self.field])
+                months = [m for m in months if m == month]
+            results = []
+            for month in months:
+                results += self._source(month).find(filters, None if limit is None else limit - len(results))
+                if limit is not None and len(results) >= limit:
+                    break
+            return results
+
+    def find_range(self, field: str, lo: Any = None, hi: Any = None) -> List[Dict[str, Any]]:
+        """获取字段取值在 [lo, hi] 内的记录，按取值升序排列；范围字段为分区字段时只访问重叠的月份"""
+        self._open()
+        with self.store.lock.read():
+            if field != self.field:
+                parts = [self._source(month).find_range(field, lo, hi) for month in self._months()]
+                return list(heapq.merge(*parts, key=lambda item: item.get(field)))
+            first, last = self._month(lo), self._month(hi)
+            results = []
+            for month in self._months():
+                if month is not None and (first is None or month >= first) and (last is None or month <= last):
+                    # 各月分区的取值互不交叠，按月份顺序拼接即为有序结果
+                    results += self._source(month).find_range(field, lo, hi)
+            extra = self.base.find_range(field, lo, hi)
+            return sorted(results + extra, key=lambda item: item.get(field)) if extra else results
+
+    def search(self, fields: Sequence[str], keyword: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """在各分区中做子串搜索，合并后按匹配等级排序"""
+        self._open()
+        with self.store.lock.read():
+            results = []
+            for month in self._months():
+                results += self._source(month).search(fields, keyword, limit)
+            if keyword:
+                results.sort(key=lambda item: _search_rank(item, fields, keyword.lower()))
+            return results if limit is None else results[:limit]
+
+    def query(self, conditions: Sequence[Any], order_by: Optional[str] = None, descending: bool = False,
+              limit: Optional[int] = None, offset: int = 0, after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """执行查询，语义与 MemoryTable.query 相同
+
+        只访问分区字段条件重叠的月份；按分区字段排序时按月份顺序逐个分区查询，取够 offset + limit 条即停，
+        按其他字段排序时各分区各取 offset + limit 条再合并排序。
+        """
+        self._open()
+        if after is not None and order_by is None:
+            order_by = 'id'
+        stop = None if limit is None else offset + limit
+        with self.store.lock.read():
+            months = self._months(conditions)
+            results = []
+            if order_by == self.field:
+                dated = [month for month in months if month is not None]
+                if descending:
+                    dated.reverse()
+                if after is not None:
+                    cursor = self._month(after[0])
+                    if after[0] is None:
+                        # 游标已在分区字段为空的记录中
+                        dated = []
+                    elif cursor is not None:
+                        dated = [month for month in dated if (month <= cursor if descending else month >= cursor)]
+                # 分区字段为空的记录排在最后
+                for month in dated + [None] * (None in months):
+                    need = None if stop is None else stop - len(results)
+                    results += self._source(month).query(conditions, order_by, descending, need, 0, after)
+                    if stop is not None and len(results) >= stop:
+                        break
+            else:
+                for month in months:
+                    results += self._source(month).query(conditions, order_by, descending, stop, 0, after)
+                if order_by is not None:
+                    results.sort(key=_read_id)
+                    results = _sorted_by(results, order_by, descending)
+            return results[offset:] if limit is None else results[offset:offset + limit]
+
+    def count_where(self, conditions: Sequence[Any]) -> int:
+        """满足查询条件的记录数量，只统计重叠的月份"""
+        if not any(c.field and c.value is not None for c in conditions):
+            return self.count()
+        self._open()
+        with self.store.lock.read():
+            return sum(self._source(month).count_where(conditions) for month in self._months(conditions))
+
+    def distinct(self, field: str) -> List[Any]:
+        """字段的不同取值（不含空值），升序排列"""
+        self._open()
+        with self.store.lock.read():
+            values = set()
+            for month in self._months():
+                values.update(self._source(month).distinct(field))
+            return sorted(values)
+
+    def explain(self, conditions: Sequence[Any], order_by: Optional[str] = None, descending: bool = False,
+                limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        """返回查询的执行计划：要访问的分区，以及第一个普通分区（没有时为基础表）上的计划"""
+        self._open()
+        with self.store.lock.read():
+            months = self._months(conditions)
+            hot = [month for month in months if month is not None and self._partition(month) is not None]
+            table = self._partition(hot[0]) if hot else self.base
+            plan = table.explain(conditions, order_by, descending, limit, offset)
+            plan['table'] = self.name
+            plan['partitions'] = [self.name if month is None else
+                                  f'{self.name}@{month}' + ('' if month in hot else ' (sealed)') for month in months]
+            return plan
+
+    def count(self) -> int:
+        """获取记录数量，封存的月份直接取清单中的记录数，不加载分段"""
+        self._open()
+        with self.store.lock.read():
+            hot = self._hot_months()
+            total = self.base.count()
+            for month in hot:
+                table = self._partition(month)
+                total += table.count() if table is not None else 0
+            return total + sum(meta['count'] for month, meta in list(self._manifest.items()) if month not in hot)
+
+    # ---- 写操作 ----
+
+    def insert(self, item: Dict[str, Any]):
+        """插入记录（ID已存在时替换原记录，所属月份变化时从原分区移除）"""
+        self._open()
+        with self.store.lock:
+            item_id = item.get('id')
+            month, old = self._lookup(item_id)
+            target = self._writable(self._month(item.get(self.field)))
+            if old is not None:
+                current = self._writable(month)
+                if current is not target:
+                    current._remove(item_id)
+            target.insert(item)
+
+    def update(self, item_id: Any, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新记录，返回更新后的记录；分区字段改到其他月份时把记录移到新分区"""
+        self._open()
+        with self.store.lock:
+            month, item = self._lookup(item_id)
+            if item is None:
+                return None
+            table = self._writable(month)
+            if self.field in values:
+                target = self._writable(self._month(values[self.field]))
+                if target is not table:
+                    table._remove(item_id)
+                    target.insert({**dict(item.items()), **values})
+                    return target.get(item_id)
+            return table.update(item_id, values)
+
+    def delete_where(self, filters: Dict[str, Any]) -> int:
+        """删除满足条件的所有记录，返回删除数量；封存的月份中有匹配记录时先装回"""
+        self._open()
+        with self.store.lock:
+            if 'id' in filters:
+                month, item = self._lookup(filters['id'])
+                months = [month] if item is not None else []
+            else:
+                months = self._months()
+                if self.field in filters:
+                    month = self._month(filters[self.field])
+                    months = [m for m in months if m == month]
+            removed = 0
+            for month in months:
+                if self._source(month).find(filters, limit=1):
+                    removed += self._writable(month).delete_where(filters)
+            return removed
+
+    # ---- ID ----
+
+    def next_id(self) -> int:
+        """分配下一个ID（由基础表统一分配）"""
+        return self.base.next_id()
+
+    def reserve_ids(self, count: int) -> range:
+        """一次预留 count 个连续的ID"""
+        return self.base.reserve_ids(count)
+
+    def sync_next_id(self):
+        """Ensure next_id is at least max existing id + 1 after manual edits."""
+        self.base.sync_next_id()
+        prefix = self.name + '@'
+        for name, table in list(self.store._tables.items()):
+            if name.startswith(prefix):
+                table.sync_next_id()
+
+
+def read_sealed(data_file: str) -> Dict[str, list]:
+    """single 布局数据文件旁已封存的分段：表名 -> 记录列表（迁移到其他存储时使用）
+
+    封存前后的同一月份以数据文件中的普通分区为准，调用方应先合并数据文件中的表。
+    """
+    directory = os.path.splitext(data_file)[0] + '_segments'
+    sealed: Dict[str, list] = {}
+    if not os.path.isdir(directory):
+        return sealed
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.jsonl.gz'):
+            sealed[file_name[:-len('.jsonl.gz')]] = PartitionedTable.read_segment(os.path.join(directory, file_name))
+    return sealed
+
@@ -1,155 +1,277 @@
 # repositories.py
-import json
-import os
+import datetime
 import threading
-from typing import List, Dict, Any, Optional, Type, TypeVar, Generic
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple, Type, TypeVar, Generic
 from models import *
+from events import ChangeEvent, EventBus, bus as event_bus
+from storage import DataStore
+from sqlite_storage import SqliteStore
 
 T = TypeVar('T')
 
 class BaseRepository(Generic[T]):
-    """基础仓储类，提供通用CRUD操作"""
-    
-    def __init__(self, data_file: str = 'app_data.json'):
-        self.data_file = data_file
-        self.data = self._load_data()
-        self.table_name = self.__class__.__name__.replace('Repository', '').lower() + 's'
-        self._lock = threading.Lock()
+    """基础仓储类，提供通用CRUD操作
+
+    仓储只负责模型与字典之间的转换，记录的存取由底层存储的数据表完成
+    （JSON 文件对应 MemoryTable，SQLite 对应 SqliteTable）。
+
+    当存储声明 cache_models 时（本进程是唯一写入方），仓储维护一个按ID缓存模型实例的
+    标识映射，读操作直接复用已创建的模型，更新/删除时失效对应条目。
+    返回的模型实例会被多次调用共享，调用方不应直接修改其属性。
+
+    create/update/delete（及批量的 delete_by_*）在事件总线上发布 ChangeEvent；
+    没有订阅者关心本表时不读取变更前的记录，写入路径不变。
+    """
+
+    # 子类可覆盖表名，默认由类名推导
+    table_name: Optional[str] = None
+    # 常用查询字段，组合字段用元组表示；SQLite 存储会为其建立索引
+    indexes: List[Any] = []
+    # 记录数很大的表使用紧凑记录保存，降低每条记录的内存占用
+    compact: bool = False
+    # 需要范围查询或按其分页排序的字段，建立有序索引（find_range/page）
+    range_indexes: List[str] = []
+    # 可搜索字段（按权重从高到低），建立二元组倒排索引（search）
+    search_fields: List[str] = []
+    # 按月分区的日期字段，已结束的月份可以封存为压缩分段（仅 JSON 存储）
+    partition_by: Optional[str] = None
+    # 发布变更事件的总线，默认全部仓储共用 events.bus
+    events: EventBus = event_bus
+    
+    def __init__(self, data_file: str = 'app_data.json', store=None):
+        if self.table_name is None:
+            self.table_name = self.__class__.__name__.replace('Repository', '').lower() + 's'
+        # 所有仓储共享同一个数据存储，仓储只是其中某张表的视图
+        self.bind(store or DataStore.open(data_file))
+
+    def bind(self, store):
+        """绑定到数据存储（切换存储后端时调用）"""
+        self.store = store
+        self.data_file = store.data_file
+        self.table = store.table(self.table_name, self.indexes, compact=self.compact,
+                                 range_indexes=self.range_indexes, search_fields=self.search_fields,
+                                 partition_by=self.partition_by)
+        self._lock = store.lock
+
+        # 标识映射：id -> 模型实例
+        self._identity: Dict[Any, T] = {}
+        self._identity_lock = threading.Lock()
+        self._identity_generation = 0
+        self._use_identity_map = getattr(store, 'cache_models', False)
 
         # When users manually edit the JSON, keep next_id consistent with existing records.
-        self._ensure_table_exists()
-        self._sync_next_id()
+        self.table.sync_next_id()
     
-    def _load_data(self) -> Dict[str, Any]:
-        """从JSON文件加载数据"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, Exception) as e:
-                print(f"Error loading data from {self.data_file}: {e}")
-                return {'in_memory_data': {}, 'next_id': {}}
-        return {'in_memory_data': {}, 'next_id': {}}
-
-    def _sync_next_id(self):
-        """Ensure next_id is at least max existing id + 1 after manual edits."""
-        in_memory = self.data.get('in_memory_data', {})
-        table_data = in_memory.get(self.table_name, [])
-        max_id = max((item.get('id', 0) for item in table_data), default=0)
-
-        current_next = self.data.get('next_id', {}).get(self.table_name, 1)
-        # If manual additions use higher IDs, bump next_id forward.
-        if max_id >= current_next:
-            self.data.setdefault('next_id', {})[self.table_name] = max_id + 1
+    def _to_model(self, item_dict: Dict[str, Any], generation: int) -> T:
+        """字典转模型对象，优先复用标识映射中的实例
+
+        generation 为读取记录之前取得的标识映射版本（self._identity_generation）。
+        写操作先改数据表、再使标识映射失效，读取之后版本有变化时记录可能已过时，不缓存。
+        """
+        if not self._use_identity_map:
+            return self._dict_to_model(item_dict)
+        item_id = item_dict.get('id')
+        model = self._identity.get(item_id)
+        if model is None:
+            model = self._dict_to_model(item_dict)
+            with self._identity_lock:
+                if item_id is not None and generation == self._identity_generation:
+                    self._identity[item_id] = model
+        return model
+
+    def _invalidate(self, item_id: Any = None):
+        """使标识映射中的条目失效，item_id 为空时清空全部"""
+        with self._identity_lock:
+            self._identity_generation += 1
+            if item_id is None:
+                self._identity.clear()
+            else:
+                self._identity.pop(item_id, None)
     
     def save_data(self):
-        """保存数据到JSON文件 - 简洁版本"""
-        with self._lock:
-            try:
-                with open(self.data_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.data, f, ensure_ascii=False, indent=4)
-                
-                # 验证保存
-                if os.path.exists(self.data_file):
-                    file_size = os.path.getsize(self.data_file)
-                    print(f"✅ 数据已保存到 {self.data_file} ({file_size} bytes)")
-                    return True
-                else:
-                    print(f"❌ 保存失败: {self.data_file} 不存在")
-                    return False
-                
-            except Exception as e:
-                print(f"❌ 保存数据时发生错误: {e}")
-                
-                return False
+        """保存数据（所有仓储共享同一个存储，一次写入全部表）"""
+        return self.store.save()
     
     def get_next_id(self) -> int:
         """获取下一个ID"""
-        with self._lock:
-            next_id = self.data['next_id'].get(self.table_name, 1)
-            self.data['next_id'][self.table_name] = next_id + 1
-            return next_id
-    
-    def _ensure_table_exists(self):
-        """确保数据表存在"""
-        if 'in_memory_data' not in self.data:
-            self.data['in_memory_data'] = {}
-        if 'next_id' not in self.data:
-            self.data['next_id'] = {}
-        if self.table_name not in self.data['in_memory_data']:
-            self.data['in_memory_data'][self.table_name] = []
+        return self.table.next_id()
+
+    def reserve_ids(self, count: int) -> range:
+        """批量创建前一次预留 count 个连续的ID"""
+        if count <= 0:
+            return range(0)
+        return self.table.reserve_ids(count)
+    
+    def seal_partitions(self, before: str) -> List[str]:
+        """把早于 before（YYYY-MM）的月份分区封存为压缩分段，返回封存的月份（未分区的表什么也不做）"""
+        seal = getattr(self.table, 'seal', None)
+        return seal(before) if seal is not None else []
     
     def get_all(self) -> List[T]:
         """获取所有记录"""
-        self._ensure_table_exists()
         items = []
-        for item_dict in self.data['in_memory_data'][self.table_name]:
+        generation = self._identity_generation
+        for item_dict in self.table.rows():
             try:
-                items.append(self._dict_to_model(item_dict))
+                items.append(self._to_model(item_dict, generation))
             except Exception as e:
                 print(f"Error converting dict to model: {e}")
         return items
     
     def get_by_id(self, item_id: int) -> Optional[T]:
         """根据ID获取记录"""
-        self._ensure_table_exists()
-        for item_dict in self.data['in_memory_data'][self.table_name]:
-            if item_dict.get('id') == item_id:
-                return self._dict_to_model(item_dict)
-        return None
+        generation = self._identity_generation
+        item_dict = self.table.get(item_id)
+        return self._to_model(item_dict, generation) if item_dict is not None else None
     
     def find(self, **filters) -> List[T]:
         """根据条件查找记录"""
-        self._ensure_table_exists()
-        results = []
-        for item_dict in self.data['in_memory_data'][self.table_name]:
-            match = True
-            for key, value in filters.items():
-                if item_dict.get(key) != value:
-                    match = False
-                    break
-            if match:
-                results.append(self._dict_to_model(item_dict))
-        return results
+        generation = self._identity_generation
+        return [self._to_model(item_dict, generation) for item_dict in self.table.find(filters)]
     
     def find_one(self, **filters) -> Optional[T]:
         """根据条件查找单个记录"""
-        results = self.find(**filters)
-        return results[0] if results else None
+        generation = self._identity_generation
+        results = self.table.find(filters, limit=1)
+        return self._to_model(results[0], generation) if results else None
+    
+    def find_range(self, field: str, lo: Any = None, hi: Any = None) -> List[T]:
+        """查找字段取值在 [lo, hi] 内的记录（边界为 None 表示不限），按取值升序排列"""
+        generation = self._identity_generation
+        return [self._to_model(item_dict, generation) for item_dict in self.table.find_range(field, lo, hi)]
+    
+    def query(self, builder: QueryBuilder) -> List[T]:
+        """执行查询构建器中的条件、排序和分页，由数据表选择最合适的索引"""
+        generation = self._identity_generation
+        return [self._to_model(item_dict, generation) for item_dict in self.table.query(*self._query_args(builder))]
+
+    def explain(self, builder: QueryBuilder) -> Dict[str, Any]:
+        """查看查询构建器对应的执行计划"""
+        return self.table.explain(*self._query_args(builder))
+
+    @staticmethod
+    def _query_args(builder: QueryBuilder) -> tuple:
+        return (builder.build(), builder.sort_field, builder.descending,
+                builder.limit_count, builder.offset_count)
+
+    @staticmethod
+    def _conditions(filters) -> List[QueryCondition]:
+        """分页筛选条件：字典表示等值条件，也可以直接传入查询构建器"""
+        if filters is None:
+            return []
+        if isinstance(filters, QueryBuilder):
+            return filters.build()
+        return [QueryCondition(field, value) for field, value in filters.items()]
+
+    def page(self, sort_key: str, page: int = 1, per_page: int = 10, filters=None,
+             descending: bool = False) -> Pagination:
+        """按 sort_key 排序后取第 page 页（超出范围时取最近的有效页）
+
+        排序字段声明了有序索引时按索引顺序读取，只取到本页为止，不需要排序整张表。
+        返回的 Pagination.items 只包含本页记录，total 为满足条件的记录总数。
+        """
+        conditions = self._conditions(filters)
+        total = self.table.count_where(conditions)
+        pages = max(1, (total + per_page - 1) // per_page)
+        page = max(1, min(page, pages))
+        generation = self._identity_generation
+        items = self.table.query(conditions, sort_key, descending, per_page, (page - 1) * per_page)
+        return Pagination([self._to_model(item_dict, generation) for item_dict in items], page, per_page, total)
+
+    def page_after(self, sort_key: str, after: Optional[tuple] = None, per_page: int = 10, filters=None,
+                   descending: bool = False) -> Tuple[List[T], Optional[tuple]]:
+        """键集分页：返回排在游标 (sort_key 取值, id) 之后的一页，以及下一页的游标
+
+        从有序索引上游标所在的位置直接开始读取，翻到很深的页也不需要跳过前面的记录。
+        已是最后一页时下一页游标为 None。
+        """
+        generation = self._identity_generation
+        items = self.table.query(self._conditions(filters), sort_key, descending, per_page, 0, after)
+        models = [self._to_model(item_dict, generation) for item_dict in items]
+        if len(items) < per_page:
+            return models, None
+        return models, (items[-1].get(sort_key), items[-1].get('id'))
+
+    def distinct(self, field: str) -> List[Any]:
+        """字段的不同取值（不含空值），升序排列"""
+        return self.table.distinct(field)
+    
+    def _search(self, fields: List[str], keyword: str, limit: Optional[int] = None) -> List[T]:
+        """在指定字段中搜索关键字，结果按匹配程度排序"""
+        generation = self._identity_generation
+        return [self._to_model(item_dict, generation) for item_dict in self.table.search(fields, keyword, limit)]
     
     def create(self, item: T) -> T:
         """创建新记录"""
-        with self._lock:
-            self._ensure_table_exists()
-            item_dict = self._model_to_dict(item)
-            self.data['in_memory_data'][self.table_name].append(item_dict)
-            return item
+        item_dict = self._model_to_dict(item)
+        item_id = item_dict.get('id')
+        if not self.events.wants(self.table_name):
+            self.table.insert(item_dict)
+        else:
+            with self._lock:
+                before = self.table.get(item_id)
+                self.table.insert(item_dict)
+            self._publish([ChangeEvent(self.table_name, 'insert' if before is None else 'update', item_id,
+                                       self._plain(before), dict(item_dict), self.store)])
+        self._invalidate(item_id)
+        return item
     
     def update(self, item_id: int, **kwargs) -> Optional[T]:
         """更新记录"""
-        with self._lock:
-            self._ensure_table_exists()
-            for item_dict in self.data['in_memory_data'][self.table_name]:
-                if item_dict.get('id') == item_id:
-                    item_dict.update(kwargs)
-                    return self._dict_to_model(item_dict)
+        # 写入前的版本：返回的模型不进入标识映射，之后的读取再按最新记录缓存
+        generation = self._identity_generation
+        if not self.events.wants(self.table_name):
+            item_dict = self.table.update(item_id, kwargs)
+        else:
+            with self._lock:
+                before = self.table.get(item_id)
+                item_dict = self.table.update(item_id, kwargs)
+            if item_dict is not None:
+                self._publish([ChangeEvent(self.table_name, 'update', item_id,
+                                           self._plain(before), self._plain(item_dict), self.store)])
+        if item_dict is None:
             return None
+        self._invalidate(item_id)
+        return self._to_model(item_dict, generation)
     
     def delete(self, item_id: int) -> bool:
         """删除记录"""
-        with self._lock:
-            self._ensure_table_exists()
-            original_len = len(self.data['in_memory_data'][self.table_name])
-            self.data['in_memory_data'][self.table_name] = [
-                item for item in self.data['in_memory_data'][self.table_name] 
-                if item.get('id') != item_id
-            ]
-            return len(self.data['in_memory_data'][self.table_name]) < original_len
+        return self._delete_where(id=item_id) > 0
+    
+    def _delete_where(self, **filters) -> int:
+        """删除满足条件的所有记录，返回删除数量"""
+        if not self.events.wants(self.table_name):
+            removed = self.table.delete_where(filters)
+        else:
+            with self._lock:
+                matched = self.table.find(filters)
+                removed = self.table.delete_where(filters)
+            self._publish([ChangeEvent(self.table_name, 'delete', item.get('id'), self._plain(item), None, self.store)
+                           for item in matched])
+        if removed:
+            self._invalidate(filters['id'] if list(filters) == ['id'] else None)
+        return removed
+
+    @staticmethod
+    def _plain(item_dict: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """事件中的记录统一为普通字典（紧凑记录转换为字典）"""
+        return dict(item_dict.items()) if item_dict is not None else None
+
+    def _publish(self, events: List[ChangeEvent]):
+        """发布变更事件：事务中推迟到提交之后，回滚时丢弃"""
+        if events:
+            self.store.after_commit(lambda: self.events.publish(events))
     
     def count(self) -> int:
         """获取记录数量"""
-        self._ensure_table_exists()
-        return len(self.data['in_memory_data'][self.table_name])
+        return self.table.count()
+
+    def count_where(self, filters=None, **equals) -> int:
+        """满足分页筛选条件（及字段等值条件）的记录数量"""
+        conditions = self._conditions(filters) + [QueryCondition(field, value) for field, value in equals.items()]
+        return self.table.count_where(conditions)
     
     def _model_to_dict(self, item: T) -> Dict[str, Any]:
         """模型对象转字典"""
@@ -164,6 +286,9 @@ class BaseRepository(Generic[T]):
 
 class UserRepository(BaseRepository[User]):
     """用户仓储类"""
+
+    indexes = ['username', 'role']
+    range_indexes = ['username']
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> User:
         return User(**item_dict)
@@ -186,6 +311,10 @@ class UserRepository(BaseRepository[User]):
 
 class StudentRepository(BaseRepository[Student]):
     """学生仓储类"""
+
+    indexes = ['student_id', 'class_name']
+    range_indexes = ['student_id']
+    search_fields = ['name', 'student_id']
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> Student:
         return Student(**item_dict)
@@ -202,18 +331,19 @@ class StudentRepository(BaseRepository[Student]):
         """根据性别获取学生列表"""
         return self.find(gender=gender)
     
-    def search(self, keyword: str) -> List[Student]:
+    def search(self, keyword: str, limit: Optional[int] = None) -> List[Student]:
         """搜索学生（姓名或学号）"""
-        self._ensure_table_exists()
-        results = []
-        for item_dict in self.data['in_memory_data'][self.table_name]:
-            if (keyword.lower() in item_dict.get('name', '').lower() or 
-                keyword.lower() in item_dict.get('student_id', '').lower()):
-                results.append(self._dict_to_model(item_dict))
-        return results
+        return self._search(self.search_fields, keyword, limit)
+
+    def search_by_name(self, keyword: str) -> List[Student]:
+        """按姓名搜索学生"""
+        return self._search(['name'], keyword)
 
 class CourseRepository(BaseRepository[Course]):
     """课程仓储类"""
+
+    indexes = ['name']
+    search_fields = ['name', 'description']
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> Course:
         return Course(**item_dict)
@@ -227,18 +357,135 @@ class CourseRepository(BaseRepository[Course]):
         courses = self.get_all()
         return [course for course in courses if course.capacity is None or course.capacity > 0]
     
-    def search(self, keyword: str) -> List[Course]:
+    def search(self, keyword: str, limit: Optional[int] = None) -> List[Course]:
         """搜索课程（名称或描述）"""
-        self._ensure_table_exists()
-        results = []
-        for item_dict in self.data['in_memory_data'][self.table_name]:
-            if (keyword.lower() in item_dict.get('name', '').lower() or 
-                keyword.lower() in item_dict.get('description', '').lower()):
-                results.append(self._dict_to_model(item_dict))
-        return results
+        return self._search(self.search_fields, keyword, limit)
+
+class EnrollmentCounts:
+    """按课程物化的选课人数，订阅选课表的变更事件增量维护，查询为 O(1)
+
+    每门课程保存选课记录的ID集合而不是单个计数，同一变更的事件重复到达不会重复计数。
+    首次查询时扫描一遍选课表建立；reconcile() 按选课表重新统计并修正偏差
+    （事件乱序到达、手工修改数据文件等），由后台任务定期执行。
+    扫描在计数锁外进行，期间到达的事件先暂存，扫描完成后再应用到新的计数上；
+    正在建立时的查询直接按索引计数，不等待。
+    其他进程也会写入的存储（不缓存模型，如多进程共享模式、SQLite）收不到全部变更，总是按索引计数。
+    """
+
+    def __init__(self, repo: 'EnrollmentRepository'):
+        self.repo = repo
+        # 课程ID -> {选课记录ID}，尚未建立时为 None
+        self._members: Optional[Dict[Any, set]] = None
+        # 扫描期间暂存的事件，不在扫描时为 None
+        self._backlog: Optional[List[ChangeEvent]] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        repo.events.subscribe(self._apply, tables=[repo.table_name])
+
+    def reset(self):
+        """丢弃计数，下次查询时重新建立（切换存储后调用）"""
+        with self._lock:
+            self._members = None
+
+    def _apply(self, event: ChangeEvent):
+        if event.source is not self.repo.store:
+            return
+        with self._lock:
+            if self._backlog is not None:
+                self._backlog.append(event)
+            if self._members is not None:
+                self._update(self._members, event)
+
+    @staticmethod
+    def _update(members: Dict[Any, set], event: ChangeEvent):
+        if event.before is not None:
+            members.get(event.before.get('course_id'), set()).discard(event.id)
+        if event.after is not None:
+            members.setdefault(event.after.get('course_id'), set()).add(event.id)
+
+    def _rebuild(self) -> Optional[Dict[Any, set]]:
+        """扫描选课表重新建立计数，返回替换前的计数（调用方需持有 _build_lock）"""
+        with self._lock:
+            self._backlog = []
+        try:
+            members: Dict[Any, set] = {}
+            for item in self.repo.table.rows():
+                members.setdefault(item.get('course_id'), set()).add(item.get('id'))
+        except BaseException:
+            with self._lock:
+                self._backlog = None
+            raise
+        with self._lock:
+            for event in self._backlog:
+                self._update(members, event)
+            self._backlog = None
+            previous, self._members = self._members, members
+        return previous
+
+    def _ensure(self) -> Optional[Dict[Any, set]]:
+        """已建立的计数，需要时建立；其他线程正在建立或存储不支持时为 None"""
+        if not self.repo._use_identity_map:
+            return None
+        members = self._members
+        if members is None and self._build_lock.acquire(blocking=False):
+            try:
+                if self._members is None:
+                    self._rebuild()
+            finally:
+                self._build_lock.release()
+            members = self._members
+        return members
+
+    def get(self, course_id: Any) -> int:
+        """课程的选课人数"""
+        members = self._ensure()
+        if members is None:
+            return self.repo.table.count_where([QueryCondition('course_id', course_id)])
+        return len(members.get(course_id, ()))
+
+    def all(self) -> Dict[Any, int]:
+        """全部课程的选课人数（没有选课记录的课程不在其中）"""
+        members = self._ensure()
+        if members is None:
+            counts: Dict[Any, int] = {}
+            for item in self.repo.table.rows():
+                counts[item.get('course_id')] = counts.get(item.get('course_id'), 0) + 1
+            return counts
+        with self._lock:
+            return {course_id: len(ids) for course_id, ids in members.items() if ids}
+
+    def reconcile(self) -> Dict[Any, Tuple[int, int]]:
+        """按选课表重新统计并替换计数，返回有偏差的课程：课程ID -> (原计数, 实际人数)"""
+        if not self.repo._use_identity_map:
+            return {}
+        with self._build_lock:
+            previous = self._rebuild()
+        if previous is None:
+            return {}
+        with self._lock:
+            actual = self._members
+            drift = {}
+            for course_id in set(previous) | set(actual):
+                counted, real = len(previous.get(course_id, ())), len(actual.get(course_id, ()))
+                if counted != real:
+                    drift[course_id] = (counted, real)
+        if drift:
+            print(f"⚠️ 选课人数计数与选课记录不一致，已修正: {drift}")
+        return drift
+
 
 class EnrollmentRepository(BaseRepository[Enrollment]):
     """选课记录仓储类"""
+
+    indexes = ['student_id', 'course_id', ('student_id', 'course_id')]
+    compact = True
+
+    def bind(self, store):
+        super().bind(store)
+        if getattr(self, 'counts', None) is None:
+            self.counts = EnrollmentCounts(self)
+        else:
+            self.counts.reset()
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> Enrollment:
         return Enrollment(**item_dict)
@@ -266,27 +513,29 @@ class EnrollmentRepository(BaseRepository[Enrollment]):
         return [enrollment.course_id for enrollment in enrollments]
     
     def get_enrollment_count(self, course_id: int) -> int:
-        """获取课程的选课人数"""
-        return len(self.get_by_course_id(course_id))
+        """获取课程的选课人数（物化计数，不读取选课记录）"""
+        return self.counts.get(course_id)
+
+    def get_enrollment_counts(self) -> Dict[int, int]:
+        """全部课程的选课人数：课程ID -> 人数"""
+        return self.counts.all()
     
     def delete_by_student_id(self, student_id: int):
         """删除学生的所有选课记录"""
-        self._ensure_table_exists()
-        self.data['in_memory_data'][self.table_name] = [
-            item for item in self.data['in_memory_data'][self.table_name] 
-            if item.get('student_id') != student_id
-        ]
+        self._delete_where(student_id=student_id)
     
     def delete_by_course_id(self, course_id: int):
         """删除课程的所有选课记录"""
-        self._ensure_table_exists()
-        self.data['in_memory_data'][self.table_name] = [
-            item for item in self.data['in_memory_data'][self.table_name] 
-            if item.get('course_id') != course_id
-        ]
+        self._delete_where(course_id=course_id)
 
 class AttendanceRepository(BaseRepository[Attendance]):
     """考勤记录仓储类"""
+
+    indexes = ['student_id', 'date', ('student_id', 'date')]
+    range_indexes = ['date']
+    compact = True
+    # 按月分区默认关闭，由配置 ATTENDANCE_PARTITIONS 开启（见 RepositoryManager.configure）
+    partition_field = 'date'
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> Attendance:
         return Attendance(**item_dict)
@@ -305,7 +554,7 @@ class AttendanceRepository(BaseRepository[Attendance]):
     
     def get_attendance_stats(self, start_date: str, end_date: str) -> Dict[str, Any]:
         """获取考勤统计"""
-        attendances = self.get_all()
+        attendances = self.find_range('date', start_date, end_date)
         stats = {
             'total': 0,
             'present': 0,
@@ -314,28 +563,27 @@ class AttendanceRepository(BaseRepository[Attendance]):
         }
         
         for attendance in attendances:
-            if start_date <= attendance.date <= end_date:
-                stats['total'] += 1
-                if attendance.status == 'present':
-                    stats['present'] += 1
-                elif attendance.status == 'absent':
-                    stats['absent'] += 1
-                elif attendance.status == 'leave':
-                    stats['leave'] += 1
+            stats['total'] += 1
+            if attendance.status == 'present':
+                stats['present'] += 1
+            elif attendance.status == 'absent':
+                stats['absent'] += 1
+            elif attendance.status == 'leave':
+                stats['leave'] += 1
         
         return stats
     
     def delete_by_student_id(self, student_id: int):
         """删除学生的所有考勤记录"""
-        self._ensure_table_exists()
-        self.data['in_memory_data'][self.table_name] = [
-            item for item in self.data['in_memory_data'][self.table_name] 
-            if item.get('student_id') != student_id
-        ]
+        self._delete_where(student_id=student_id)
 
 # ... existing code ...
 class RewardPunishmentRepository(BaseRepository[RewardPunishment]):
     """奖励处分仓储类"""    
+
+    indexes = ['student_id', 'type']
+    range_indexes = ['date']
+    compact = True
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> RewardPunishment:
         return RewardPunishment(**item_dict)
@@ -374,16 +622,14 @@ class RewardPunishmentRepository(BaseRepository[RewardPunishment]):
     
     def delete_by_student_id(self, student_id: int):
         """删除学生的所有奖励处分记录"""
-        self._ensure_table_exists()
-        self.data['in_memory_data'][self.table_name] = [
-            item for item in self.data['in_memory_data'][self.table_name] 
-            if item.get('student_id') != student_id
-        ]
+        self._delete_where(student_id=student_id)
 
 # ... existing code ...
 
 class ParentRepository(BaseRepository[Parent]):
     """家长信息仓储类"""
+
+    indexes = ['student_id']
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> Parent:
         return Parent(**item_dict)
@@ -402,39 +648,34 @@ class ParentRepository(BaseRepository[Parent]):
     
     def delete_by_student_id(self, student_id: int):
         """删除学生的所有家长信息"""
-        self._ensure_table_exists()
-        self.data['in_memory_data'][self.table_name] = [
-            item for item in self.data['in_memory_data'][self.table_name] 
-            if item.get('student_id') != student_id
-        ]
+        self._delete_where(student_id=student_id)
 
 class NoticeRepository(BaseRepository[Notice]):
     """通知仓储类"""
+
+    indexes = ['target']
+    range_indexes = ['date']
+    search_fields = ['title', 'content']
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> Notice:
         return Notice(**item_dict)
     
     def get_recent_notices(self, limit: int = 5) -> List[Notice]:
-        """获取最近的通知"""
-        notices = sorted(self.get_all(), key=lambda x: x.date, reverse=True)
-        return notices[:limit]
+        """获取最近的通知（沿日期有序索引倒序只取前 limit 条）"""
+        return self.page('date', 1, limit, descending=True).items
     
     def get_by_target(self, target: str) -> List[Notice]:
         """根据目标受众获取通知"""
         return self.find(target=target)
     
-    def search(self, keyword: str) -> List[Notice]:
+    def search(self, keyword: str, limit: Optional[int] = None) -> List[Notice]:
         """搜索通知（标题或内容）"""
-        self._ensure_table_exists()
-        results = []
-        for item_dict in self.data['in_memory_data'][self.table_name]:
-            if (keyword.lower() in item_dict.get('title', '').lower() or 
-                keyword.lower() in item_dict.get('content', '').lower()):
-                results.append(self._dict_to_model(item_dict))
-        return results
+        return self._search(self.search_fields, keyword, limit)
 
 class ScheduleRepository(BaseRepository[Schedule]):
     """排课仓储类"""
+
+    indexes = ['course_id', 'teacher_user_id', 'day_of_week']
     
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> Schedule:
         return Schedule(**item_dict)
@@ -473,15 +714,14 @@ class ScheduleRepository(BaseRepository[Schedule]):
     
     def delete_by_course_id(self, course_id: int):
         """删除课程的所有排课"""
-        self._ensure_table_exists()
-        self.data['in_memory_data'][self.table_name] = [
-            item for item in self.data['in_memory_data'][self.table_name] 
-            if item.get('course_id') != course_id
-        ]
+        self._delete_where(course_id=course_id)
 
 class LeaveRequestRepository(BaseRepository[LeaveRequest]):
     """请假申请仓储"""
 
+    indexes = ['student_id', 'status']
+    range_indexes = ['created_at']
+
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> LeaveRequest:
         return LeaveRequest(**item_dict)
 
@@ -491,13 +731,44 @@ class LeaveRequestRepository(BaseRepository[LeaveRequest]):
     def get_by_status(self, status: str) -> List[LeaveRequest]:
         return self.find(status=status)
 
-@dataclass
+    def delete_by_student_id(self, student_id: int):
+        """删除学生的所有请假申请"""
+        self._delete_where(student_id=student_id)
+
+class CoursePreferenceRepository(BaseRepository[CoursePreference]):
+    """选课志愿仓储类"""
+
+    table_name = 'course_preferences'
+    indexes = ['student_id', 'course_id', ('student_id', 'course_id')]
+    compact = True
+
+    def _dict_to_model(self, item_dict: Dict[str, Any]) -> CoursePreference:
+        return CoursePreference(**item_dict)
+
+    def get_by_student_id(self, student_id: int) -> List[CoursePreference]:
+        """学生的全部志愿，按志愿顺序排列"""
+        return sorted(self.find(student_id=student_id), key=lambda p: p.rank)
+
+    def get_preference(self, student_id: int, course_id: int) -> Optional[CoursePreference]:
+        """学生对某门课程的志愿"""
+        return self.find_one(student_id=student_id, course_id=course_id)
+
+    def delete_by_student_id(self, student_id: int):
+        """删除学生的所有志愿"""
+        self._delete_where(student_id=student_id)
+
+    def delete_by_course_id(self, course_id: int):
+        """删除课程的所有志愿"""
+        self._delete_where(course_id=course_id)
+
+    def delete_all(self) -> int:
+        """清空全部志愿（分配完成后调用），返回删除数量"""
+        return self._delete_where()
+
 class EnrollmentStatusRepository(BaseRepository[EnrollmentStatus]):
     """选课状态仓储类"""
-    
-    def __init__(self, data_file: str = 'app_data.json'):
-        super().__init__(data_file)
-        self.table_name = 'enrollment_status'
+
+    table_name = 'enrollment_status'
         
     def _dict_to_model(self, item_dict: Dict[str, Any]) -> EnrollmentStatus:
         return EnrollmentStatus(**item_dict)
@@ -537,29 +808,206 @@ class RepositoryManager:
             cls._instance._init_repositories()
         return cls._instance
     
-    def _init_repositories(self):
-        """初始化所有仓储实例"""
-        self.user_repo = UserRepository()
-        self.student_repo = StudentRepository()
-        self.course_repo = CourseRepository()
-        self.enrollment_repo = EnrollmentRepository()
-        self.attendance_repo = AttendanceRepository()
-        self.reward_punishment_repo = RewardPunishmentRepository()
-        self.parent_repo = ParentRepository()
-        self.notice_repo = NoticeRepository()
-        self.schedule_repo = ScheduleRepository()
-        self.enrollment_status_repo = EnrollmentStatusRepository()  # 添加这一行
-        self.leave_request_repo = LeaveRequestRepository()
+    def _init_repositories(self, data_file: str = 'app_data.json'):
+        """初始化所有仓储实例（共享同一个数据存储）"""
+        self.json_store = DataStore.open(data_file)
+        self.store = self.json_store
+        # 各仓储发布数据变更事件的总线
+        self.events = event_bus
+        self.user_repo = UserRepository(store=self.store)
+        self.student_repo = StudentRepository(store=self.store)
+        self.course_repo = CourseRepository(store=self.store)
+        self.enrollment_repo = EnrollmentRepository(store=self.store)
+        self.attendance_repo = AttendanceRepository(store=self.store)
+        self.reward_punishment_repo = RewardPunishmentRepository(store=self.store)
+        self.parent_repo = ParentRepository(store=self.store)
+        self.notice_repo = NoticeRepository(store=self.store)
+        self.schedule_repo = ScheduleRepository(store=self.store)
+        self.enrollment_status_repo = EnrollmentStatusRepository(store=self.store)  # 添加这一行
+        self.leave_request_repo = LeaveRequestRepository(store=self.store)
+        self.course_preference_repo = CoursePreferenceRepository(store=self.store)
+        # 各线程所在的服务写操作层数，见 autosave()
+        self._local = threading.local()
+    
+    def configure(self, config: Dict[str, Any]):
+        """根据应用配置选择存储后端并调整持久化方式"""
+        if config.get('STORAGE_BACKEND', 'json') == 'sqlite':
+            # 首次使用时从当前JSON数据文件导入
+            store = SqliteStore.open(config.get('SQLITE_FILE', 'app_data.db'), seed_file=self.json_store.data_file)
+        else:
+            if config.get('STORAGE_LAYOUT', 'single') == 'split':
+                # 每张表一个文件，首次使用时从当前JSON数据文件拆分
+                store = DataStore.open(config.get('DATA_DIR', 'data'), layout='split',
+                                       seed_file=self.json_store.data_file)
+            else:
+                store = self.json_store
+            store.wal_compact_bytes = config.get('WAL_COMPACT_BYTES', store.wal_compact_bytes)
+            store.group_commit_window = config.get('GROUP_COMMIT_WINDOW', store.group_commit_window)
+            store.binary_snapshot = config.get('BINARY_SNAPSHOT', store.binary_snapshot)
+            if config.get('MULTI_PROCESS', False):
+                # 多个 worker 进程共用数据文件：文件锁串行写入，WAL同步变更
+                store.set_shared()
+            else:
+                store.set_mode(config.get('PERSISTENCE_MODE', 'snapshot'))
+        
+        # 共享模式下存储不再允许缓存模型，需要重新绑定
+        if store is not self.store or self.user_repo._use_identity_map != store.cache_models:
+            self._bind_store(store)
+        if config.get('FILE_WATCH_INTERVAL', 0):
+            self.start_file_watcher(config['FILE_WATCH_INTERVAL'])
+        if config.get('ATTENDANCE_PARTITIONS', False):
+            self.enable_partitions()
+        elif any(name.startswith(f'{self.attendance_repo.table_name}@')
+                 for name in getattr(self.store, 'table_names', set)()):
+            print("⚠️ 数据文件中的考勤已按月分区，请设置 ATTENDANCE_PARTITIONS = True，否则这些考勤记录不可见")
+        if config.get('ARCHIVE_KEEP_MONTHS', 0):
+            if self.attendance_repo.partition_by is None:
+                print("⚠️ 封存历史考勤需要先开启 ATTENDANCE_PARTITIONS，已跳过")
+            else:
+                self.start_archiver(config['ARCHIVE_KEEP_MONTHS'])
+        if config.get('COUNTER_RECONCILE_INTERVAL', 0):
+            self.start_counter_reconciler(config['COUNTER_RECONCILE_INTERVAL'])
+    
+    def enable_partitions(self):
+        """考勤改为按月分区存储：原有记录在首次访问时迁移到各月份的分区，之后不能再改回"""
+        repo = self.attendance_repo
+        if repo.partition_by is None:
+            repo.partition_by = repo.partition_field
+            repo.bind(self.store)
+
+    def _bind_store(self, store):
+        """把所有仓储切换到新的数据存储（服务层持有的仓储实例保持不变）"""
+        for attr in dir(self):
+            if attr.endswith('_repo'):
+                getattr(self, attr).bind(store)
+        self.store = store
     
     def save_all(self):
-        """保存所有仓储数据"""
-        # 获取所有仓储属性
-        repos = [getattr(self, attr) for attr in dir(self) if attr.endswith('_repo')]
-        
-        # 保存每个仓储的数据
-        for repo in repos:
-            if hasattr(repo, 'save_data'):
-                repo.save_data()
+        """保存所有仓储数据（共享存储只需写入一次）"""
+        return self.store.save()
+
+    def defer_saves(self):
+        """当前线程之后的保存推迟到 flush()（请求开始时调用）"""
+        self.store.defer_saves()
+
+    def flush(self) -> bool:
+        """把推迟期间累积的变更一次性写盘（没有变更时不写）"""
+        return self.store.flush()
+
+    def refresh(self) -> bool:
+        """读入其他进程写入的变更（多进程部署时在请求开始时调用）"""
+        return self.store.refresh()
+
+    def reload_external_changes(self) -> List[str]:
+        """重新加载被手工修改的表，并清空对应仓储的标识映射，返回这些表名"""
+        tables = self.store.reload_external_changes()
+        if tables:
+            # 分区表 <表名>@<月份> 属于同一个仓储
+            names = {name.partition('@')[0] for name in tables}
+            for attr in dir(self):
+                if attr.endswith('_repo') and getattr(self, attr).table_name in names:
+                    getattr(self, attr)._invalidate()
+            if self.enrollment_repo.table_name in names:
+                self.reconcile_counters()
+        return tables
+
+    def reconcile_counters(self) -> Dict[Any, Tuple[int, int]]:
+        """按选课记录核对物化的选课人数，返回修正过的课程：课程ID -> (原计数, 实际人数)"""
+        return self.enrollment_repo.counts.reconcile()
+
+    def start_counter_reconciler(self, interval: float = 600.0):
+        """启动后台线程，每隔 interval 秒核对一次物化计数（只启动一次）"""
+        if getattr(self, '_reconciler', None) is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reconcile_counters()
+                except Exception as e:
+                    print(f"❌ 核对选课人数时发生错误: {e}")
+
+        self._reconciler = threading.Thread(target=run, name='counter-reconciler', daemon=True)
+        self._reconciler.start()
+
+    def start_file_watcher(self, interval: float = 2.0):
+        """启动后台线程，每隔 interval 秒检查一次数据文件是否被外部修改（只启动一次）"""
+        if getattr(self, '_watcher', None) is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_external_changes()
+                except Exception as e:
+                    print(f"❌ 检查数据文件修改时发生错误: {e}")
+
+        self._watcher = threading.Thread(target=run, name='data-file-watcher', daemon=True)
+        self._watcher.start()
+
+    def archive_closed_months(self, keep_months: int = 2) -> Dict[str, List[str]]:
+        """封存各分区仓储中早于最近 keep_months 个月（含本月）的月份，返回 表名 -> 封存的月份"""
+        today = datetime.date.today()
+        months = today.year * 12 + today.month - keep_months
+        before = f'{months // 12:04d}-{months % 12 + 1:02d}'
+        sealed = {}
+        for attr in dir(self):
+            if attr.endswith('_repo'):
+                repo = getattr(self, attr)
+                months_sealed = repo.seal_partitions(before)
+                if months_sealed:
+                    sealed[repo.table_name] = months_sealed
+        return sealed
+
+    def start_archiver(self, keep_months: int = 2, interval: float = 24 * 3600):
+        """启动后台线程，启动时和之后每隔 interval 秒封存一次已结束的月份（只启动一次）"""
+        if getattr(self, '_archiver', None) is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.archive_closed_months(keep_months)
+                except Exception as e:
+                    print(f"❌ 封存历史分区时发生错误: {e}")
+                time.sleep(interval)
+
+        self._archiver = threading.Thread(target=run, name='partition-archiver', daemon=True)
+        self._archiver.start()
+
+    @contextmanager
+    def transaction(self):
+        """跨仓储的工作单元：块内各仓储的变更在退出时一次性保存，抛出异常时全部撤销
+
+        用法：with repo_manager.transaction(): ...（块内不需要再调用 save_data）
+        """
+        try:
+            with self.store.transaction():
+                yield self
+        except BaseException:
+            # 回滚后标识映射中可能缓存了未提交的模型
+            for attr in dir(self):
+                if attr.endswith('_repo'):
+                    getattr(self, attr)._invalidate()
+            raise
+
+    @contextmanager
+    def autosave(self):
+        """服务写操作的边界：最外层的写操作结束时保存一次
+
+        请求中的保存已推迟到请求结束时的 flush()，这里不写盘；脚本、后台线程等请求之外的调用
+        不需要再自己调用 save_all()。嵌套的写操作只在最外层保存。
+        """
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        try:
+            yield self
+        finally:
+            self._local.depth = depth
+            if depth == 0 and self.store.has_unsaved_changes():
+                self.store.save()
     
     def init_default_data(self):
         """初始化默认数据"""
@@ -6,7 +6,7 @@ import io
 from flask import render_template, request, redirect, url_for, session, flash, g, jsonify, make_response
 from functools import wraps
 
-from models import Validator, BusinessException
+from models import Validator, BusinessException, Pagination
 from services import service_manager
 
 def setup_routes(app, service_manager):
@@ -55,6 +55,13 @@ def setup_routes(app, service_manager):
             return view(*args, **kwargs)
         return wrapped_view
 
+    def paginate(items, page, per_page):
+        """对已在内存中的少量结果分页（超出范围时取最近的有效页），返回的 items 只含本页"""
+        total = len(items)
+        page = max(1, min(page, (total + per_page - 1) // per_page or 1))
+        start = (page - 1) * per_page
+        return Pagination(items[start:start + per_page], page, per_page, total)
+
     # === 认证路由 ===
     @app.route('/login', methods=['GET', 'POST'])
     def login():
@@ -125,38 +132,28 @@ def setup_routes(app, service_manager):
         page = request.args.get('page', 1, type=int) or 1
         page_size = 10
         
-        # 获取所有学生
-        all_students = student_service.get_all_students()
-        
-        # 提取所有唯一班级名称
-        unique_classes = list(set([s.class_name for s in all_students if s.class_name]))
-        unique_classes.sort()
+        # 提取所有唯一班级名称（直接取班级索引的键）
+        unique_classes = [c for c in student_service.student_repo.distinct('class_name') if c]
         
-        # 根据班级筛选
-        if class_filter:
-            all_students = [s for s in all_students if s.class_name == class_filter]
-        
-        # 根据姓名搜索
         if search_query:
-            all_students = [s for s in all_students if search_query.lower() in s.name.lower()]
-        
-        students_sorted = sorted(all_students, key=lambda x: x.student_id)
-        total_students = len(students_sorted)
-        total_pages = (total_students + page_size - 1) // page_size if total_students else 1
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * page_size
-        end = start + page_size
-        students_page = students_sorted[start:end]
+            # 根据姓名搜索（倒排索引），再按班级筛选
+            matched = [s for s in student_service.search_students_by_name(search_query)
+                       if not class_filter or s.class_name == class_filter]
+            pagination = paginate(sorted(matched, key=lambda x: x.student_id), page, page_size)
+        else:
+            # 按学号有序索引只取本页
+            filters = {'class_name': class_filter} if class_filter else None
+            pagination = student_service.student_repo.page('student_id', page, page_size, filters)
 
         return render_template(
             'students.html',
-            students=[s.to_dict() for s in students_page],
+            students=[s.to_dict() for s in pagination.items],
             class_filter=class_filter,
             search_query=search_query,
             unique_classes=unique_classes,
-            page=page,
-            total_pages=total_pages,
-            total_students=total_students,
+            page=pagination.page,
+            total_pages=pagination.pages or 1,
+            total_students=pagination.total,
             page_size=page_size,
         )
 
@@ -310,6 +307,7 @@ def setup_routes(app, service_manager):
         
         processed_courses = []
         current_student_info_id = None
+        matched_ids = {c.id for c in course_service.search_courses(search)} if search else None
 
         # 如果是学生用户，获取关联的学生信息ID
         if session.get('role') == 'student':
@@ -319,8 +317,7 @@ def setup_routes(app, service_manager):
 
         for course in all_courses:
             # 搜索筛选
-            if search and search.lower() not in course.name.lower() and \
-            (not course.description or search.lower() not in course.description.lower()):
+            if matched_ids is not None and course.id not in matched_ids:
                 continue
                 
             course_data = course.to_dict()
@@ -338,8 +335,14 @@ def setup_routes(app, service_manager):
             if current_student_info_id:
                 course_data['is_enrolled_by_current_user'] = enrollment_service.is_student_enrolled(
                     current_student_info_id, course.id)
+                course_data['preference_rank'] = enrollment_service.get_preference_rank(
+                    current_student_info_id, course.id)
+                course_data['enrollment_state'] = enrollment_service.get_enrollment_state(
+                    current_student_info_id, course.id)
             else:
                 course_data['is_enrolled_by_current_user'] = False
+                course_data['preference_rank'] = None
+                course_data['enrollment_state'] = None
 
             processed_courses.append(course_data)
         
@@ -427,7 +430,7 @@ def setup_routes(app, service_manager):
         
         student_info_id = current_user.student_info_id
 
-        success, enrollment, message = enrollment_service.enroll_student(student_info_id, id)
+        success, enrollment, message = enrollment_service.request_enrollment(student_info_id, id)
         if success:
             g.data_modified = True
             flash(message, 'success')
@@ -454,7 +457,7 @@ def setup_routes(app, service_manager):
         
         student_info_id = current_user.student_info_id
 
-        success, message = enrollment_service.unenroll_student(student_info_id, id)
+        success, message = enrollment_service.withdraw_enrollment(student_info_id, id)
         if success:
             g.data_modified = True
             flash(message, 'success')
@@ -572,7 +575,6 @@ def setup_routes(app, service_manager):
         try:
             success = enrollment_service.enrollment_repo.delete(enrollment_id)
             if success:
-                enrollment_service.enrollment_repo.save_data()
                 g.data_modified = True
                 flash('选课记录删除成功！', 'success')
             else:
@@ -591,61 +593,37 @@ def setup_routes(app, service_manager):
         leave_service = service_manager.leave_service
         user_service = service_manager.user_service
         
-        # 获取所有考勤记录并关联学生信息
-        attendance_records = []
-        for attendance in attendance_service.attendance_repo.get_all():
-            student = student_service.get_student_by_id(attendance.student_id)
-            if student:
-                record_data = attendance.to_dict()
-                record_data['student_name'] = student.name
-                record_data['student_id_str'] = student.student_id
-                attendance_records.append(record_data)
-        
-        # 按日期和姓名排序（最新在前）
-        attendance_records = sorted(attendance_records, key=lambda x: (x['date'], x['student_name']), reverse=True)
-        
         # 获取查询参数进行筛选和分页
         start_date = request.args.get('start_date', '')
         end_date = request.args.get('end_date', '')
         page = request.args.get('page', 1, type=int) or 1
         page_size = 10
         
-        # 根据日期范围筛选
-        filtered_records = attendance_records
-        if start_date and end_date:
-            filtered_records = [r for r in attendance_records if start_date <= r['date'] <= end_date]
-        elif start_date:
-            filtered_records = [r for r in attendance_records if start_date <= r['date']]
-        elif end_date:
-            filtered_records = [r for r in attendance_records if r['date'] <= end_date]
-
-        total_records = len(filtered_records)
-        total_pages = (total_records + page_size - 1) // page_size if total_records else 1
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_records = filtered_records[start:end]
+        # 按日期范围筛选，按日期和姓名排序（最新在前），只关联到本页为止的记录
+        pagination = attendance_service.page_attendance(start_date, end_date, page, page_size)
+        paginated_records = []
+        for attendance, student in pagination.items:
+            record_data = attendance.to_dict()
+            record_data['student_name'] = student.name
+            record_data['student_id_str'] = student.student_id
+            paginated_records.append(record_data)
         
-        # 请假审批列表（仅教师/管理员）
+        # 请假审批列表（仅教师/管理员），同样只取本页并只关联本页引用的学生和审批人
         hide_processed = request.args.get('hide_processed', '1') == '1'
-        leaves_raw = leave_service.get_all_leaves()
-        students_map = {s.id: s for s in student_service.get_all_students()}
-        approver_map = {u.id: u for u in user_service.get_all_users()}
+        leave_page = request.args.get('leave_page', 1, type=int) or 1
+        leave_pagination = leave_service.page_leaves(leave_page, page_size, pending_only=hide_processed)
         leaves = []
-        for leave in leaves_raw:
-            if hide_processed and leave.status != 'pending':
-                continue
+        for leave in leave_pagination.items:
             item = leave.to_dict()
-            student = students_map.get(leave.student_id)
+            student = student_service.get_student_by_id(leave.student_id)
             if student:
                 item['student_name'] = student.name
                 item['student_id_str'] = student.student_id
             if leave.approver_id:
-                approver = approver_map.get(leave.approver_id)
+                approver = user_service.get_user_by_id(leave.approver_id)
                 if approver:
                     item['approver_name'] = approver.username
             leaves.append(item)
-        leaves = sorted(leaves, key=lambda x: x.get('created_at', ''), reverse=True)
 
         # 获取学生列表用于添加模态框
         students = sorted(student_service.get_all_students(), key=lambda x: x.name)
@@ -657,9 +635,11 @@ def setup_routes(app, service_manager):
                     end_date=end_date,
                     leaves=leaves,
                     hide_processed=hide_processed,
-                    page=page,
-                    total_pages=total_pages,
-                    total_records=total_records,
+                    leave_page=leave_pagination.page,
+                    leave_total_pages=leave_pagination.pages or 1,
+                    page=pagination.page,
+                    total_pages=pagination.pages or 1,
+                    total_records=pagination.total,
                     page_size=page_size)
 
     @app.route('/attendance/add', methods=['POST'])
@@ -732,7 +712,6 @@ def setup_routes(app, service_manager):
         try:
             success = attendance_service.attendance_repo.delete(id)
             if success:
-                attendance_service.attendance_repo.save_data()
                 g.data_modified = True
                 flash('考勤记录删除成功！', 'success')
             else:
@@ -858,24 +837,16 @@ def setup_routes(app, service_manager):
         rp_service = service_manager.reward_punishment_service
         student_service = service_manager.student_service
         
-        records = []
-        for rp in rp_service.reward_punishment_repo.get_all():
-            student = student_service.get_student_by_id(rp.student_id)
-            if student:
-                record_data = rp.to_dict()
-                record_data['student_name'] = student.name
-                record_data['student_id'] = student.student_id
-                records.append(record_data)
-        
-        records = sorted(records, key=lambda x: (x['date'], x['student_name']), reverse=True)
+        # 按日期和姓名排序（最新在前），只关联到本页为止的记录
         page = request.args.get('page', 1, type=int) or 1
         page_size = 10
-        total_records = len(records)
-        total_pages = (total_records + page_size - 1) // page_size if total_records else 1
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * page_size
-        end = start + page_size
-        records_page = records[start:end]
+        pagination = rp_service.page_records(page, page_size)
+        records_page = []
+        for rp, student in pagination.items:
+            record_data = rp.to_dict()
+            record_data['student_name'] = student.name
+            record_data['student_id'] = student.student_id
+            records_page.append(record_data)
         
         # 获取学生列表用于下拉选择
         students = sorted(student_service.get_all_students(), key=lambda x: x.name)
@@ -887,9 +858,9 @@ def setup_routes(app, service_manager):
                     records=records_page, 
                     students=[s.to_dict() for s in students],
                     today=today,
-                    page=page,
-                    total_pages=total_pages,
-                    total_records=total_records,
+                    page=pagination.page,
+                    total_pages=pagination.pages or 1,
+                    total_records=pagination.total,
                     page_size=page_size)
 
     @app.route('/rewards_punishments/add', methods=['POST'])
@@ -953,7 +924,6 @@ def setup_routes(app, service_manager):
         try:
             success = rp_service.reward_punishment_repo.delete(id)
             if success:
-                rp_service.reward_punishment_repo.save_data()
                 g.data_modified = True
                 flash('奖励/处分记录删除成功！', 'success')
             else:
@@ -975,23 +945,17 @@ def setup_routes(app, service_manager):
             flash('无法获取您的学生信息。', 'danger')
             return redirect(url_for('index'))
         
-        records = rp_service.get_student_records(current_user.student_info_id)
-        records = sorted(records, key=lambda x: x.date, reverse=True)
         page = request.args.get('page', 1, type=int) or 1
         page_size = 10
-        total_records = len(records)
-        total_pages = (total_records + page_size - 1) // page_size if total_records else 1
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * page_size
-        end = start + page_size
-        records_page = records[start:end]
+        pagination = rp_service.reward_punishment_repo.page(
+            'date', page, page_size, {'student_id': current_user.student_info_id}, descending=True)
         
         return render_template('rewards_punishments.html', 
-                    records=[r.to_dict() for r in records_page], 
+                    records=[r.to_dict() for r in pagination.items], 
                     is_student_view=True,
-                    page=page,
-                    total_pages=total_pages,
-                    total_records=total_records,
+                    page=pagination.page,
+                    total_pages=pagination.pages or 1,
+                    total_records=pagination.total,
                     page_size=page_size)
 
     @app.route('/rewards_punishments/statistics')
@@ -1133,7 +1097,6 @@ def setup_routes(app, service_manager):
         try:
             success = parent_service.parent_repo.delete(id)
             if success:
-                parent_service.parent_repo.save_data()  # 添加这行来保存数据
                 g.data_modified = True
                 flash('家长信息删除成功！', 'success')
             else:
@@ -1151,39 +1114,32 @@ def setup_routes(app, service_manager):
         notice_service = service_manager.notice_service
         user_role = session.get('role')
         
-        # 根据用户角色获取可见通知
-        notices_list = notice_service.get_notices_for_user(user_role)
-        
         # 搜索和筛选功能
         search = request.args.get('search', '')
         target_filter = request.args.get('target', '')
-        
-        # 搜索功能
-        if search:
-            notices_list = [n for n in notices_list if search.lower() in n.title.lower() or search.lower() in n.content.lower()]
-        
-        # 目标筛选（仅对教师和管理员有效）
-        if target_filter and user_role in ['admin', 'teacher']:
-            notices_list = [n for n in notices_list if n.target == target_filter]
-        
-        notices_list = sorted(notices_list, key=lambda x: x.date, reverse=True)
         page = request.args.get('page', 1, type=int) or 1
         page_size = 10
-        total_records = len(notices_list)
-        total_pages = (total_records + page_size - 1) // page_size if total_records else 1
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * page_size
-        end = start + page_size
-        notices_page = notices_list[start:end]
+        # 目标筛选（仅对教师和管理员有效）
+        target = target_filter if user_role in ['admin', 'teacher'] else ''
+        
+        if search:
+            # 搜索结果（倒排索引）中保留该角色可见的通知
+            visible_ids = {n.id for n in notice_service.get_notices_for_user(user_role)}
+            notices_list = [n for n in notice_service.search_notices(search)
+                            if n.id in visible_ids and (not target or n.target == target)]
+            pagination = paginate(sorted(notices_list, key=lambda x: x.date, reverse=True), page, page_size)
+        else:
+            # 沿日期有序索引倒序只取本页
+            pagination = notice_service.get_notices_page(user_role, page, page_size, target)
 
         return render_template('notices.html', 
-                    notices=[n.to_dict() for n in notices_page], 
+                    notices=[n.to_dict() for n in pagination.items], 
                     user_role=user_role,
                     search=search,
                     target_filter=target_filter,
-                    page=page,
-                    total_pages=total_pages,
-                    total_records=total_records,
+                    page=pagination.page,
+                    total_pages=pagination.pages or 1,
+                    total_records=pagination.total,
                     page_size=page_size)
 
     @app.route('/notices/add', methods=['POST'])
@@ -1248,7 +1204,6 @@ def setup_routes(app, service_manager):
         try:
             success = notice_service.notice_repo.delete(id)
             if success:
-                notice_service.notice_repo.save_data()
                 g.data_modified = True
                 flash('通知删除成功！', 'success')
             else:
@@ -1266,16 +1221,10 @@ def setup_routes(app, service_manager):
         user_service = service_manager.user_service
         student_service = service_manager.student_service
         
-        # 获取所有用户
-        users_list = sorted(user_service.get_all_users(), key=lambda x: x.username)
+        # 按用户名有序索引只取本页
         page = request.args.get('page', 1, type=int) or 1
         page_size = 10
-        total_records = len(users_list)
-        total_pages = (total_records + page_size - 1) // page_size if total_records else 1
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * page_size
-        end = start + page_size
-        users_page = users_list[start:end]
+        pagination = user_service.user_repo.page('username', page, page_size)
         
         # 获取所有学生用于下拉选择
         students_list = sorted(student_service.get_all_students(), key=lambda x: x.name)
@@ -1285,15 +1234,15 @@ def setup_routes(app, service_manager):
         for student in students_list:
             students_dict[student.id] = student.to_dict()
         
-        print(f"📊 路由调试: 用户数量={len(users_list)}, 学生数量={len(students_list)}")
+        print(f"📊 路由调试: 用户数量={pagination.total}, 学生数量={len(students_list)}")
         
         return render_template('users.html', 
-                    users=[u.to_dict() for u in users_page], 
+                    users=[u.to_dict() for u in pagination.items], 
                     students=[s.to_dict() for s in students_list],
                     students_dict=students_dict,
-                    page=page,
-                    total_pages=total_pages,
-                    total_records=total_records,
+                    page=pagination.page,
+                    total_pages=pagination.pages or 1,
+                    total_records=pagination.total,
                     page_size=page_size)
 
     @app.route('/users/add', methods=['POST'])
@@ -1553,7 +1502,6 @@ def setup_routes(app, service_manager):
         try:
             success = schedule_service.schedule_repo.delete(id)
             if success:
-                schedule_service.schedule_repo.save_data()
                 g.data_modified = True
                 flash('排课删除成功！', 'success')
             else:
@@ -1864,9 +1812,23 @@ def setup_routes(app, service_manager):
     @app.route('/api/students')
     @login_required
     def api_students():
-        """学生数据API"""
-        students = service_manager.student_service.get_all_students()
-        return jsonify([s.to_dict() for s in students])
+        """学生数据API
+
+        传入 limit 时按学号键集分页，返回本页和下一页游标（after/after_id，最后一页为空）。
+        """
+        limit = request.args.get('limit', type=int)
+        if not limit:
+            students = service_manager.student_service.get_all_students()
+            return jsonify([s.to_dict() for s in students])
+        after = None
+        if 'after_id' in request.args:
+            after = (request.args.get('after'), request.args.get('after_id', type=int))
+        students, cursor = service_manager.student_service.student_repo.page_after('student_id', after, limit)
+        return jsonify({
+            'items': [s.to_dict() for s in students],
+            'after': cursor[0] if cursor else None,
+            'after_id': cursor[1] if cursor else None,
+        })
 
     @app.route('/api/courses')
     @login_required
@@ -1,9 +1,22 @@
 # services.py
 import datetime
+import functools
 from typing import List, Dict, Any, Optional, Tuple
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import *
 from repositories import repo_manager
+from enrollment_lottery import EnrollmentLottery
+from enrollment_rush import EnrollmentRush
+
+
+def _writes(method):
+    """服务的写操作：在 repo_manager.autosave() 中执行，请求之外调用时结束后自动保存"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.repo_manager.autosave():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class EnrollmentStatus:
     """选课状态模型类"""
@@ -18,6 +31,40 @@ class BaseService:
     def __init__(self):
         self.repo_manager = repo_manager
     
+    def _page_by_date_and_student(self, repo, page: int, per_page: int, filters=None) -> Pagination:
+        """按 (日期, 学生姓名) 倒序分页关联学生的记录，学生已不存在的记录不显示、不计入总数
+
+        结果与关联全部记录后整体排序相同：沿日期有序索引倒序分批读取，每个日期的记录读完后按学生姓名排序，
+        取够本页即停。返回的 Pagination.items 为 (记录, 学生) 二元组。
+        """
+        student_repo = self.repo_manager.student_repo
+        orphans = [sid for sid in repo.distinct('student_id') if student_repo.get_by_id(sid) is None]
+        total = repo.count_where(filters) - sum(repo.count_where(filters, student_id=sid) for sid in orphans)
+        pages = max(1, (total + per_page - 1) // per_page)
+        page = max(1, min(page, pages))
+        needed = page * per_page
+
+        ordered: List[Tuple[Any, Any]] = []
+        group: List[Tuple[Any, Any]] = []
+        group_date = None
+        after = None
+        while len(ordered) < needed:
+            batch, after = repo.page_after('date', after, per_page, filters, descending=True)
+            for record in batch:
+                if record.date != group_date:
+                    ordered += sorted(group, key=lambda pair: pair[1].name, reverse=True)
+                    group, group_date = [], record.date
+                    if len(ordered) >= needed:
+                        break
+                student = student_repo.get_by_id(record.student_id)
+                if student is not None:
+                    group.append((record, student))
+            else:
+                if after is None:
+                    ordered += sorted(group, key=lambda pair: pair[1].name, reverse=True)
+                    break
+        return Pagination(ordered[(page - 1) * per_page:needed], page, per_page, total)
+
     def _validate_required_fields(self, data: Dict[str, Any], required_fields: List[str]) -> Tuple[bool, str]:
         """验证必填字段"""
         for field in required_fields:
@@ -48,6 +95,7 @@ class UserService(BaseService):
         """获取所有用户"""
         return self.user_repo.get_all()
     
+    @_writes
     def create_user(self, user_data: Dict[str, Any]) -> Tuple[bool, Optional[User], str]:
         """创建用户 - 修复学生验证"""
         print(f"🔧 开始创建用户: {user_data.get('username')}")
@@ -98,9 +146,7 @@ class UserService(BaseService):
             
             created_user = self.user_repo.create(user)
             
-            # 立即保存数据
-            self.user_repo.save_data()
-            print(f"💾 用户数据已保存: {created_user.username}")
+            print(f"💾 用户已创建: {created_user.username}")
             
             return True, created_user, '用户创建成功'
             
@@ -108,6 +154,7 @@ class UserService(BaseService):
             print(f"❌ 创建用户时发生错误: {e}")
             return False, None, f'创建用户时发生错误: {str(e)}'
     
+    @_writes
     def update_user(self, user_id: int, user_data: Dict[str, Any]) -> Tuple[bool, Optional[User], str]:
         """更新用户信息 - 修复版本"""
         print(f"🔧 开始更新用户 (ID: {user_id}): {user_data.get('username')}")
@@ -152,8 +199,6 @@ class UserService(BaseService):
             updated_user = self.user_repo.update(user_id, **update_data)
             
             if updated_user:
-                # 立即保存数据
-                self.user_repo.save_data()
                 print(f"💾 用户数据已更新: {updated_user.username}")
                 return True, updated_user, '用户信息更新成功'
             else:
@@ -163,6 +208,7 @@ class UserService(BaseService):
             print(f"❌ 更新用户时发生错误: {e}")
             return False, None, f'更新用户时发生错误: {str(e)}'
     
+    @_writes
     def delete_user(self, user_id: int, current_user_id: int) -> Tuple[bool, str]:
         """删除用户"""
         if user_id == current_user_id:
@@ -175,8 +221,6 @@ class UserService(BaseService):
         try:
             success = self.user_repo.delete(user_id)
             if success:
-                # 立即保存数据
-                self.user_repo.save_data()
                 print(f"💾 用户删除完成 (ID: {user_id})")
                 return True, '用户删除成功'
             else:
@@ -224,6 +268,7 @@ class StudentService(BaseService):
         """根据学号获取学生"""
         return self.student_repo.get_by_student_id(student_id_str)
     
+    @_writes
     def create_student(self, student_data: Dict[str, Any]) -> Tuple[bool, Optional[Student], str]:
         """创建学生"""
         # 验证必填字段
@@ -260,12 +305,12 @@ class StudentService(BaseService):
             )
             
             created_student = self.student_repo.create(student)
-            self.student_repo.save_data()
             return True, created_student, '学生创建成功'
             
         except Exception as e:
             return False, None, f'创建学生时发生错误: {str(e)}'
 
+    @_writes
     def import_students_from_csv(self, file_stream) -> Dict[str, Any]:
         """从CSV批量导入学生，期望UTF-8带表头。
         必填: name, gender, age, student_id; 可选: contact_phone, family_info, class_name, homeroom_teacher
@@ -315,6 +360,7 @@ class StudentService(BaseService):
 
         return results
     
+    @_writes
     def update_student(self, student_id: int, student_data: Dict[str, Any]) -> Tuple[bool, Optional[Student], str]:
         """更新学生"""
         existing_student = self.student_repo.get_by_id(student_id)
@@ -348,7 +394,6 @@ class StudentService(BaseService):
             
             updated_student = self.student_repo.update(student_id, **update_data)
             if updated_student:
-                self.student_repo.save_data()
                 return True, updated_student, '学生更新成功'
             else:
                 return False, None, '更新学生失败'
@@ -356,6 +401,7 @@ class StudentService(BaseService):
         except Exception as e:
             return False, None, f'更新学生时发生错误: {str(e)}'
     
+    @_writes
     def delete_student(self, student_id: int) -> Tuple[bool, str]:
         """删除学生（级联删除相关数据）"""
         existing_student = self.student_repo.get_by_id(student_id)
@@ -363,16 +409,16 @@ class StudentService(BaseService):
             return False, '学生不存在'
         
         try:
-            # 级联删除相关数据
-            self.enrollment_repo.delete_by_student_id(student_id)
-            self.attendance_repo.delete_by_student_id(student_id)
-            self.reward_punishment_repo.delete_by_student_id(student_id)
-            self.parent_repo.delete_by_student_id(student_id)
-            
-            # 删除学生
-            success = self.student_repo.delete(student_id)
+            # 级联删除与删除学生在同一个事务中完成，只保存一次，出错时全部撤销
+            with self.repo_manager.transaction():
+                self.enrollment_repo.delete_by_student_id(student_id)
+                self.repo_manager.course_preference_repo.delete_by_student_id(student_id)
+                self.attendance_repo.delete_by_student_id(student_id)
+                self.reward_punishment_repo.delete_by_student_id(student_id)
+                self.parent_repo.delete_by_student_id(student_id)
+                self.repo_manager.leave_request_repo.delete_by_student_id(student_id)
+                success = self.student_repo.delete(student_id)
             if success:
-                self.student_repo.save_data()
                 return True, '学生删除成功'
             else:
                 return False, '删除学生失败'
@@ -380,9 +426,13 @@ class StudentService(BaseService):
         except Exception as e:
             return False, f'删除学生时发生错误: {str(e)}'
     
-    def search_students(self, keyword: str) -> List[Student]:
+    def search_students(self, keyword: str, limit: Optional[int] = None) -> List[Student]:
         """搜索学生"""
-        return self.student_repo.search(keyword)
+        return self.student_repo.search(keyword, limit)
+    
+    def search_students_by_name(self, keyword: str) -> List[Student]:
+        """按姓名搜索学生"""
+        return self.student_repo.search_by_name(keyword)
     
     def get_students_by_class(self, class_name: str) -> List[Student]:
         """根据班级获取学生"""
@@ -405,6 +455,7 @@ class CourseService(BaseService):
         """根据ID获取课程"""
         return self.course_repo.get_by_id(course_id)
     
+    @_writes
     def create_course(self, course_data: Dict[str, Any]) -> Tuple[bool, Optional[Course], str]:
         """创建课程"""
         # 验证必填字段
@@ -437,12 +488,12 @@ class CourseService(BaseService):
             )
             
             created_course = self.course_repo.create(course)
-            self.course_repo.save_data()
             return True, created_course, '课程创建成功'
             
         except Exception as e:
             return False, None, f'创建课程时发生错误: {str(e)}'
     
+    @_writes
     def update_course(self, course_id: int, course_data: Dict[str, Any]) -> Tuple[bool, Optional[Course], str]:
         """更新课程"""
         existing_course = self.course_repo.get_by_id(course_id)
@@ -472,7 +523,6 @@ class CourseService(BaseService):
             
             updated_course = self.course_repo.update(course_id, **update_data)
             if updated_course:
-                self.course_repo.save_data()
                 return True, updated_course, '课程更新成功'
             else:
                 return False, None, '更新课程失败'
@@ -480,6 +530,7 @@ class CourseService(BaseService):
         except Exception as e:
             return False, None, f'更新课程时发生错误: {str(e)}'
     
+    @_writes
     def delete_course(self, course_id: int) -> Tuple[bool, str]:
         """删除课程（级联删除相关数据）"""
         existing_course = self.course_repo.get_by_id(course_id)
@@ -487,14 +538,13 @@ class CourseService(BaseService):
             return False, '课程不存在'
         
         try:
-            # 级联删除相关数据
-            self.enrollment_repo.delete_by_course_id(course_id)
-            self.schedule_repo.delete_by_course_id(course_id)
-            
-            # 删除课程
-            success = self.course_repo.delete(course_id)
+            # 级联删除与删除课程在同一个事务中完成
+            with self.repo_manager.transaction():
+                self.enrollment_repo.delete_by_course_id(course_id)
+                self.repo_manager.course_preference_repo.delete_by_course_id(course_id)
+                self.schedule_repo.delete_by_course_id(course_id)
+                success = self.course_repo.delete(course_id)
             if success:
-                self.course_repo.save_data()
                 return True, '课程删除成功'
             else:
                 return False, '删除课程失败'
@@ -518,9 +568,9 @@ class CourseService(BaseService):
         enrolled_count = self.get_enrolled_count(course_id)
         return enrolled_count < course.capacity
     
-    def search_courses(self, keyword: str) -> List[Course]:
+    def search_courses(self, keyword: str, limit: Optional[int] = None) -> List[Course]:
         """搜索课程"""
-        return self.course_repo.search(keyword)
+        return self.course_repo.search(keyword, limit)
 
 class EnrollmentService(BaseService):
     """选课服务类"""
@@ -530,7 +580,11 @@ class EnrollmentService(BaseService):
         self.enrollment_repo = self.repo_manager.enrollment_repo
         self.student_repo = self.repo_manager.student_repo
         self.course_repo = self.repo_manager.course_repo
+        # 选课高峰模式（见 enrollment_rush）、抽签选课模式（见 enrollment_lottery），未启用时为 None
+        self.rush: Optional[EnrollmentRush] = None
+        self.lottery: Optional[EnrollmentLottery] = None
     
+    @_writes
     def enroll_student(self, student_id: int, course_id: int) -> Tuple[bool, Optional[Enrollment], str]:
         """学生选课"""
         # 验证学生和课程存在
@@ -547,36 +601,85 @@ class EnrollmentService(BaseService):
         if not course:
             return False, None, '课程不存在'
         
-        # 检查是否已经选修
-        if self.enrollment_repo.get_enrollment(student_id, course_id):
-            return False, None, '该学生已经选修此课程'
-        
-        # 检查课程容量
-        if course.capacity is not None:
-            enrolled_count = self.enrollment_repo.get_enrollment_count(course_id)
-            if enrolled_count >= course.capacity:
-                return False, None, '课程已满，无法选课'
+        if self.rush is not None:
+            # 高峰模式：原子占用名额，选课记录由后台批量写入
+            try:
+                return self.rush.enroll(student_id, course)
+            except Exception as e:
+                return False, None, f'选课时发生错误: {str(e)}'
         
         try:
-            # 创建选课记录
-            enrollment_id = self.enrollment_repo.get_next_id()
-            enrollment = Enrollment(
-                id=enrollment_id,
-                student_id=student_id,
-                course_id=course_id,
-                exam_score=None,
-                performance_score=None
-            )
-            
-            created_enrollment = self.enrollment_repo.create(enrollment)
-            self.enrollment_repo.save_data()
+            # 检查和写入在同一个事务中完成：事务持有写锁，多进程共享存储时还持有文件锁并先读入其他进程的变更，
+            # 同一时间只有一个选课请求能通过检查并写入，不会重复选课或超出容量
+            with self.repo_manager.transaction():
+                # 检查是否已经选修
+                if self.enrollment_repo.get_enrollment(student_id, course_id):
+                    return False, None, '该学生已经选修此课程'
+                
+                # 检查课程容量
+                if course.capacity is not None:
+                    enrolled_count = self.enrollment_repo.get_enrollment_count(course_id)
+                    if enrolled_count >= course.capacity:
+                        return False, None, '课程已满，无法选课'
+                
+                # 创建选课记录
+                enrollment_id = self.enrollment_repo.get_next_id()
+                enrollment = Enrollment(
+                    id=enrollment_id,
+                    student_id=student_id,
+                    course_id=course_id,
+                    exam_score=None,
+                    performance_score=None
+                )
+                
+                created_enrollment = self.enrollment_repo.create(enrollment)
             return True, created_enrollment, '选课成功'
             
         except Exception as e:
             return False, None, f'选课时发生错误: {str(e)}'
     
+    @_writes
+    def request_enrollment(self, student_id: int, course_id: int) -> Tuple[bool, Optional[Enrollment], str]:
+        """学生提交选课：抽签模式下登记志愿（不立即创建选课记录），否则直接选课"""
+        if self.lottery is None:
+            return self.enroll_student(student_id, course_id)
+        
+        if not self.student_repo.get_by_id(student_id):
+            return False, None, '学生不存在'
+        enrollment_status = self.repo_manager.enrollment_status_repo.get_enrollment_status()
+        if not enrollment_status.enrollment_open:
+            return False, None, '选课通道已关闭，暂时无法选课'
+        course = self.course_repo.get_by_id(course_id)
+        if not course:
+            return False, None, '课程不存在'
+        
+        try:
+            return self.lottery.submit(student_id, course)
+        except Exception as e:
+            return False, None, f'登记志愿时发生错误: {str(e)}'
+    
+    @_writes
+    def withdraw_enrollment(self, student_id: int, course_id: int) -> Tuple[bool, str]:
+        """学生退选：抽签模式下已登记志愿时撤回志愿，否则退课"""
+        if self.lottery is not None and self.lottery.rank_of(student_id, course_id) is not None:
+            try:
+                return self.lottery.withdraw(student_id, course_id)
+            except Exception as e:
+                return False, f'撤回志愿时发生错误: {str(e)}'
+        return self.unenroll_student(student_id, course_id)
+    
+    def get_preference_rank(self, student_id: int, course_id: int) -> Optional[int]:
+        """抽签模式下学生对课程的志愿顺序，未登记或未启用抽签模式时为 None"""
+        if self.lottery is None:
+            return None
+        return self.lottery.rank_of(student_id, course_id)
+    
+    @_writes
     def unenroll_student(self, student_id: int, course_id: int) -> Tuple[bool, str]:
         """学生退课"""
+        if self.rush is not None and self.rush.is_pending(student_id, course_id):
+            # 选课记录还在写后队列中，先等它写入
+            self.rush.drain()
         enrollment = self.enrollment_repo.get_enrollment(student_id, course_id)
         if not enrollment:
             return False, '该学生未选修此课程'
@@ -584,7 +687,6 @@ class EnrollmentService(BaseService):
         try:
             success = self.enrollment_repo.delete(enrollment.id)
             if success:
-                self.enrollment_repo.save_data()
                 return True, '退课成功'
             else:
                 return False, '退课失败'
@@ -592,6 +694,7 @@ class EnrollmentService(BaseService):
         except Exception as e:
             return False, f'退课时发生错误: {str(e)}'
     
+    @_writes
     def update_scores(self, enrollment_id: int, exam_score: Optional[float] = None, 
                      performance_score: Optional[float] = None) -> Tuple[bool, Optional[Enrollment], str]:
         """更新成绩"""
@@ -615,7 +718,6 @@ class EnrollmentService(BaseService):
             
             updated_enrollment = self.enrollment_repo.update(enrollment_id, **update_data)
             if updated_enrollment:
-                self.enrollment_repo.save_data()
                 return True, updated_enrollment, '成绩更新成功'
             else:
                 return False, None, '更新成绩失败'
@@ -640,6 +742,12 @@ class EnrollmentService(BaseService):
     def is_student_enrolled(self, student_id: int, course_id: int) -> bool:
         """检查学生是否已选修课程"""
         return self.enrollment_repo.get_enrollment(student_id, course_id) is not None
+    
+    def get_enrollment_state(self, student_id: int, course_id: int) -> Optional[str]:
+        """高峰模式下尚未确认的选课：'pending' 已占到名额、等待保存，'failed' 保存失败需重新选课"""
+        if self.rush is None:
+            return None
+        return self.rush.state(student_id, course_id)
 
 class AttendanceService(BaseService):
     """考勤服务类"""
@@ -649,6 +757,17 @@ class AttendanceService(BaseService):
         self.attendance_repo = self.repo_manager.attendance_repo
         self.student_repo = self.repo_manager.student_repo
     
+    def page_attendance(self, start_date: str = '', end_date: str = '', page: int = 1,
+                        per_page: int = 10) -> Pagination:
+        """按日期范围筛选的考勤记录，按 (日期, 学生姓名) 倒序分页，items 为 (考勤记录, 学生)"""
+        query = QueryBuilder()
+        if start_date:
+            query.where('date', start_date, 'ge')
+        if end_date:
+            query.where('date', end_date, 'le')
+        return self._page_by_date_and_student(self.attendance_repo, page, per_page, query)
+    
+    @_writes
     def check_in_student(self, student_id: int, date: str = None) -> Tuple[bool, Optional[Attendance], str]:
         """学生签到"""
         if not date:
@@ -676,12 +795,12 @@ class AttendanceService(BaseService):
             )
             
             created_attendance = self.attendance_repo.create(attendance)
-            self.attendance_repo.save_data()
             return True, created_attendance, '签到成功'
             
         except Exception as e:
             return False, None, f'签到时发生错误: {str(e)}'
     
+    @_writes
     def record_attendance(self, student_id: int, date: str, status: str, reason: str = '') -> Tuple[bool, Optional[Attendance], str]:
         """记录考勤"""
         # 验证学生存在
@@ -710,12 +829,12 @@ class AttendanceService(BaseService):
             )
             
             created_attendance = self.attendance_repo.create(attendance)
-            self.attendance_repo.save_data()
             return True, created_attendance, '考勤记录添加成功'
             
         except Exception as e:
             return False, None, f'记录考勤时发生错误: {str(e)}'
     
+    @_writes
     def update_attendance(self, attendance_id: int, status: str, reason: str) -> Tuple[bool, Optional[Attendance], str]:
         """更新考勤记录"""
         attendance = self.attendance_repo.get_by_id(attendance_id)
@@ -734,7 +853,6 @@ class AttendanceService(BaseService):
             
             updated_attendance = self.attendance_repo.update(attendance_id, **update_data)
             if updated_attendance:
-                self.attendance_repo.save_data()
                 return True, updated_attendance, '考勤记录更新成功'
             else:
                 return False, None, '更新考勤记录失败'
@@ -764,6 +882,7 @@ class LeaveService(BaseService):
         self.student_repo = self.repo_manager.student_repo
         self.user_repo = self.repo_manager.user_repo
 
+    @_writes
     def apply_leave(self, student_id: int, start_date: str, end_date: str, reason: str) -> Tuple[bool, Optional[LeaveRequest], str]:
         """学生提交请假申请"""
         if not reason.strip():
@@ -797,11 +916,11 @@ class LeaveService(BaseService):
                 created_at=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             )
             created_leave = self.leave_repo.create(leave)
-            self.leave_repo.save_data()
             return True, created_leave, '请假申请已提交，等待审批'
         except Exception as e:
             return False, None, f'提交请假申请时发生错误: {str(e)}'
 
+    @_writes
     def review_leave(self, leave_id: int, approver_user_id: int, decision: str) -> Tuple[bool, Optional[LeaveRequest], str]:
         """教师/管理员审批请假"""
         leave = self.leave_repo.get_by_id(leave_id)
@@ -820,30 +939,37 @@ class LeaveService(BaseService):
             return False, None, '审批人无权限'
 
         try:
-            updated_leave = self.leave_repo.update(
-                leave_id,
-                status=decision,
-                approver_id=approver_user_id,
-                updated_at=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            )
+            # 请假状态与考勤同步在同一个事务中完成，只保存一次，出错时全部撤销
+            with self.repo_manager.transaction():
+                updated_leave = self.leave_repo.update(
+                    leave_id,
+                    status=decision,
+                    approver_id=approver_user_id,
+                    updated_at=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                )
 
-            if not updated_leave:
-                return False, None, '更新请假状态失败'
-
-            # 如果批准，则同步到考勤记录
-            if decision == 'approved':
-                start_dt = datetime.datetime.strptime(leave.start_date, '%Y-%m-%d').date()
-                end_dt = datetime.datetime.strptime(leave.end_date, '%Y-%m-%d').date()
-                day_count = (end_dt - start_dt).days + 1
-                reason_text = f"请假（审批通过）: {leave.reason}"
-
-                for i in range(day_count):
-                    day = (start_dt + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
-                    existing = self.repo_manager.attendance_repo.get_by_student_and_date(leave.student_id, day)
-                    if existing:
-                        self.repo_manager.attendance_repo.update(existing.id, status='leave', reason=reason_text)
-                    else:
-                        attendance_id = self.repo_manager.attendance_repo.get_next_id()
+                if not updated_leave:
+                    return False, None, '更新请假状态失败'
+
+                # 如果批准，则同步到考勤记录
+                if decision == 'approved':
+                    start_dt = datetime.datetime.strptime(leave.start_date, '%Y-%m-%d').date()
+                    end_dt = datetime.datetime.strptime(leave.end_date, '%Y-%m-%d').date()
+                    day_count = (end_dt - start_dt).days + 1
+                    reason_text = f"请假（审批通过）: {leave.reason}"
+
+                    missing_days = []
+                    for i in range(day_count):
+                        day = (start_dt + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
+                        existing = self.repo_manager.attendance_repo.get_by_student_and_date(leave.student_id, day)
+                        if existing:
+                            self.repo_manager.attendance_repo.update(existing.id, status='leave', reason=reason_text)
+                        else:
+                            missing_days.append(day)
+
+                    # 缺少考勤的日期一次预留全部ID
+                    attendance_ids = self.repo_manager.attendance_repo.reserve_ids(len(missing_days))
+                    for attendance_id, day in zip(attendance_ids, missing_days):
                         attendance = Attendance(
                             id=attendance_id,
                             student_id=leave.student_id,
@@ -852,14 +978,13 @@ class LeaveService(BaseService):
                             reason=reason_text
                         )
                         self.repo_manager.attendance_repo.create(attendance)
-                self.repo_manager.attendance_repo.save_data()
 
-            self.leave_repo.save_data()
             msg = '已批准' if decision == 'approved' else '已驳回'
             return True, updated_leave, f'请假申请{msg}'
         except Exception as e:
             return False, None, f'审批请假时发生错误: {str(e)}'
 
+    @_writes
     def delete_leave(self, leave_id: int) -> Tuple[bool, str]:
         """删除请假申请，若已批准则级联清理对应考勤"""
         leave = self.leave_repo.get_by_id(leave_id)
@@ -867,22 +992,21 @@ class LeaveService(BaseService):
             return False, '请假记录不存在'
 
         try:
-            # 若已批准，移除对应日期范围内的请假考勤记录
-            if leave.status == 'approved':
-                start_dt = datetime.datetime.strptime(leave.start_date, '%Y-%m-%d').date()
-                end_dt = datetime.datetime.strptime(leave.end_date, '%Y-%m-%d').date()
-                day_count = (end_dt - start_dt).days + 1
-                att_repo = self.repo_manager.attendance_repo
-                for i in range(day_count):
-                    day = (start_dt + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
-                    existing = att_repo.get_by_student_and_date(leave.student_id, day)
-                    if existing and existing.status == 'leave':
-                        att_repo.delete(existing.id)
-                att_repo.save_data()
-
-            # 删除请假记录
-            self.leave_repo.delete(leave_id)
-            self.leave_repo.save_data()
+            with self.repo_manager.transaction():
+                # 若已批准，移除对应日期范围内的请假考勤记录
+                if leave.status == 'approved':
+                    start_dt = datetime.datetime.strptime(leave.start_date, '%Y-%m-%d').date()
+                    end_dt = datetime.datetime.strptime(leave.end_date, '%Y-%m-%d').date()
+                    day_count = (end_dt - start_dt).days + 1
+                    att_repo = self.repo_manager.attendance_repo
+                    for i in range(day_count):
+                        day = (start_dt + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
+                        existing = att_repo.get_by_student_and_date(leave.student_id, day)
+                        if existing and existing.status == 'leave':
+                            att_repo.delete(existing.id)
+
+                # 删除请假记录
+                self.leave_repo.delete(leave_id)
             return True, '请假记录已删除'
         except Exception as e:
             return False, f'删除请假记录时发生错误: {str(e)}'
@@ -893,6 +1017,18 @@ class LeaveService(BaseService):
     def get_all_leaves(self) -> List[LeaveRequest]:
         return self.leave_repo.get_all()
 
+    def list_leaves(self, pending_only: bool = False) -> List[LeaveRequest]:
+        """请假列表，按提交时间倒序；pending_only 时只返回待审批的申请"""
+        query = QueryBuilder().order_by('created_at', descending=True)
+        if pending_only:
+            query.where('status', 'pending')
+        return self.leave_repo.query(query)
+
+    def page_leaves(self, page: int = 1, per_page: int = 10, pending_only: bool = False) -> Pagination:
+        """分页的请假列表，按提交时间倒序，沿提交时间有序索引只取本页"""
+        filters = {'status': 'pending'} if pending_only else None
+        return self.leave_repo.page('created_at', page, per_page, filters, descending=True)
+
 
 class RewardPunishmentService(BaseService):
     """奖励处分服务类"""
@@ -902,6 +1038,11 @@ class RewardPunishmentService(BaseService):
         self.reward_punishment_repo = self.repo_manager.reward_punishment_repo
         self.student_repo = self.repo_manager.student_repo
     
+    def page_records(self, page: int = 1, per_page: int = 10) -> Pagination:
+        """奖励处分记录按 (日期, 学生姓名) 倒序分页，items 为 (记录, 学生)"""
+        return self._page_by_date_and_student(self.reward_punishment_repo, page, per_page)
+    
+    @_writes
     def create_record(self, student_id: int, rp_type: str, description: str, date: str) -> Tuple[bool, Optional[RewardPunishment], str]:
         """创建奖励处分记录"""
         # 验证学生存在
@@ -929,7 +1070,6 @@ class RewardPunishmentService(BaseService):
             )
             
             created_record = self.reward_punishment_repo.create(record)
-            self.reward_punishment_repo.save_data()
             return True, created_record, '记录创建成功'
             
         except Exception as e:
@@ -939,6 +1079,7 @@ class RewardPunishmentService(BaseService):
         """获取学生的奖励处分记录"""
         return self.reward_punishment_repo.get_by_student_id(student_id)
     
+    @_writes
     def update_record(self, record_id: int, rp_type: str, description: str, date: str) -> Tuple[bool, Optional[RewardPunishment], str]:
         """更新奖励处分记录"""
         record = self.reward_punishment_repo.get_by_id(record_id)
@@ -962,7 +1103,6 @@ class RewardPunishmentService(BaseService):
             
             updated_record = self.reward_punishment_repo.update(record_id, **update_data)
             if updated_record:
-                self.reward_punishment_repo.save_data()
                 return True, updated_record, '记录更新成功'
             else:
                 return False, None, '更新记录失败'
@@ -970,6 +1110,7 @@ class RewardPunishmentService(BaseService):
         except Exception as e:
             return False, None, f'更新记录时发生错误: {str(e)}'
     
+    @_writes
     def delete_record(self, record_id: int) -> Tuple[bool, str]:
         """删除奖励处分记录"""
         record = self.reward_punishment_repo.get_by_id(record_id)
@@ -979,7 +1120,6 @@ class RewardPunishmentService(BaseService):
         try:
             success = self.reward_punishment_repo.delete(record_id)
             if success:
-                self.reward_punishment_repo.save_data()
                 return True, '记录删除成功'
             else:
                 return False, '删除记录失败'
@@ -1029,14 +1169,7 @@ class RewardPunishmentService(BaseService):
     
     def get_records_by_date_range(self, start_date: str, end_date: str) -> List[RewardPunishment]:
         """获取指定日期范围内的奖惩记录"""
-        all_records = self.reward_punishment_repo.get_all()
-        filtered_records = []
-        
-        for record in all_records:
-            if start_date <= record.date <= end_date:
-                filtered_records.append(record)
-                
-        return filtered_records
+        return self.reward_punishment_repo.find_range('date', start_date, end_date)
 
 class ParentService(BaseService):
     """家长信息服务类"""
@@ -1046,6 +1179,7 @@ class ParentService(BaseService):
         self.parent_repo = self.repo_manager.parent_repo
         self.student_repo = self.repo_manager.student_repo
     
+    @_writes
     def create_parent(self, student_id: int, parent_name: str, relationship: str, 
                      contact_phone: str, email: str = '', address: str = '') -> Tuple[bool, Optional[Parent], str]:
         """创建家长信息"""
@@ -1081,7 +1215,6 @@ class ParentService(BaseService):
             )
             
             created_parent = self.parent_repo.create(parent)
-            self.parent_repo.save_data()
             return True, created_parent, '家长信息添加成功'
             
         except Exception as e:
@@ -1091,6 +1224,7 @@ class ParentService(BaseService):
         """获取学生的家长信息"""
         return self.parent_repo.get_by_student_id(student_id)
     
+    @_writes
     def update_parent(self, parent_id: int, student_id: int, parent_name: str, relationship: str, 
                      contact_phone: str, email: str = '', address: str = '') -> Tuple[bool, Optional[Parent], str]:
         """更新家长信息"""
@@ -1128,7 +1262,6 @@ class ParentService(BaseService):
             
             updated_parent = self.parent_repo.update(parent_id, **update_data)
             if updated_parent:
-                self.parent_repo.save_data()
                 return True, updated_parent, '家长信息更新成功'
             else:
                 return False, None, '更新家长信息失败'
@@ -1136,6 +1269,7 @@ class ParentService(BaseService):
         except Exception as e:
             return False, None, f'更新家长信息时发生错误: {str(e)}'
     
+    @_writes
     def delete_parent(self, parent_id: int) -> Tuple[bool, str]:
         """删除家长信息"""
         parent = self.parent_repo.get_by_id(parent_id)
@@ -1145,7 +1279,6 @@ class ParentService(BaseService):
         try:
             success = self.parent_repo.delete(parent_id)
             if success:
-                self.parent_repo.save_data()
                 return True, '家长信息删除成功'
             else:
                 return False, '删除家长信息失败'
@@ -1160,6 +1293,7 @@ class NoticeService(BaseService):
         super().__init__()
         self.notice_repo = self.repo_manager.notice_repo
     
+    @_writes
     def create_notice(self, title: str, content: str, target: str = '', sender: str = '') -> Tuple[bool, Optional[Notice], str]:
         """创建通知"""
         # 验证必填字段
@@ -1186,12 +1320,12 @@ class NoticeService(BaseService):
             )
             
             created_notice = self.notice_repo.create(notice)
-            self.notice_repo.save_data()
             return True, created_notice, '通知发布成功'
             
         except Exception as e:
             return False, None, f'创建通知时发生错误: {str(e)}'
     
+    @_writes
     def update_notice(self, notice_id: int, title: str, content: str, target: str = '', sender: str = '') -> Tuple[bool, Optional[Notice], str]:
         """更新通知"""
         notice = self.notice_repo.get_by_id(notice_id)
@@ -1219,7 +1353,6 @@ class NoticeService(BaseService):
             
             updated_notice = self.notice_repo.update(notice_id, **update_data)
             if updated_notice:
-                self.notice_repo.save_data()
                 return True, updated_notice, '通知更新成功'
             else:
                 return False, None, '更新通知失败'
@@ -1227,6 +1360,7 @@ class NoticeService(BaseService):
         except Exception as e:
             return False, None, f'更新通知时发生错误: {str(e)}'
     
+    @_writes
     def delete_notice(self, notice_id: int) -> Tuple[bool, str]:
         """删除通知"""
         notice = self.notice_repo.get_by_id(notice_id)
@@ -1236,7 +1370,6 @@ class NoticeService(BaseService):
         try:
             success = self.notice_repo.delete(notice_id)
             if success:
-                self.notice_repo.save_data()
                 return True, '通知删除成功'
             else:
                 return False, '删除通知失败'
@@ -1252,10 +1385,22 @@ class NoticeService(BaseService):
         """根据目标受众获取通知"""
         return self.notice_repo.get_by_target(target)
     
-    def search_notices(self, keyword: str) -> List[Notice]:
+    def search_notices(self, keyword: str, limit: Optional[int] = None) -> List[Notice]:
         """搜索通知"""
-        return self.notice_repo.search(keyword)
+        return self.notice_repo.search(keyword, limit)
     
+    def get_notices_page(self, user_role: str, page: int = 1, per_page: int = 10,
+                         target: Optional[str] = None) -> Pagination:
+        """分页获取角色可见的通知（最新在前），target 为目标受众筛选"""
+        query = QueryBuilder()
+        if user_role == 'student':
+            query.where('target', [None, '', 'students'], 'in')
+        elif user_role == 'teacher':
+            query.where('target', [None, '', 'teachers', 'students'], 'in')
+        if target:
+            query.where('target', target)
+        return self.notice_repo.page('date', page, per_page, query, descending=True)
+
     def get_notices_for_user(self, user_role: str) -> List[Notice]:
         """根据用户角色获取可见通知"""
         all_notices = self.notice_repo.get_all()
@@ -1279,6 +1424,7 @@ class ScheduleService(BaseService):
         self.course_repo = self.repo_manager.course_repo
         self.user_repo = self.repo_manager.user_repo
     
+    @_writes
     def create_schedule(self, course_id: int, teacher_user_id: int, day_of_week: str, 
                        start_time: str, end_time: str, location: str, semester: str) -> Tuple[bool, Optional[Schedule], str]:
         """创建排课"""
@@ -1327,12 +1473,12 @@ class ScheduleService(BaseService):
             )
             
             created_schedule = self.schedule_repo.create(schedule)
-            self.schedule_repo.save_data()
             return True, created_schedule, '排课添加成功'
             
         except Exception as e:
             return False, None, f'创建排课时发生错误: {str(e)}'
     
+    @_writes
     def update_schedule(self, schedule_id: int, course_id: int, teacher_user_id: int, day_of_week: str, 
                        start_time: str, end_time: str, location: str, semester: str) -> Tuple[bool, Optional[Schedule], str]:
         """更新排课"""
@@ -1383,7 +1529,6 @@ class ScheduleService(BaseService):
             
             updated_schedule = self.schedule_repo.update(schedule_id, **update_data)
             if updated_schedule:
-                self.schedule_repo.save_data()
                 return True, updated_schedule, '排课更新成功'
             else:
                 return False, None, '更新排课失败'
@@ -1391,6 +1536,7 @@ class ScheduleService(BaseService):
         except Exception as e:
             return False, None, f'更新排课时发生错误: {str(e)}'
     
+    @_writes
     def delete_schedule(self, schedule_id: int) -> Tuple[bool, str]:
         """删除排课"""
         schedule = self.schedule_repo.get_by_id(schedule_id)
@@ -1400,7 +1546,6 @@ class ScheduleService(BaseService):
         try:
             success = self.schedule_repo.delete(schedule_id)
             if success:
-                self.schedule_repo.save_data()
                 return True, '排课删除成功'
             else:
                 return False, '删除排课失败'
@@ -1456,15 +1601,19 @@ class StatisticsService(BaseService):
             })
         
         # 获取筛选后的学生ID列表
-        student_ids = [s.id for s in all_students]
+        student_ids = {s.id for s in all_students}
         
-        # 考勤概览 (过去7天)
+        # 考勤概览 (过去7天)，一次范围查询取出7天的记录再按日期分组
         today = datetime.date.today()
+        week_attendance = {}
+        for a in self.attendance_repo.find_range('date', (today - datetime.timedelta(days=6)).strftime('%Y-%m-%d'),
+                                                 today.strftime('%Y-%m-%d')):
+            week_attendance.setdefault(a.date, []).append(a)
         attendance_summary = []
         for i in range(7):
             date = (today - datetime.timedelta(days=i)).strftime('%Y-%m-%d')
             # 只获取筛选后班级的学生考勤
-            day_attendance = [a for a in self.attendance_repo.get_by_date(date) 
+            day_attendance = [a for a in week_attendance.get(date, []) 
                              if a.student_id in student_ids]
             
             # 统计当天出勤情况
@@ -1611,6 +1760,28 @@ class ServiceManager:
         self.communication_service = CommunicationService()
         self.leave_service = LeaveService()
 
+    def configure(self, config: Dict[str, Any]):
+        """根据应用配置调整服务（选课高峰模式、抽签选课模式）"""
+        if config.get('ENROLLMENT_ALLOCATION', 'first_come') == 'lottery':
+            if self.enrollment_service.lottery is None:
+                repos = repo_manager
+                lottery = EnrollmentLottery(repos.course_preference_repo, repos.enrollment_repo, repos.course_repo,
+                                            repos.enrollment_status_repo,
+                                            max_choices=config.get('ENROLLMENT_LOTTERY_MAX_CHOICES', 5))
+                self.enrollment_service.lottery = lottery
+                self.enrollment_status_service.lottery = lottery
+        if not config.get('ENROLLMENT_RUSH_MODE', False) or self.enrollment_service.rush is not None:
+            return
+        if config.get('MULTI_PROCESS', False):
+            # 名额计数只在本进程内有效，多进程时仍按普通模式逐条检查
+            print("⚠️ 多进程部署不支持选课高峰模式，已按普通模式选课")
+            return
+        rush = EnrollmentRush(self.enrollment_service.enrollment_repo,
+                              batch_size=config.get('ENROLLMENT_RUSH_BATCH_SIZE', 200),
+                              batch_window=config.get('ENROLLMENT_RUSH_BATCH_WINDOW', 0.005))
+        self.enrollment_service.rush = rush
+        self.enrollment_status_service.rush = rush
+
 class CommunicationService(BaseService):
     """通信服务类 - 处理通知、短信和邮件发送"""
 
@@ -1620,8 +1791,10 @@ class CommunicationService(BaseService):
         self.student_repo = self.repo_manager.student_repo
         self.notice_repo = self.repo_manager.notice_repo
 
-    def send_notification_to_parent(self, parent_id: int, title: str, content: str, sender: str) -> Tuple[bool, str]:
-        """向指定家长发送通知"""
+    @_writes
+    def send_notification_to_parent(self, parent_id: int, title: str, content: str, sender: str,
+                                    notice_id: Optional[int] = None) -> Tuple[bool, str]:
+        """向指定家长发送通知（批量发送时由调用方传入预留的通知ID）"""
         try:
             # 获取家长信息
             parent = self.parent_repo.get_by_id(parent_id)
@@ -1629,7 +1802,8 @@ class CommunicationService(BaseService):
                 return False, "家长信息不存在"
 
             # 创建通知记录
-            notice_id = self.notice_repo.get_next_id()
+            if notice_id is None:
+                notice_id = self.notice_repo.get_next_id()
             notice = Notice(
                 id=notice_id,
                 title=title,
@@ -1640,7 +1814,6 @@ class CommunicationService(BaseService):
             )
 
             self.notice_repo.create(notice)
-            self.notice_repo.save_data()
 
             # 这里应该集成实际的通知发送逻辑（如短信网关、邮件服务器等）
             # 目前只是模拟发送
@@ -1649,14 +1822,17 @@ class CommunicationService(BaseService):
         except Exception as e:
             return False, f"发送失败: {str(e)}"
 
+    @_writes
     def send_notification_to_all_parents(self, title: str, content: str, sender: str) -> Tuple[bool, str, int]:
         """向所有家长发送通知"""
         try:
             parents = self.parent_repo.get_all()
             success_count = 0
+            # 每位家长一条通知，一次预留全部ID
+            notice_ids = self.notice_repo.reserve_ids(len(parents))
 
-            for parent in parents:
-                success, message = self.send_notification_to_parent(parent.id, title, content, sender)
+            for parent, notice_id in zip(parents, notice_ids):
+                success, message = self.send_notification_to_parent(parent.id, title, content, sender, notice_id)
                 if success:
                     success_count += 1
 
@@ -1709,32 +1885,51 @@ class EnrollmentStatusService(BaseService):
     def __init__(self):
         super().__init__()
         self.enrollment_status_repo = self.repo_manager.enrollment_status_repo
+        # 与选课服务共用的高峰模式、抽签模式，由 ServiceManager.configure 设置
+        self.rush: Optional[EnrollmentRush] = None
+        self.lottery: Optional[EnrollmentLottery] = None
     
     def get_enrollment_status(self) -> EnrollmentStatus:
         """获取当前选课状态"""
         return self.enrollment_status_repo.get_enrollment_status()
     
+    @_writes
     def toggle_enrollment_status(self) -> Tuple[bool, EnrollmentStatus, str]:
         """切换选课状态"""
         try:
             current_status = self.get_enrollment_status()
-            new_status = not current_status.enrollment_open
-            updated_status = self.enrollment_status_repo.update_enrollment_status(new_status)
-            self.enrollment_status_repo.save_data()
-            status_text = "开启" if new_status else "关闭"
-            return True, updated_status, f'选课功能已{status_text}'
+            return self._change_status(not current_status.enrollment_open)
         except Exception as e:
             return False, None, f'切换选课状态时发生错误: {str(e)}'
     
+    @_writes
     def set_enrollment_status(self, status: bool) -> Tuple[bool, EnrollmentStatus, str]:
         """设置选课状态"""
         try:
-            updated_status = self.enrollment_status_repo.update_enrollment_status(status)
-            self.enrollment_status_repo.save_data()
-            status_text = "开启" if status else "关闭"
-            return True, updated_status, f'选课功能已{status_text}'
+            return self._change_status(status)
         except Exception as e:
             return False, None, f'设置选课状态时发生错误: {str(e)}'
+    
+    def _change_status(self, enrollment_open: bool) -> Tuple[bool, EnrollmentStatus, str]:
+        """开放或关闭选课，并完成高峰模式、抽签模式在开放和关闭时的准备与收尾"""
+        if enrollment_open and self.rush is not None:
+            # 开放前建立物化的选课人数，避免第一批请求同时扫描选课表
+            self.rush.repo.get_enrollment_counts()
+        updated_status = self.enrollment_status_repo.update_enrollment_status(enrollment_open)
+        status_text = "开启" if enrollment_open else "关闭"
+        message = f'选课功能已{status_text}'
+        if enrollment_open:
+            if self.lottery is not None:
+                self.lottery.open_window()
+                updated_status = self.get_enrollment_status()
+            return True, updated_status, message
+        if self.rush is not None:
+            # 关闭后不再有新的选课，等待队列中的记录写入
+            self.rush.drain()
+        if self.lottery is not None:
+            allocated = self.lottery.allocate()
+            message += f'，已按志愿抽签分配 {len(allocated)} 个名额'
+        return True, updated_status, message
 
 # 全局服务管理器实例
 service_manager = ServiceManager()
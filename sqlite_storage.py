@@ -0,0 +1,436 @@
+# sqlite_storage.py
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional, Sequence
+
+from memory_table import IdBlock
+from partitions import read_sealed
+
+
+class SqliteStore:
+    """SQLite 数据存储，与 DataStore 提供相同的表接口
+
+    每条记录以JSON文本保存在 data 列中，id 为整数主键；
+    仓储声明的索引字段会建立 json_extract 表达式索引。
+    使用 WAL 日志模式，每个线程持有独立连接，每次变更自动提交；
+    transaction() 中的变更在同一个数据库事务里提交或回滚。
+    """
+
+    # 数据库可能被其他进程修改，仓储不缓存模型实例
+    cache_models = False
+
+    _registry: Dict[str, 'SqliteStore'] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, db_file: str = 'app_data.db', seed_file: Optional[str] = None):
+        self.data_file = db_file
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        self._tables: Dict[str, 'SqliteTable'] = {}
+
+        is_new = not os.path.exists(db_file)
+        conn = self.connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS _next_id (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        if is_new and seed_file and os.path.exists(seed_file):
+            self._import_json(seed_file)
+
+    @classmethod
+    def open(cls, db_file: str = 'app_data.db', seed_file: Optional[str] = None) -> 'SqliteStore':
+        """获取数据库文件对应的共享存储实例"""
+        key = os.path.abspath(db_file)
+        with cls._registry_lock:
+            store = cls._registry.get(key)
+            if store is None:
+                store = cls(db_file, seed_file)
+                cls._registry[key] = store
+            return store
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.data_file, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def table(self, table_name: str, indexes: Sequence[Any] = (), compact: bool = False,
+              range_indexes: Sequence[str] = (), search_fields: Sequence[str] = (),
+              partition_by: Optional[str] = None) -> 'SqliteTable':
+        """获取数据表的访问对象（表和索引不存在则创建）
+
+        记录本身就以序列化形式保存在数据库中，compact 参数无需处理；
+        子串搜索无法使用B树索引，search_fields 同样无需处理；
+        日期字段的有序索引已能只读取范围内的记录，partition_by 同样无需处理。
+        """
+        with self.lock:
+            table = self._tables.get(table_name)
+            if table is None:
+                table = SqliteTable(self, table_name)
+                self._tables[table_name] = table
+            table.ensure_indexes(indexes)
+            table.ensure_range_indexes(range_indexes)
+            return table
+
+    def _import_json(self, seed_file: str):
+        """新建数据库时从JSON数据文件导入已有数据"""
+        try:
+            with open(seed_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error importing data from {seed_file}: {e}")
+            return
+
+        # 按月分区的表 <表名>@<月份> 及其封存分段合并回同一张表，数据文件中的记录优先
+        merged: Dict[str, list] = {}
+        for source in (read_sealed(seed_file), data.get('in_memory_data', {})):
+            for name, items in source.items():
+                merged.setdefault(name.partition('@')[0], []).extend(items)
+        tables = {name: self.table(name) for name in merged}
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table_name, items in merged.items():
+                table = tables[table_name]
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO {table.quoted} (id, data) VALUES (?, ?)',
+                    [(item.get('id'), _dumps(item)) for item in items]
+                )
+            conn.executemany(
+                'INSERT OR REPLACE INTO _next_id (name, value) VALUES (?, ?)',
+                list(data.get('next_id', {}).items())
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            # COMMIT 失败时事务可能仍未结束，也可能已被 SQLite 自动回滚
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        print(f"✅ 已从 {seed_file} 导入数据到 {self.data_file}")
+
+    def in_transaction(self) -> bool:
+        """当前线程的连接是否处于事务中"""
+        return self.connection().in_transaction
+
+    @contextmanager
+    def transaction(self):
+        """工作单元：块内的全部变更在一个数据库事务中提交，抛出异常或提交失败时回滚
+
+        嵌套的事务并入最外层事务。
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield self
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.committed = committed = []
+        try:
+            yield self
+            conn.execute('COMMIT')
+        except BaseException:
+            # 块内抛出异常或 COMMIT 失败（如延迟约束检查、数据库繁忙）都回滚，避免连接停留在未结束的事务中
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.committed = None
+        for callback in committed:
+            callback()
+
+    def after_commit(self, callback: Callable[[], None]):
+        """当前线程的事务提交后调用 callback，回滚时丢弃；不在事务中时立即调用"""
+        committed = getattr(self._local, 'committed', None)
+        if committed is not None:
+            committed.append(callback)
+        else:
+            callback()
+
+    def save(self) -> bool:
+        """每次变更都已自动提交，无需额外保存"""
+        return True
+
+    def defer_saves(self):
+        """每次变更都已自动提交，没有需要推迟的保存"""
+
+    def has_unsaved_changes(self) -> bool:
+        return False
+
+    def flush(self) -> bool:
+        return True
+
+    def refresh(self) -> bool:
+        """数据库本身在进程间保持一致，没有需要读入的外部变更"""
+        return False
+
+    def reload_external_changes(self) -> List[str]:
+        """数据库没有需要监视的数据文件，外部修改直接可见"""
+        return []
+
+
+def _dumps(item: Dict[str, Any]) -> str:
+    return json.dumps(item, ensure_ascii=False, separators=(',', ':'))
+
+
+def _field_expr(field: str) -> str:
+    """字段对应的SQL表达式，必须与索引表达式完全一致才能命中索引"""
+    if field == 'id':
+        return 'id'
+    if not field.isidentifier():
+        raise ValueError(f"Invalid field name: {field}")
+    return f"json_extract(data, '$.{field}')"
+
+
+class SqliteTable:
+    """SQLite 数据表，接口与 MemoryTable 一致"""
+
+    # 每次预留的ID数量
+    ID_BLOCK = 32
+
+    def __init__(self, store: SqliteStore, name: str):
+        if not name.isidentifier():
+            raise ValueError(f"Invalid table name: {name}")
+        self.store = store
+        self.name = name
+        self.quoted = f'"{name}"'
+        self._indexes = set()
+        # 已预留、尚未分配完的ID段
+        self._ids = IdBlock()
+        self._ids_lock = threading.Lock()
+        self._conn().execute(
+            f'CREATE TABLE IF NOT EXISTS {self.quoted} (id INTEGER PRIMARY KEY, data TEXT NOT NULL)'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        return self.store.connection()
+
+    def ensure_indexes(self, indexes: Sequence[Any]):
+        """为声明的字段（或组合字段）建立表达式索引"""
+        for index in indexes:
+            fields = (index,) if isinstance(index, str) else tuple(index)
+            if fields in self._indexes:
+                continue
+            index_name = f'"idx_{self.name}_{"_".join(fields)}"'
+            columns = ', '.join(_field_expr(field) for field in fields)
+            self._conn().execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {self.quoted} ({columns})')
+            self._indexes.add(fields)
+
+    def ensure_range_indexes(self, fields: Sequence[str]):
+        """B树表达式索引本身就支持范围查询"""
+        self.ensure_indexes(fields)
+
+    @staticmethod
+    def _where(filters: Dict[str, Any]):
+        clauses = []
+        params = []
+        for field, value in filters.items():
+            if value is None:
+                clauses.append(f'{_field_expr(field)} IS NULL')
+            else:
+                clauses.append(f'{_field_expr(field)} = ?')
+                params.append(value)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def _select(self, where: str = '', params: Sequence[Any] = (), limit: Optional[int] = None,
+                order_by: str = 'id') -> List[Dict[str, Any]]:
+        sql = f'SELECT data FROM {self.quoted}{where} ORDER BY {order_by}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        return [json.loads(row[0]) for row in self._conn().execute(sql, params)]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """获取全部记录"""
+        return self._select()
+
+    def get(self, item_id: Any) -> Optional[Dict[str, Any]]:
+        """根据ID获取记录"""
+        row = self._conn().execute(f'SELECT data FROM {self.quoted} WHERE id = ?', (item_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, filters: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取满足全部等值条件的记录"""
+        where, params = self._where(filters)
+        return self._select(where, params, limit)
+
+    def find_range(self, field: str, lo: Any = None, hi: Any = None) -> List[Dict[str, Any]]:
+        """获取字段取值在 [lo, hi] 内的记录（边界为 None 表示不限），按取值升序排列"""
+        expr = _field_expr(field)
+        clauses = [f'{expr} IS NOT NULL']
+        params = []
+        if lo is not None:
+            clauses.append(f'{expr} >= ?')
+            params.append(lo)
+        if hi is not None:
+            clauses.append(f'{expr} <= ?')
+            params.append(hi)
+        return self._select(' WHERE ' + ' AND '.join(clauses), params, order_by=f'{expr}, id')
+
+    def search(self, fields: Sequence[str], keyword: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """在指定字段中做不区分大小写的子串搜索
+
+        排序与 MemoryTable.search 一致：完全相等、前缀、包含依次靠前，同一匹配方式下
+        靠前声明的字段优先，再按ID排列。
+        """
+        keyword = keyword.lower()
+        texts = [f"lower(coalesce({_field_expr(field)}, ''))" for field in fields]
+        where = ' WHERE ' + ' OR '.join(f'instr({text}, ?) > 0' for text in texts)
+        cases = []
+        for op in ('{} = ?', 'instr({}, ?) = 1'):
+            cases.extend(f'WHEN {op.format(text)} THEN {len(cases)}' for text in texts)
+        order_by = f'CASE {" ".join(cases)} ELSE {len(cases)} END, id'
+        params = [keyword] * (len(fields) * 3)
+        return self._select(where, params, limit, order_by=order_by)
+
+    # QueryCondition 运算符对应的SQL比较
+    OPERATORS = {'eq': '=', 'gt': '>', 'lt': '<', 'ge': '>=', 'le': '<='}
+
+    def _query_where(self, conditions: Sequence[Any]):
+        """把查询条件翻译为SQL条件子句，由SQLite查询优化器选择索引"""
+        clauses = []
+        params = []
+        for c in conditions:
+            if not c.field or c.value is None:
+                continue
+            expr = _field_expr(c.field)
+            if c.operator in self.OPERATORS:
+                clauses.append(f'{expr} {self.OPERATORS[c.operator]} ?')
+                params.append(c.value)
+            elif c.operator == 'ne':
+                clauses.append(f'({expr} IS NULL OR {expr} != ?)')
+                params.append(c.value)
+            elif c.operator == 'contains':
+                clauses.append(f"instr(lower(coalesce({expr}, '')), ?) > 0")
+                params.append(str(c.value).lower())
+            elif c.operator == 'in':
+                values = [value for value in c.value if value is not None]
+                clause = f'{expr} IN ({", ".join("?" * len(values))})'
+                if len(values) < len(c.value):
+                    clause = f'({clause} OR {expr} IS NULL)'
+                clauses.append(clause)
+                params.extend(values)
+            else:
+                clauses.append('0')
+        return clauses, params
+
+    def _query_sql(self, conditions: Sequence[Any], order_by: Optional[str], descending: bool,
+                   limit: Optional[int], offset: int, after: Optional[tuple] = None):
+        clauses, params = self._query_where(conditions)
+        if after is not None:
+            # 键集分页：排在游标 (取值, id) 之后，取值为空的记录排在最后
+            order_by = order_by or 'id'
+            expr = _field_expr(order_by)
+            value, item_id = after
+            if value is None:
+                clauses.append(f'({expr} IS NULL AND id > ?)')
+                params.append(item_id)
+            else:
+                clauses.append(f'({expr} {"<" if descending else ">"} ? OR ({expr} = ? AND id > ?) OR {expr} IS NULL)')
+                params.extend([value, value, item_id])
+        sql = f'SELECT data FROM {self.quoted}'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        if order_by:
+            # 与 MemoryTable.query 一致，取值为空的记录排在最后
+            sql += f' ORDER BY {_field_expr(order_by)} {"DESC" if descending else "ASC"} NULLS LAST, id'
+        else:
+            sql += ' ORDER BY id'
+        if limit is not None or offset:
+            sql += f' LIMIT {-1 if limit is None else int(limit)} OFFSET {int(offset)}'
+        return sql, params
+
+    def query(self, conditions: Sequence[Any], order_by: Optional[str] = None, descending: bool = False,
+              limit: Optional[int] = None, offset: int = 0, after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """执行查询：conditions 为 QueryCondition 列表（全部满足），order_by 为排序字段，after 为键集分页游标"""
+        sql, params = self._query_sql(conditions, order_by, descending, limit, offset, after)
+        return [json.loads(row[0]) for row in self._conn().execute(sql, params)]
+
+    def count_where(self, conditions: Sequence[Any]) -> int:
+        """满足查询条件的记录数量"""
+        clauses, params = self._query_where(conditions)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return self._conn().execute(f'SELECT COUNT(*) FROM {self.quoted}{where}', params).fetchone()[0]
+
+    def distinct(self, field: str) -> List[Any]:
+        """字段的不同取值（不含空值），升序排列"""
+        expr = _field_expr(field)
+        sql = f'SELECT DISTINCT {expr} FROM {self.quoted} WHERE {expr} IS NOT NULL ORDER BY 1'
+        return [row[0] for row in self._conn().execute(sql)]
+
+    def explain(self, conditions: Sequence[Any], order_by: Optional[str] = None, descending: bool = False,
+                limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        """返回 SQLite 的查询计划（EXPLAIN QUERY PLAN）"""
+        sql, params = self._query_sql(conditions, order_by, descending, limit, offset)
+        details = [row[-1] for row in self._conn().execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        access = 'scan'
+        if any('PRIMARY KEY' in detail for detail in details):
+            access = 'primary'
+        elif any('INDEX' in detail for detail in details):
+            access = 'index'
+        return {'table': self.name, 'access': access, 'sql': sql, 'plan': details,
+                'limit': limit, 'offset': offset}
+
+    def count(self) -> int:
+        """获取记录数量"""
+        return self._conn().execute(f'SELECT COUNT(*) FROM {self.quoted}').fetchone()[0]
+
+    def insert(self, item: Dict[str, Any]):
+        """插入记录"""
+        self._conn().execute(
+            f'INSERT OR REPLACE INTO {self.quoted} (id, data) VALUES (?, ?)',
+            (item.get('id'), _dumps(item))
+        )
+
+    def update(self, item_id: Any, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新记录，返回更新后的记录"""
+        # 读-改-写在同一个事务中完成（已处于事务中时并入外层事务）
+        with self.store.transaction():
+            conn = self._conn()
+            item = self.get(item_id)
+            if item is not None:
+                item.update(values)
+                conn.execute(f'UPDATE {self.quoted} SET data = ? WHERE id = ?', (_dumps(item), item_id))
+        return item
+
+    def delete_where(self, filters: Dict[str, Any]) -> int:
+        """删除满足条件的所有记录，返回删除数量"""
+        where, params = self._where(filters)
+        return self._conn().execute(f'DELETE FROM {self.quoted}{where}', params).rowcount
+
+    def next_id(self) -> int:
+        """分配下一个ID：从本进程预留的ID段中取号，用完时在一个数据库事务里再预留 ID_BLOCK 个"""
+        while True:
+            block = self._ids
+            item_id = block.take()
+            if item_id is not None:
+                return item_id
+            if self._conn().in_transaction:
+                # 外层事务回滚时预留也会撤销，其他进程可能再次分配这些ID，事务中不预留ID段
+                return self.reserve_ids(1).start
+            with self._ids_lock:
+                if self._ids is block:
+                    ids = self.reserve_ids(self.ID_BLOCK)
+                    self._ids = IdBlock(ids.start, ids.stop)
+
+    def reserve_ids(self, count: int) -> range:
+        """一次预留 count 个连续的ID（批量创建时使用）"""
+        with self.store.transaction():
+            conn = self._conn()
+            row = conn.execute('SELECT value FROM _next_id WHERE name = ?', (self.name,)).fetchone()
+            start = row[0] if row else 1
+            conn.execute('INSERT OR REPLACE INTO _next_id (name, value) VALUES (?, ?)', (self.name, start + count))
+        return range(start, start + count)
+
+    def sync_next_id(self):
+        """Ensure next_id is at least max existing id + 1 after manual edits."""
+        conn = self._conn()
+        max_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {self.quoted}').fetchone()[0]
+        conn.execute(
+            'INSERT INTO _next_id (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)',
+            (self.name, max_id + 1)
+        )
+        # 手工添加的记录可能占用了已预留的ID，放弃当前ID段
+        self._ids = IdBlock()
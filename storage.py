@@ -0,0 +1,1272 @@
+# storage.py
+"""
+共享数据存储
+
+DataStore 持有全部数据表，负责加载、快照与WAL日志、事务、推迟保存和多进程共享；
+数据表本身见 memory_table.py，按月分区的表见 partitions.py。
+"""
+import json
+import marshal
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from memory_table import CompactRow, MemoryTable, _binary_rows, _gc_paused, _json_default, _restore_rows
+
+# 二进制快照文件头：魔数 + 格式版本 + marshal 版本，任一不符时回退到JSON
+BINARY_MAGIC = b'SMSSNAP'
+BINARY_VERSION = 1
+
+
+class RWLock:
+    """读写锁：多个读者可以同时持有读锁，写者独占
+
+    读写轮流：有写者等待时新来的读者排队，写者不会被源源不断的读者饿死；写者释放时，
+    已在排队的读者整批先于下一个写者进入，持续写入时读者也不会饿死。
+    写锁可重入，持有写锁的线程可以直接读；读锁按线程计数可重入，已持有读锁的线程再次读取
+    不会被等待中的写者挡住。不支持把读锁升级为写锁（两个读者同时升级会死锁），此时抛出 RuntimeError。
+    直接用作上下文管理器（with lock:）时获取写锁，与互斥锁的用法一致；read() 获取读锁。
+    before_write / after_write 为最外层获取写锁之后、释放写锁之前调用的钩子（共享模式下用于跨进程同步）。
+    """
+
+    def __init__(self):
+        # 状态锁直接用 with 获取（比经过 Condition 快），读者和写者分别在各自的条件变量上等待
+        self._mutex = threading.Lock()
+        self._can_read = threading.Condition(self._mutex)
+        self._can_write = threading.Condition(self._mutex)
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+        self._waiting_readers = 0
+        self._waiting_writers = 0
+        # 写者释放时放行的排队读者中尚未进入的数量，放行完之前写者不能进入
+        self._admitting = 0
+        # 已完成的写锁次数，排队的读者据此判断是否已经轮到自己
+        self._writes = 0
+        # 线程局部：reads 为本线程读锁的嵌套深度，counted 表示是否计入了 _readers
+        self._local = threading.local()
+        self.before_write: Optional[Callable[[], None]] = None
+        self.after_write: Optional[Callable[[], None]] = None
+        # 本次持有写锁时执行过 before_write 才在释放时执行对应的 after_write
+        self._release_hook: Optional[Callable[[], None]] = None
+
+    def acquire_read(self):
+        local = self._local
+        depth = getattr(local, 'reads', 0)
+        local.reads = depth + 1
+        if depth:
+            return
+        with self._mutex:
+            if self._writer == threading.get_ident():
+                local.counted = False
+                return
+            if self._writer is not None or self._waiting_writers:
+                ticket = self._writes
+                self._waiting_readers += 1
+                while self._writer is not None or self._writes == ticket:
+                    self._can_read.wait()
+                self._waiting_readers -= 1
+                if self._admitting:
+                    self._admitting -= 1
+            self._readers += 1
+            local.counted = True
+
+    def release_read(self):
+        local = self._local
+        local.reads -= 1
+        if local.reads or not local.counted:
+            return
+        with self._mutex:
+            self._readers -= 1
+            if not self._readers and not self._admitting:
+                self._can_write.notify()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self._mutex:
+            if self._writer == me:
+                self._writer_depth += 1
+                return True
+            if getattr(self._local, 'reads', 0):
+                raise RuntimeError('cannot upgrade a read lock to a write lock')
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers or self._admitting:
+                    self._can_write.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+        self._release_hook = None
+        if self.before_write is not None:
+            try:
+                self.before_write()
+            except BaseException:
+                self._release()
+                raise
+            self._release_hook = self.after_write
+        return True
+
+    def release(self):
+        hook = self._release_hook if self._writer_depth == 1 else None
+        if hook is not None:
+            self._release_hook = None
+            try:
+                hook()
+            finally:
+                self._release()
+        else:
+            self._release()
+
+    def _release(self):
+        with self._mutex:
+            self._writer_depth -= 1
+            if self._writer_depth:
+                return
+            self._writer = None
+            self._writes += 1
+            if self._waiting_readers:
+                self._admitting = self._waiting_readers
+                self._can_read.notify_all()
+            else:
+                self._can_write.notify()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+
+class _FileLock:
+    """跨进程的排他文件锁（POSIX 用 flock，Windows 用 msvcrt.locking），同一进程内可重入
+
+    只在持有数据写锁时获取，进程内的线程已经互斥，这里不再加线程锁。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._depth = 0
+
+    def acquire(self):
+        if not self._depth:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    # LK_LOCK 重试约10秒后仍失败会抛出 OSError，继续等待
+                    while True:
+                        try:
+                            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            pass
+            except BaseException:
+                os.close(fd)
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+
+class DataStore:
+    """共享数据存储，整个数据文件只解析一次，所有仓储共享同一份内存数据
+
+    持久化模式：
+    - snapshot: 每次保存把全部数据重写到JSON文件（默认）
+    - journal:  每次变更只向预写日志(WAL)追加一条紧凑记录，日志过大时在后台压缩为新快照
+    启动时总是先加载快照，再重放WAL中的记录。
+
+    存储布局：
+    - single: 所有表保存在同一个JSON文件中（默认）
+    - split:  data_file 为目录，每张表一个 <表名>.jsonl 文件（每行一条记录），
+              另有 next_id.json；表在首次被访问时才加载，保存时只重写有变更的表
+    数据在首次访问时才加载，仓储创建时不会读取文件。
+
+    binary_snapshot 为真时，每个JSON快照文件旁还会写一份同名 .bin 二进制快照（marshal），
+    加载时若二进制快照不比JSON旧则优先使用，省去JSON解析；JSON始终是权威数据，可手工编辑。
+
+    快照总是先写入临时文件、fsync后再原子替换，崩溃或并发读取都不会看到半截文件。
+    并发的保存请求采用组提交：正在写盘时到达的请求合并为下一次写入，
+    group_commit_window 可再等待一小段时间收集更多请求。
+    lock 为读写锁：写操作独占，读操作共享，读者之间互不阻塞，也不会看到写到一半的状态。
+    记录写入后不再原地修改（更新时整条替换），读操作返回的记录和 rows() 的列表都是一致的快照；
+    写快照时只在锁内浅拷贝各表，序列化和写盘在锁外进行，不阻塞读写。
+    transaction() 把跨表的多次变更作为一个工作单元：提交时只保存一次，异常时全部撤销；
+    after_commit() 登记的回调（如发布变更事件）在提交后执行，回滚时丢弃。
+    defer_saves() 之后当前线程的 save() 只累积变更，由 flush() 一次性写出有变更的表
+    （Web 请求开始时推迟，响应生成后刷新，每个请求最多写一次）。
+
+    共享模式（set_shared）：多个进程（如 gunicorn 的多个 worker）共用同一份数据文件。
+    使用 journal 模式，每次获取写锁时先加文件锁并读入其他进程追加的WAL，释放写锁前把本次变更
+    追加到WAL再解锁，各进程的写入按文件锁串行、互不覆盖。压缩快照时递增版本文件中的快照代数
+    和有变更的表的版本号；其他进程发现代数变化时只重新加载版本号变化的表，否则只重放新增的WAL。
+    refresh() 读入其他进程的变更（Web 请求开始时调用）。
+
+    外部修改：reload_external_changes() 按修改时间和大小检查加载或写入过的JSON文件，
+    发现手工编辑后只重新加载内容有变化的表，新数据在锁外解析并建好索引，期间继续使用旧数据。
+    """
+
+    MODES = ('snapshot', 'journal')
+    LAYOUTS = ('single', 'split')
+    # 所有写入都经过本进程，仓储可以缓存模型实例
+    cache_models = True
+
+    _registry: Dict[str, 'DataStore'] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, data_file: str = 'app_data.json', mode: str = 'snapshot',
+                 layout: str = 'single', seed_file: Optional[str] = None):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown storage layout: {layout}")
+        self.data_file = data_file
+        self.layout = layout
+        if layout == 'split':
+            self.wal_file = os.path.join(data_file, 'journal.wal')
+        else:
+            self.wal_file = data_file + '.wal'
+        self.mode = mode
+        self.wal_compact_bytes = 4 * 1024 * 1024
+        self.group_commit_window = 0.0
+        self.binary_snapshot = False
+        self.lock = RWLock()
+        # 惰性加载锁：持有读锁的线程首次访问时加载数据、建立索引，彼此之间需要互斥
+        self._load_lock = threading.RLock()
+        self._pending: List[str] = []
+        self._compacting = False
+        self._tables: Dict[str, 'MemoryTable'] = {}
+        self._partitioned: Dict[str, 'PartitionedTable'] = {}
+        # split 布局下目录中已有的表文件（首次用到时列出）
+        self._listed: Optional[set] = None
+        # 有未写入快照的变更的表
+        self._dirty = set()
+        # split 布局下尚未加载的表在WAL中的记录：表名 -> 日志列表
+        self._deferred: Dict[str, List[Dict[str, Any]]] = {}
+        # 进行中事务的撤销日志 [(表, 操作, ID, 变更前的状态)] 及所属线程，无事务时为 None
+        self._undo: Optional[List[tuple]] = None
+        self._undo_thread: Optional[int] = None
+        # 进行中事务提交后要执行的回调
+        self._committed: List[Callable[[], None]] = []
+        # 线程局部状态：deferred 为真时本线程的 save() 推迟到 flush()
+        self._local = threading.local()
+        # 共享模式状态：已读入的WAL字节数、快照代数、各表版本号、版本文件的修改时间
+        self.shared = False
+        self._file_lock: Optional[_FileLock] = None
+        self._wal_offset = 0
+        self._generation: Optional[int] = None
+        self._table_versions: Dict[str, int] = {}
+        self._version_stamp: Optional[int] = None
+        # 已加载或写入的JSON文件 -> (修改时间, 大小)，用于发现外部修改
+        self._file_stamps: Dict[str, Optional[tuple]] = {}
+
+        # 文件写入锁：同一时刻只有一个线程写快照或WAL
+        self._io_lock = threading.Lock()
+        # 组提交状态
+        self._commit_cond = threading.Condition()
+        self._commit_requested = 0
+        self._commit_completed = 0
+        self._committing = False
+        self._last_commit_ok = True
+
+        self._data: Optional[Dict[str, Any]] = None
+        self._loaded = False
+        if layout == 'split':
+            os.makedirs(data_file, exist_ok=True)
+            if seed_file and not os.path.exists(self._next_id_file()):
+                self._import_json(seed_file)
+
+    @classmethod
+    def open(cls, data_file: str = 'app_data.json', layout: str = 'single',
+             seed_file: Optional[str] = None) -> 'DataStore':
+        """获取数据文件（目录）对应的共享存储实例（同一路径只加载一次）"""
+        key = os.path.abspath(data_file)
+        with cls._registry_lock:
+            store = cls._registry.get(key)
+            if store is None:
+                store = cls(data_file, layout=layout, seed_file=seed_file)
+                cls._registry[key] = store
+            return store
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """内存数据，首次访问时加载快照并重放WAL"""
+        if not self._loaded:
+            with self._load_lock:
+                # 重放WAL的过程中会再次访问，此时 _data 已就绪
+                if self._data is None:
+                    with _gc_paused():
+                        self._data = self._load_data()
+                        self._replay_wal()
+                    self._loaded = True
+        return self._data
+
+    def _load_data(self) -> Dict[str, Any]:
+        """从JSON文件加载数据（split 布局只加载 next_id，各表按需加载）"""
+        # 先记录文件状态再读取，读取期间的修改会在下次检查时发现
+        path = self._next_id_file() if self.layout == 'split' else self.data_file
+        self._file_stamps[path] = self._stamp(path)
+        if self.layout == 'split':
+            data = {}
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data['next_id'] = json.load(f)
+                except (json.JSONDecodeError, OSError) as e:
+                    # 丢失的 next_id 会在各表加载时按最大ID补齐
+                    print(f"Error loading data from {path}: {e}")
+                    self._preserve_corrupt_file(path)
+        elif os.path.exists(self.data_file):
+            data = self._load_binary(self.data_file)
+            if data is not None:
+                tables = data.get('in_memory_data', {})
+                for table_name, items in tables.items():
+                    tables[table_name] = _restore_rows(items)
+            else:
+                try:
+                    with open(self.data_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (json.JSONDecodeError, Exception) as e:
+                    print(f"Error loading data from {self.data_file}: {e}")
+                    self._preserve_corrupt_file(self.data_file)
+                    data = {}
+        else:
+            data = {}
+        data.setdefault('in_memory_data', {})
+        data.setdefault('next_id', {})
+        return data
+
+    def _table_file(self, table_name: str) -> str:
+        return os.path.join(self.data_file, table_name + '.jsonl')
+
+    def _next_id_file(self) -> str:
+        return os.path.join(self.data_file, 'next_id.json')
+
+    @staticmethod
+    def _binary_file(path: str) -> str:
+        return os.path.splitext(path)[0] + '.bin'
+
+    def _load_binary(self, path: str) -> Any:
+        """加载JSON文件对应的二进制快照；不存在、比JSON旧或版本不符时返回 None"""
+        binary = self._binary_file(path)
+        try:
+            if os.path.getmtime(binary) < os.path.getmtime(path):
+                return None
+            with open(binary, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return None
+        header = BINARY_MAGIC + bytes([BINARY_VERSION, marshal.version])
+        if not raw.startswith(header):
+            print(f"Ignoring binary snapshot {binary}: incompatible format")
+            return None
+        try:
+            return marshal.loads(memoryview(raw)[len(header):])
+        except (EOFError, ValueError, TypeError) as e:
+            print(f"Error loading binary snapshot {binary}: {e}")
+            return None
+
+    @staticmethod
+    def _dump_binary(obj: Any) -> bytes:
+        return BINARY_MAGIC + bytes([BINARY_VERSION, marshal.version]) + marshal.dumps(obj)
+
+    def _load_table(self, table_name: str, strict: bool = False) -> list:
+        """split 布局下从表文件加载记录（strict 为真时文件损坏抛出异常，而不是返回空表）"""
+        path = self._table_file(table_name)
+        self._file_stamps[path] = self._stamp(path)
+        if not os.path.exists(path):
+            return []
+        items = self._load_binary(path)
+        if items is not None:
+            return _restore_rows(items)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error loading table {table_name} from {path}: {e}")
+            self._preserve_corrupt_file(path)
+            if strict:
+                raise
+            return []
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[tuple]:
+        """文件的 (修改时间, 大小)，不存在时为 None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def _dump_rows(items: list) -> str:
+        return ''.join(
+            json.dumps(item, ensure_ascii=False, separators=(',', ':'), default=_json_default) + '\n'
+            for item in items if item is not None
+        )
+
+    def _import_json(self, seed_file: str):
+        """首次使用 split 布局时把单文件数据拆分为各表文件"""
+        if not os.path.exists(seed_file):
+            return
+        try:
+            with open(seed_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error importing data from {seed_file}: {e}")
+            return
+        for table_name, items in data.get('in_memory_data', {}).items():
+            self._atomic_write(self._table_file(table_name), self._dump_rows(items))
+        self._atomic_write(self._next_id_file(), json.dumps(data.get('next_id', {}), ensure_ascii=False, indent=4))
+        # 已封存的分段原样复制
+        segments = os.path.splitext(seed_file)[0] + '_segments'
+        if os.path.isdir(segments):
+            shutil.copytree(segments, self.segment_dir(), dirs_exist_ok=True)
+        print(f"✅ 已从 {seed_file} 导入数据到 {self.data_file}")
+
+    def table(self, table_name: str, indexes: Sequence[Any] = (), compact: bool = False,
+              range_indexes: Sequence[str] = (), search_fields: Sequence[str] = (),
+              partition_by: Optional[str] = None) -> 'MemoryTable':
+        """获取数据表的访问对象（表不存在则创建）
+
+        compact 为真时表中记录改用 CompactRow 保存，适用于记录数很大的表；
+        range_indexes 中的字段建立有序索引，支持 find_range 范围查询；
+        search_fields 中的字段建立二元组倒排索引，加速 search 子串搜索；
+        partition_by 为日期字段时返回按该字段月份分区的 PartitionedTable。
+        """
+        with self.lock:
+            if partition_by is not None:
+                table = self._partitioned.get(table_name)
+                if table is None:
+                    # 分区表的封存分段本身是只读的 DataStore，在这里导入避免循环引用
+                    from partitions import PartitionedTable
+                    table = PartitionedTable(self, table_name, partition_by)
+                    self._partitioned[table_name] = table
+                table.declare(indexes, compact, range_indexes, search_fields)
+                return table
+            table = self._tables.get(table_name)
+            if table is None:
+                table = MemoryTable(self, table_name)
+                self._tables[table_name] = table
+            if compact:
+                table.make_compact()
+            table.ensure_indexes(indexes)
+            table.ensure_range_indexes(range_indexes)
+            table.ensure_search_indexes(search_fields)
+            return table
+
+    def table_names(self) -> set:
+        """已知的全部表名：内存中的表，以及尚未加载的表（split 布局的表文件、WAL中的记录）"""
+        names = set(self.data['in_memory_data'])
+        names.update(self._deferred, self._table_versions)
+        if self.layout == 'split':
+            if self._listed is None:
+                with self._load_lock:
+                    if self._listed is None:
+                        self._listed = {f[:-len('.jsonl')] for f in os.listdir(self.data_file) if f.endswith('.jsonl')}
+            names.update(self._listed)
+        return names
+
+    def _drop_table(self, table_name: str):
+        """从存储中移除一张表（调用方需持有写锁），split 布局同时删除表文件
+
+        表中的变更必须已经写入快照（不在 _dirty 中），否则WAL中残留的记录会在重启时重建出不完整的表。
+        """
+        self._tables.pop(table_name, None)
+        self.data['in_memory_data'].pop(table_name, None)
+        self._dirty.discard(table_name)
+        self._deferred.pop(table_name, None)
+        if self.layout == 'split':
+            if self._listed is not None:
+                self._listed.discard(table_name)
+            path = self._table_file(table_name)
+            for file in (path, self._binary_file(path)):
+                self._file_stamps.pop(file, None)
+                try:
+                    os.remove(file)
+                except FileNotFoundError:
+                    pass
+
+    def segment_dir(self) -> str:
+        """封存分段所在的目录：split 布局为数据目录下的 segments，single 布局为数据文件旁的 <文件名>_segments"""
+        if self.layout == 'split':
+            return os.path.join(self.data_file, 'segments')
+        return os.path.splitext(self.data_file)[0] + '_segments'
+
+    def _rows(self, table_name: str) -> list:
+        """获取数据表的记录列表（split 布局下首次访问时从表文件加载，不存在则创建）"""
+        tables = self.data['in_memory_data']
+        items = tables.get(table_name)
+        if items is None:
+            with self._load_lock:
+                items = tables.get(table_name)
+                if items is None:
+                    with _gc_paused():
+                        items = self._load_table(table_name) if self.layout == 'split' else []
+                    tables[table_name] = items
+                    entries = self._deferred.pop(table_name, None)
+                    if entries:
+                        self._apply_entries(table_name, entries)
+        return items
+
+    def _preserve_corrupt_file(self, path: str):
+        """加载失败时先备份原文件，避免之后的保存把它覆盖掉"""
+        backup = f"{path}.corrupt-{int(time.time())}"
+        try:
+            shutil.copy2(path, backup)
+            print(f"Corrupt data file preserved as {backup}")
+        except OSError as e:
+            print(f"Error preserving corrupt data file: {e}")
+
+    def set_mode(self, mode: str):
+        """切换持久化模式"""
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown persistence mode: {mode}")
+        if self.shared and mode != 'journal':
+            raise ValueError("Shared storage requires journal mode")
+        with self.lock:
+            if mode == self.mode:
+                return
+            self.mode = mode
+            self._pending = []
+        # 切换后立即写一次完整快照，保证快照与日志从同一起点开始
+        with self._io_lock:
+            self._write_snapshot(self._serialize())
+
+    # ---- 多进程共享 ----
+
+    def set_shared(self, shared: bool = True):
+        """开启共享模式（不可关闭），应在访问数据之前调用
+
+        切换到 journal 模式但不重写快照：磁盘上的快照和WAL可能正被其他进程使用。
+        其他进程可能修改数据，仓储不再缓存模型实例（仓储需重新 bind）。
+        """
+        if not shared or self.shared:
+            return
+        with self.lock:
+            self.mode = 'journal'
+            self.shared = True
+            self.cache_models = False
+            lock_file = os.path.join(self.data_file, 'store.lock') if self.layout == 'split' else self.data_file + '.lock'
+            self._file_lock = _FileLock(lock_file)
+            self.lock.before_write = self._begin_write
+            self.lock.after_write = self._end_write
+        # 在文件锁内加载数据，或读入其他进程的变更
+        with self.lock:
+            pass
+
+    def refresh(self) -> bool:
+        """共享模式下读入其他进程写入的变更，返回是否有变更；没有变更时只检查文件状态，不加锁"""
+        if not self.shared or not self._changed_on_disk():
+            return False
+        with self.lock:
+            pass
+        return True
+
+    def _version_file(self) -> str:
+        if self.layout == 'split':
+            return os.path.join(self.data_file, 'version.json')
+        return self.data_file + '.version'
+
+    def _read_version(self) -> Dict[str, Any]:
+        """读取版本文件：{generation: 快照代数, tables: {表名: 版本号}}"""
+        path = self._version_file()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                version = json.load(f)
+        except FileNotFoundError:
+            version = {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error loading version file {path}: {e}")
+            version = {}
+        return {'generation': version.get('generation', 0), 'tables': version.get('tables', {})}
+
+    def _set_version(self, version: Dict[str, Any]):
+        self._generation = version['generation']
+        self._table_versions = dict(version['tables'])
+        try:
+            self._version_stamp = os.stat(self._version_file()).st_mtime_ns
+        except OSError:
+            self._version_stamp = None
+
+    def _changed_on_disk(self) -> bool:
+        """WAL长度或版本文件与上次读入时不同"""
+        try:
+            wal_size = os.path.getsize(self.wal_file)
+        except OSError:
+            wal_size = 0
+        try:
+            stamp = os.stat(self._version_file()).st_mtime_ns
+        except OSError:
+            stamp = None
+        return wal_size != self._wal_offset or stamp != self._version_stamp
+
+    def _begin_write(self):
+        """共享模式下最外层写锁的获取钩子：加文件锁，加载数据或读入其他进程的变更"""
+        self._file_lock.acquire()
+        try:
+            if self._loaded:
+                self._catch_up()
+            else:
+                self._set_version(self._read_version())
+                self.data
+        except BaseException:
+            self._file_lock.release()
+            raise
+
+    def _end_write(self):
+        """共享模式下最外层写锁的释放钩子：把本次变更追加到WAL后释放文件锁
+
+        写入失败的日志留在队列中，下一次写锁释放时重试。
+        """
+        try:
+            lines, self._pending = self._pending, []
+            if lines:
+                if self._append_wal(lines):
+                    # 持有文件锁期间其他进程不会追加，WAL末尾就是本进程写入的位置
+                    self._wal_offset = os.path.getsize(self.wal_file)
+                else:
+                    self._pending[:0] = lines
+        finally:
+            self._file_lock.release()
+
+    def _catch_up(self):
+        """读入其他进程的变更（调用方需持有写锁和文件锁）"""
+        if self._generation is None:
+            self._set_version(self._read_version())
+        elif not self._changed_on_disk():
+            return
+        version = self._read_version()
+        if version['generation'] != self._generation:
+            self._reload_changed(version)
+        try:
+            size = os.path.getsize(self.wal_file)
+        except OSError:
+            size = 0
+        if size < self._wal_offset:
+            print(f"WAL {self.wal_file} shrank without a new snapshot, replaying from the start")
+            self._wal_offset = 0
+        if size == self._wal_offset:
+            return
+        with open(self.wal_file, 'rb') as f:
+            f.seek(self._wal_offset)
+            entries, consumed = self._parse_wal(f.read())
+        self._wal_offset += consumed
+        self._apply_remote(entries)
+
+    def _reload_changed(self, version: Dict[str, Any]):
+        """其他进程压缩了快照：重新加载版本号变化的表，之后从头读取新的WAL（调用方需持有写锁和文件锁）"""
+        changed = [name for name, number in version['tables'].items() if self._table_versions.get(name) != number]
+        snapshot = self._load_data()
+        tables = self.data['in_memory_data']
+        for name in changed:
+            # 快照已包含这些表在旧WAL中的全部变更
+            self._deferred.pop(name, None)
+            if self.layout == 'split':
+                if name not in tables:
+                    # 尚未加载的表首次访问时直接读取新的表文件
+                    continue
+                items = self._load_table(name)
+            else:
+                items = snapshot['in_memory_data'].get(name, [])
+            table = self._tables.get(name)
+            if table is not None:
+                table._replace_rows(items)
+            else:
+                tables[name] = items
+        next_ids = self.data['next_id']
+        for name, next_id in snapshot['next_id'].items():
+            next_ids[name] = max(next_ids.get(name, 1), next_id)
+        # 磁盘快照已包含此前所有进程的变更
+        self._dirty = set()
+        self._set_version(version)
+        self._wal_offset = 0
+        if changed:
+            print(f"Reloaded tables {', '.join(sorted(changed))} from snapshot generation {version['generation']}")
+
+    def _apply_remote(self, entries: List[Dict[str, Any]]):
+        """把其他进程写入的WAL记录应用到内存数据，只涉及其中出现的表"""
+        next_ids = self.data['next_id']
+        by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            if entry['op'] == 'next_id':
+                next_ids[entry['t']] = max(next_ids.get(entry['t'], 1), entry['v'])
+            else:
+                by_table.setdefault(entry['t'], []).append(entry)
+        for name, table_entries in by_table.items():
+            table = self._tables.get(name)
+            if self.layout == 'split' and name not in self.data['in_memory_data']:
+                # 尚未加载的表，首次访问时与启动时的WAL记录一起重放
+                self._deferred.setdefault(name, []).extend(table_entries)
+            elif table is not None and table._loaded:
+                table._apply_log(table_entries)
+            else:
+                self._apply_entries(name, table_entries)
+            self._dirty.add(name)
+
+    # ---- 外部修改 ----
+
+    def reload_external_changes(self) -> List[str]:
+        """检查数据文件是否被外部修改（如手工编辑），只重新加载内容有变化的表，返回这些表名
+
+        新文件在数据锁外解析、与当前数据比较并建好索引，期间继续用旧数据提供读写，
+        最后在写锁内一次性换上。journal 模式下WAL和尚未写入的日志会重新应用到新数据上，
+        与重启后的结果一致；snapshot 模式下有未保存变更的表保留内存中的数据，
+        之后的保存会覆盖对该表的外部修改。共享模式由 refresh() 同步，不在这里检查。
+        """
+        if self.shared or not self._loaded:
+            return []
+        # 持有 _io_lock 期间本进程不会写快照或追加WAL，文件的变化只可能来自外部
+        with self._io_lock:
+            changed = [path for path, stamp in list(self._file_stamps.items()) if self._stamp(path) != stamp]
+            if not changed:
+                return []
+            try:
+                tables, next_ids = self._read_changed(changed)
+            except (json.JSONDecodeError, OSError):
+                # 文件可能还在编辑中，已记录新的文件状态，等下一次修改后再加载
+                return []
+            # 记录写入后不再修改，在读锁内取得当前各表的浅拷贝，比较和建立索引都在锁外进行
+            with self.lock.read():
+                journal = self.mode == 'journal'
+                pending = list(self._pending)
+                dirty = set(self._dirty)
+                current = {name: self._current_rows(name) for name in tables}
+            entries = self._journal_entries(pending) if journal else {}
+            prepared = {}
+            for name, items in tables.items():
+                self._replay_rows(items, entries.get(name, []))
+                if items == current[name]:
+                    continue
+                if not journal and name in dirty:
+                    print(f"⚠️ 表 {name} 在外部修改的同时有未保存的变更，保留内存中的数据")
+                    continue
+                table = self._tables.get(name)
+                prepared[name] = table._prepare(items) if table is not None and table._loaded else items
+
+            with self.lock:
+                # 比较之后其他线程写入的日志，换上新数据后重新应用
+                late = self._group_entries(json.loads(line) for line in self._pending[len(pending):]) \
+                    if journal else {}
+                reloaded = []
+                for name, state in prepared.items():
+                    if not journal and name in self._dirty:
+                        print(f"⚠️ 表 {name} 在外部修改的同时有未保存的变更，保留内存中的数据")
+                        continue
+                    table = self._tables.get(name)
+                    if table is not None and table._loaded:
+                        table._install(state)
+                        table._apply_log(late.get(name, []))
+                    else:
+                        self._replay_rows(state, late.get(name, []))
+                        self.data['in_memory_data'][name] = state
+                    reloaded.append(name)
+                current_ids = self.data['next_id']
+                for name, next_id in next_ids.items():
+                    current_ids[name] = max(current_ids.get(name, 1), next_id)
+        if reloaded:
+            print(f"🔄 已重新加载外部修改的表: {', '.join(sorted(reloaded))}")
+        return reloaded
+
+    def _read_changed(self, paths: List[str]) -> tuple:
+        """读取有变化的文件，返回 ({表名: 记录列表}, next_id)"""
+        if self.layout == 'single':
+            self._file_stamps[self.data_file] = self._stamp(self.data_file)
+            with open(self.data_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get('in_memory_data', {}), data.get('next_id', {})
+        tables = {}
+        next_ids = {}
+        for path in paths:
+            if path == self._next_id_file():
+                next_ids = self._load_data()['next_id']
+            else:
+                name = os.path.basename(path)[:-len('.jsonl')]
+                tables[name] = self._load_table(name, strict=True)
+        return tables, next_ids
+
+    def _current_rows(self, table_name: str) -> Optional[list]:
+        """表中当前有效记录的浅拷贝，表不存在时为 None（调用方需持有锁）"""
+        table = self._tables.get(table_name)
+        if table is not None and table._loaded:
+            return list(table._scan())
+        items = self.data['in_memory_data'].get(table_name)
+        return list(items) if items is not None else None
+
+    def _journal_entries(self, pending: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """WAL文件和尚未写入的日志中各表的记录，即快照之后本进程的全部变更"""
+        try:
+            with open(self.wal_file, 'rb') as f:
+                entries = self._parse_wal(f.read())[0]
+        except FileNotFoundError:
+            entries = []
+        return self._group_entries(entries + [json.loads(line) for line in pending])
+
+    @staticmethod
+    def _group_entries(entries) -> Dict[str, List[Dict[str, Any]]]:
+        """按表分组日志（不含 next_id）"""
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            if entry['op'] != 'next_id':
+                grouped.setdefault(entry['t'], []).append(entry)
+        return grouped
+
+    # ---- 事务 ----
+
+    def in_transaction(self) -> bool:
+        """当前线程是否处于事务中"""
+        return self._undo is not None and self._undo_thread == threading.get_ident()
+
+    @contextmanager
+    def transaction(self):
+        """工作单元：块内跨表的全部变更在退出时一次性保存，抛出异常时全部撤销
+
+        块内持有写锁，其他线程的读写和保存都要等事务结束，因此未提交的变更既不会落盘也不会被读到；
+        块内调用 save() 不写盘，推迟到提交时统一写入。嵌套的事务并入最外层事务。
+        """
+        if self.in_transaction():
+            yield self
+            return
+        with self.lock:
+            # 未提交的WAL条目和变更表标记在回滚时一并丢弃
+            pending_mark = len(self._pending)
+            dirty = set(self._dirty)
+            self._undo = []
+            self._undo_thread = threading.get_ident()
+            self._committed = committed = []
+            try:
+                yield self
+            except BaseException:
+                self._committed = []
+                undo, self._undo = self._undo, None
+                for table_name, op, item_id, before in reversed(undo):
+                    self._tables[table_name]._undo_change(op, item_id, before)
+                del self._pending[pending_mark:]
+                self._dirty = dirty
+                # 预留的ID段不随事务撤销（可能已在线程间分发），重新记录，保证之后不会再次分配
+                for table_name, op, item_id, before in undo:
+                    if op == 'reserve':
+                        self.record(table_name, 'next_id', values=item_id)
+                raise
+            finally:
+                self._undo = None
+                self._undo_thread = None
+                self._committed = []
+        self.save()
+        for callback in committed:
+            callback()
+
+    def after_commit(self, callback: Callable[[], None]):
+        """当前线程的事务提交后（锁外）调用 callback，回滚时丢弃；不在事务中时立即调用"""
+        if self.in_transaction():
+            self._committed.append(callback)
+        else:
+            callback()
+
+    # ---- 推迟保存 ----
+
+    def defer_saves(self):
+        """之后当前线程的 save() 不再写盘，直到调用 flush()"""
+        self._local.deferred = True
+
+    def has_unsaved_changes(self) -> bool:
+        """是否有尚未写盘的变更"""
+        # journal 模式下变更写入WAL即已落盘，快照中缺少的表(_dirty)由压缩处理
+        return bool(self._pending) if self.mode == 'journal' else bool(self._dirty)
+
+    def flush(self) -> bool:
+        """结束推迟保存，把累积的变更一次性写盘，没有变更时不写
+
+        写入方式与 save() 相同：单文件布局重写整个文件，按表分文件时只写有变更的表，journal 模式只追加日志。
+        """
+        self._local.deferred = False
+        if not self.has_unsaved_changes():
+            return True
+        return self.save()
+
+    def _remember(self, table: str, op: str, item_id: Any, before: Any = None):
+        """事务中记录一次变更的撤销信息（调用方需持有锁）"""
+        if self._undo is not None:
+            self._undo.append((table, op, item_id, before))
+
+    # ---- 变更日志 ----
+
+    def record(self, table: str, op: str, item_id: Any = None, values: Optional[Dict[str, Any]] = None):
+        """记录一次数据变更（仅journal模式下写入WAL，调用方需持有锁）
+
+        op: insert / update / delete / next_id
+        """
+        self._dirty.add(table)
+        if self.mode != 'journal':
+            return
+        entry = {'t': table, 'op': op}
+        if item_id is not None:
+            entry['id'] = item_id
+        if values is not None:
+            entry['v'] = values
+        self._pending.append(json.dumps(entry, ensure_ascii=False, separators=(',', ':')))
+
+    def _replay_wal(self):
+        """启动时重放WAL，重放操作是幂等的（压缩中途崩溃也能正确恢复）"""
+        if not os.path.exists(self.wal_file):
+            return
+        entries: Dict[str, List[Dict[str, Any]]] = {}
+        next_ids = self._data['next_id']
+        with open(self.wal_file, 'rb') as f:
+            raw = f.read()
+        wal_entries, self._wal_offset = self._parse_wal(raw)
+        if raw[self._wal_offset:].strip():
+            # 崩溃时最后一行可能只写了一半，忽略
+            print(f"Skipping incomplete WAL entry in {self.wal_file}")
+        for entry in wal_entries:
+            if entry['op'] == 'next_id':
+                next_ids[entry['t']] = max(next_ids.get(entry['t'], 1), entry['v'])
+            else:
+                entries.setdefault(entry['t'], []).append(entry)
+        count = len(wal_entries)
+        if self.layout == 'split':
+            # 表在首次访问时才加载，对应的日志也推迟到那时重放
+            self._deferred = entries
+        else:
+            for table_name, table_entries in entries.items():
+                self._apply_entries(table_name, table_entries)
+        if count:
+            print(f"Replayed {count} WAL entries from {self.wal_file}")
+
+    def _parse_wal(self, raw: bytes) -> tuple:
+        """解析WAL内容，返回 (日志列表, 读取的字节数)；只读到最后一个完整的行"""
+        end = raw.rfind(b'\n') + 1
+        entries = []
+        for line in raw[:end].decode('utf-8').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping corrupt WAL entry in {self.wal_file}")
+        return entries, end
+
+    def _apply_entries(self, table_name: str, entries: List[Dict[str, Any]]):
+        """把一张表的日志按顺序应用到内存数据"""
+        self._replay_rows(self._rows(table_name), entries)
+        # 快照中还没有这些变更
+        self._dirty.add(table_name)
+
+    @staticmethod
+    def _replay_rows(items: list, entries: List[Dict[str, Any]]):
+        """把日志按顺序应用到记录列表（原地修改）"""
+        pos = {item.get('id'): i for i, item in enumerate(items)}
+        for entry in entries:
+            op = entry['op']
+            item_id = entry.get('id')
+            if op == 'insert':
+                if item_id in pos:
+                    items[pos[item_id]] = entry['v']
+                else:
+                    pos[item_id] = len(items)
+                    items.append(entry['v'])
+            elif op == 'update':
+                if item_id in pos:
+                    item = items[pos[item_id]]
+                    if isinstance(item, CompactRow) and not item.has_fields(entry['v']):
+                        # 新增了字段，先还原为字典，表加载时再重新打包
+                        items[pos[item_id]] = {**item, **entry['v']}
+                    else:
+                        item.update(entry['v'])
+            elif op == 'delete':
+                if item_id in pos:
+                    # 先置为墓碑，重放结束后统一清理
+                    items[pos.pop(item_id)] = None
+        items[:] = [item for item in items if item is not None]
+
+    def _append_wal(self, lines: List[str]) -> bool:
+        """把一批日志一次性追加到WAL文件（调用方需持有 _io_lock，共享模式下为写锁）"""
+        if not lines:
+            return True
+        payload = '\n'.join(lines) + '\n'
+        try:
+            with open(self.wal_file, 'a', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            print(f"❌ 写入日志时发生错误: {e}")
+            return False
+        return True
+
+    # ---- 快照与压缩 ----
+
+    def _capture(self):
+        """取得快照的时间点视图，返回 (包含的变更表, 数据)（调用方需持有锁）
+
+        记录写入后不再原地修改，浅拷贝各表的记录列表即可，序列化由 _render 在锁外进行。
+        single 布局包含全部表，split 布局只包含有变更的表。
+        """
+        if self.layout == 'split':
+            # WAL中尚未加载的表先加载重放，写出快照后WAL才能删除
+            for table_name in list(self._deferred):
+                self._rows(table_name)
+        dirty, self._dirty = self._dirty, set()
+        # 先清理已删除记录留下的墓碑，快照中只保留有效记录
+        for table in self._tables.values():
+            table.vacuum()
+        names = dirty if self.layout == 'split' else self.data['in_memory_data']
+        tables = {name: list(self._rows(name)) for name in names}
+        return dirty, dict(self.data, in_memory_data=tables, next_id=dict(self.data['next_id']))
+
+    def _render(self, captured):
+        """把 _capture 取得的数据序列化为快照，返回 (包含的变更表, 快照内容)
+
+        快照内容为 {文件路径: 文本或二进制}；single 布局是整个数据文件，split 布局只包含有变更的表。
+        """
+        dirty, data = captured
+        # 二进制快照写在JSON之后，修改时间不早于JSON
+        files = {}
+        if self.layout == 'split':
+            for name, items in data['in_memory_data'].items():
+                path = self._table_file(name)
+                files[path] = self._dump_rows(items)
+                if self.binary_snapshot:
+                    files[self._binary_file(path)] = self._dump_binary(_binary_rows(items))
+            files[self._next_id_file()] = json.dumps(data['next_id'], ensure_ascii=False, indent=4)
+            return dirty, files
+        files[self.data_file] = json.dumps(data, ensure_ascii=False, indent=4, default=_json_default)
+        if self.binary_snapshot:
+            tables = {name: _binary_rows(items) for name, items in data['in_memory_data'].items()}
+            files[self._binary_file(self.data_file)] = self._dump_binary(dict(data, in_memory_data=tables))
+        return dirty, files
+
+    def _serialize(self):
+        """把当前数据序列化为快照，只有取时间点视图时持有锁"""
+        with self.lock:
+            captured = self._capture()
+        return self._render(captured)
+
+    @staticmethod
+    def _atomic_write(path: str, content):
+        """先写临时文件并fsync，再原子替换目标文件（content 为文本或二进制）"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+        try:
+            if isinstance(content, bytes):
+                f = os.fdopen(fd, 'wb')
+            else:
+                f = os.fdopen(fd, 'w', encoding='utf-8')
+            with f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # 同步目录项，保证rename本身也落盘（部分平台不支持）
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def _write_snapshot(self, snapshot) -> bool:
+        """写入快照文件，并删除已包含在快照中的WAL（调用方需持有 _io_lock）"""
+        dirty, files = snapshot
+        try:
+            for path, content in files.items():
+                self._atomic_write(path, content)
+                if not isinstance(content, bytes):
+                    # 本进程写入的文件不算外部修改
+                    self._file_stamps[path] = self._stamp(path)
+            if os.path.exists(self.wal_file):
+                os.remove(self.wal_file)
+            return True
+        except Exception as e:
+            print(f"❌ 保存数据时发生错误: {e}")
+            # 这些表仍未写入，下一次保存重试
+            with self.lock:
+                self._dirty.update(dirty)
+            return False
+
+    def compact(self) -> bool:
+        """把当前数据压缩为新快照并清空WAL"""
+        if self.shared:
+            return self._compact_shared()
+        with self._io_lock:
+            # 待写日志的变更已包含在快照中，直接丢弃
+            with self.lock:
+                self._pending = []
+                captured = self._capture()
+            # 序列化和磁盘写入在数据锁外进行，不阻塞其他线程读写数据
+            ok = self._write_snapshot(self._render(captured))
+        if ok:
+            print(f"✅ 快照已压缩到 {self.data_file}")
+        return ok
+
+    def _compact_shared(self) -> bool:
+        """共享模式下的压缩：整个过程持有写锁和文件锁，其他进程此时不能追加WAL
+
+        版本文件在快照之后、删除WAL之前写入，中途崩溃时其他进程最多多重放一遍旧WAL。
+        """
+        with self._io_lock, self.lock:
+            dirty, files = self._render(self._capture())
+            tables = dict(self._table_versions)
+            for name in dirty:
+                tables[name] = tables.get(name, 0) + 1
+            version = {'generation': self._generation + 1, 'tables': tables}
+            files[self._version_file()] = json.dumps(version, ensure_ascii=False, indent=4)
+            ok = self._write_snapshot((dirty, files))
+            if ok:
+                self._set_version(version)
+                self._wal_offset = 0
+        if ok:
+            print(f"✅ 快照已压缩到 {self.data_file}（第 {version['generation']} 代）")
+        return ok
+
+    def _maybe_compact(self):
+        """WAL超过阈值时在后台线程中压缩"""
+        if self._compacting or not os.path.exists(self.wal_file):
+            return
+        if os.path.getsize(self.wal_file) < self.wal_compact_bytes:
+            return
+        self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name='wal-compactor', daemon=True).start()
+
+    # ---- 组提交 ----
+
+    def save(self) -> bool:
+        """保存数据：snapshot模式原子重写整个文件，journal模式只追加变更日志
+
+        调用返回时，调用之前发生的所有变更都已落盘。并发调用会合并为一次物理写入。
+        事务中或推迟保存期间调用时不写盘，由事务提交或 flush() 统一保存。
+        """
+        if self.in_transaction() or getattr(self._local, 'deferred', False):
+            return True
+        with self._commit_cond:
+            self._commit_requested += 1
+            ticket = self._commit_requested
+            while True:
+                if self._commit_completed >= ticket:
+                    # 已被其他线程的写入覆盖
+                    return self._last_commit_ok
+                if not self._committing:
+                    self._committing = True
+                    break
+                self._commit_cond.wait()
+
+        # 当前线程成为本组的写入者
+        ok = False
+        target = ticket
+        try:
+            if self.group_commit_window > 0:
+                time.sleep(self.group_commit_window)
+            with self._commit_cond:
+                target = self._commit_requested
+            ok = self._commit()
+        finally:
+            with self._commit_cond:
+                self._commit_completed = max(self._commit_completed, target if ok else ticket)
+                self._last_commit_ok = ok
+                self._committing = False
+                self._commit_cond.notify_all()
+        return ok
+
+    def _commit(self) -> bool:
+        """执行一次物理写入"""
+        if self.shared:
+            # 共享模式下变更在释放写锁时已追加到WAL，这里只需触发之前写入失败的日志重试
+            with self.lock:
+                pass
+            self._maybe_compact()
+            return not self._pending
+        with self._io_lock:
+            with self.lock:
+                journal = self.mode == 'journal'
+                if journal:
+                    lines, self._pending = self._pending, []
+                elif not self._dirty and not self._deferred:
+                    # 上次保存后没有任何变更
+                    return True
+                else:
+                    captured = self._capture()
+
+            if journal:
+                ok = self._append_wal(lines)
+                if not ok:
+                    # 写入失败时放回队列，下一次保存重试
+                    with self.lock:
+                        self._pending[:0] = lines
+            else:
+                snapshot = self._render(captured)
+                ok = self._write_snapshot(snapshot)
+
+        if journal:
+            self._maybe_compact()
+            return ok
+
+        if not ok:
+            return False
+
+        if self.layout == 'split':
+            tables = ', '.join(sorted(snapshot[0])) or 'next_id'
+            print(f"✅ 数据已保存到 {self.data_file} ({tables})")
+            return True
+
+        # 验证保存
+        if os.path.exists(self.data_file):
+            file_size = os.path.getsize(self.data_file)
+            print(f"✅ 数据已保存到 {self.data_file} ({file_size} bytes)")
+            return True
+        else:
+            print(f"❌ 保存失败: {self.data_file} 不存在")
+            return False
+
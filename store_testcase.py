@@ -0,0 +1,25 @@
+# store_testcase.py
+"""
+测试用的临时数据存储：每个测试使用单独的临时目录和一个空的数据文件。
+"""
+import json
+import os
+import tempfile
+import unittest
+
+
+class StoreTestCase(unittest.TestCase):
+    """在临时目录中准备空数据文件 self.data_file 的测试基类"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_file = os.path.join(self.tmp_dir.name, 'app_data.json')
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump({"in_memory_data": {}, "next_id": {}}, f)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _load_file(self):
+        with open(self.data_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
@@ -0,0 +1,64 @@
+"""
+单元测试：抽签选课模式。
+覆盖点：按志愿轮次抽签、一次写入分配结果。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import unittest
+
+from enrollment_lottery import EnrollmentLottery, draw
+from models import Course, Enrollment
+from repositories import CourseRepository, EnrollmentRepository, CoursePreferenceRepository, \
+    EnrollmentStatusRepository
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class TestEnrollmentLottery(StoreTestCase):
+    """围绕抽签选课的单元测试"""
+
+    def test_enrollment_lottery(self):
+        """抽签分配按志愿轮次进行且不超出容量，相同种子结果相同；关闭时一次写入全部选课记录并清空志愿"""
+        preferences = [(s, 1 if s % 2 else 2, 1) for s in range(1, 21)] + [(s, 3, 2) for s in range(1, 21)]
+        seats = {1: 3, 2: 4, 3: 5}
+        result = draw(preferences, seats, seed=7)
+        self.assertEqual(result, draw(list(reversed(preferences)), seats, seed=7))
+        self.assertNotEqual(result, draw(preferences, seats, seed=8))
+        self.assertEqual([sum(1 for _, c in result if c == course_id) for course_id in (1, 2, 3)], [3, 4, 5])
+        # 第二志愿只在全部第一志愿分配后才参与，先分给第一志愿落选的学生
+        lucky = {s for s, c in result if c in (1, 2)}
+        self.assertFalse(lucky & {s for s, c in result if c == 3})
+
+        store = DataStore(self.data_file)
+        course_repo = CourseRepository(store=store)
+        enrollment_repo = EnrollmentRepository(store=store)
+        preference_repo = CoursePreferenceRepository(store=store)
+        status_repo = EnrollmentStatusRepository(store=store)
+        for course_id, capacity in ((1, 2), (2, None)):
+            course_repo.create(Course(id=course_id, name=f'课程{course_id}', description='', credits=2, capacity=capacity))
+        enrollment_repo.create(Enrollment(id=enrollment_repo.get_next_id(), student_id=9, course_id=1))
+        lottery = EnrollmentLottery(preference_repo, enrollment_repo, course_repo, status_repo, max_choices=2)
+        seed = lottery.open_window()
+
+        course1, course2 = course_repo.get_by_id(1), course_repo.get_by_id(2)
+        self.assertEqual(lottery.submit(9, course1)[2], '该学生已经选修此课程')
+        for student_id in range(1, 6):
+            self.assertTrue(lottery.submit(student_id, course1)[0])
+            self.assertTrue(lottery.submit(student_id, course2)[0])
+        self.assertEqual(lottery.submit(1, course1)[2], '已登记该课程的志愿')
+        self.assertFalse(lottery.submit(1, Course(id=3, name='课程3', description='', credits=2))[0])
+        self.assertEqual(lottery.withdraw(5, 1), (True, '已撤回志愿'))
+        self.assertEqual(lottery.rank_of(5, 2), 1)
+
+        enrollments = lottery.allocate()
+        expected = draw([(s, 1, 1) for s in range(1, 5)] + [(s, 2, 2) for s in range(1, 5)] + [(5, 2, 1)],
+                        {1: 1, 2: None}, seed)
+        self.assertEqual([(e.student_id, e.course_id) for e in enrollments], expected)
+        self.assertEqual(enrollment_repo.get_enrollment_count(1), 2)
+        self.assertEqual(enrollment_repo.get_enrollment_count(2), 5)
+        self.assertEqual(preference_repo.count(), 0)
+        saved = self._load_file()['in_memory_data']
+        self.assertEqual((len(saved['enrollments']), saved.get('course_preferences')), (7, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
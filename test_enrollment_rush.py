@@ -0,0 +1,96 @@
+"""
+单元测试：选课高峰模式。
+覆盖点：原子分配名额、批量写入、写入失败的标记。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import threading
+import unittest
+
+from enrollment_rush import EnrollmentRush
+from models import Course, Enrollment
+from repositories import EnrollmentRepository
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class TestEnrollmentRush(StoreTestCase):
+    """围绕选课高峰模式的单元测试"""
+
+    def test_enrollment_rush(self):
+        """高峰模式下并发选课不超出容量，重复提交被拒绝，排队的记录批量写入一次保存，退课后名额可再次占用"""
+        store = DataStore(self.data_file)
+        repo = EnrollmentRepository(store=store)
+        repo.create(Enrollment(id=repo.get_next_id(), student_id=0, course_id=1))
+        rush = EnrollmentRush(repo, batch_window=0.05)
+        course = Course(id=1, name='数学', description='', credits=4, capacity=5)
+        results = []
+
+        def enroll(student_id):
+            for _ in range(2):
+                results.append(rush.enroll(student_id, course)[0])
+
+        threads = [threading.Thread(target=enroll, args=(i,)) for i in range(1, 41)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        rush.drain()
+
+        self.assertEqual(results.count(True), 4)
+        self.assertEqual(repo.get_enrollment_count(1), 5)
+        self.assertEqual(len({e.student_id for e in repo.get_by_course_id(1)}), 5)
+        self.assertEqual((rush.held(1), rush.written, rush.failed), (0, 4, 0))
+        self.assertEqual(len(self._load_file()['in_memory_data']['enrollments']), 5)
+
+        repo.delete(repo.get_by_course_id(1)[-1].id)
+        self.assertEqual(rush.enroll(99, course)[:1] + rush.enroll(99, course)[2:], (True, '该学生已经选修此课程'))
+        self.assertEqual(rush.enroll(100, course)[2], '课程已满，无法选课')
+        rush.drain()
+        self.assertIsNotNone(repo.get_enrollment(99, 1))
+
+    def test_enrollment_rush_failure(self):
+        """高峰模式下排队的选课为待确认，写入失败时退还名额并标记为失败，重新提交后清除标记"""
+        repo = EnrollmentRepository(store=DataStore(self.data_file))
+        rush = EnrollmentRush(repo)
+        course = Course(id=1, name='数学', description='', credits=4, capacity=1)
+        create = repo.create
+
+        def broken_create(enrollment):
+            raise IOError('磁盘已满')
+
+        repo.create = broken_create
+        self.assertTrue(rush.enroll(1, course)[0])
+        rush.drain()
+        self.assertEqual((rush.state(1, 1), rush.failed, rush.held(1)), ('failed', 1, 0))
+        self.assertIsNone(repo.get_enrollment(1, 1))
+
+        repo.create = create
+        self.assertTrue(rush.enroll(1, course)[0])
+        self.assertNotEqual(rush.state(1, 1), 'failed')
+        rush.drain()
+        self.assertIsNone(rush.state(1, 1))
+        self.assertIsNotNone(repo.get_enrollment(1, 1))
+
+    def test_enrollment_rush_save_failure(self):
+        """保存失败时撤销已写入内存的选课记录，退还名额并标记为失败"""
+        store = DataStore(self.data_file)
+        repo = EnrollmentRepository(store=store)
+        rush = EnrollmentRush(repo)
+        course = Course(id=1, name='数学', description='', credits=4, capacity=1)
+        store.save = lambda: False
+
+        self.assertTrue(rush.enroll(1, course)[0])
+        rush.drain()
+        self.assertEqual((rush.state(1, 1), rush.failed, rush.held(1)), ('failed', 1, 0))
+        self.assertIsNone(repo.get_enrollment(1, 1))
+        self.assertEqual(repo.get_enrollment_count(1), 0)
+
+        del store.save
+        self.assertTrue(rush.enroll(2, course)[0])
+        rush.drain()
+        self.assertIsNotNone(repo.get_enrollment(2, 1))
+        self.assertEqual(len(self._load_file()['in_memory_data']['enrollments']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
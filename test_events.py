@@ -0,0 +1,53 @@
+"""
+单元测试：数据变更事件。
+覆盖点：仓储发布变更事件、订阅与过滤。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import unittest
+
+from events import EventBus
+from models import Attendance
+from repositories import AttendanceRepository
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class TestEvents(StoreTestCase):
+    """围绕变更事件的单元测试"""
+
+    def test_change_events(self):
+        """增删改发布带前后记录的变更事件，事务中的事件提交后才发布，回滚时丢弃；队列订阅在后台按顺序处理"""
+        store = DataStore(self.data_file)
+        repo = AttendanceRepository(store=store)
+        repo.events = EventBus()
+        received, queued = [], []
+        repo.events.subscribe(received.append, tables=['attendances'])
+        subscription = repo.events.subscribe(lambda event: queued.append((event.op, event.id)), queued=True)
+        repo.events.subscribe(lambda event: 1 / 0, tables=['students'])
+
+        repo.create(Attendance(id=1, student_id=1, date='2025-03-01', status='present', reason=''))
+        repo.update(1, status='leave')
+        self.assertEqual([(e.op, e.id) for e in received], [('insert', 1), ('update', 1)])
+        self.assertIsNone(received[0].before)
+        self.assertEqual((received[1].before['status'], received[1].after['status']), ('present', 'leave'))
+
+        with self.assertRaises(RuntimeError):
+            with store.transaction():
+                repo.delete(1)
+                raise RuntimeError('回滚')
+        with store.transaction():
+            repo.create(Attendance(id=2, student_id=1, date='2025-03-02', status='present', reason=''))
+            repo.delete_by_student_id(1)
+            self.assertEqual(len(received), 2)
+        self.assertEqual([(e.op, e.id) for e in received[2:]], [('insert', 2), ('delete', 1), ('delete', 2)])
+        self.assertEqual(received[3].before['status'], 'leave')
+
+        subscription.join()
+        self.assertEqual(queued, [(e.op, e.id) for e in received])
+        subscription.cancel()
+        repo.create(Attendance(id=3, student_id=1, date='2025-03-03', status='present', reason=''))
+        self.assertEqual(len(queued), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+单元测试：内存数据表 MemoryTable。
+覆盖点：主键索引、二级索引、紧凑记录、有序日期索引、搜索倒排索引、查询计划、分页。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import unittest
+
+from memory_table import CompactRow
+from models import Student, Enrollment, Attendance, QueryBuilder
+from repositories import StudentRepository, EnrollmentRepository, AttendanceRepository
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class TestMemoryTable(StoreTestCase):
+    """围绕内存数据表索引与查询的单元测试"""
+
+    def test_primary_key_index_tracks_deletes(self):
+        """按ID查找走主键索引，删除使用墓碑且保持原有顺序"""
+        store = DataStore(self.data_file)
+        repo = StudentRepository(store=store)
+        for i in range(1, 201):
+            repo.create(Student(id=i, name=f'学生{i}', gender='男', age=16, student_id=f'S{i:03d}'))
+
+        for i in range(1, 201, 4):
+            self.assertTrue(repo.delete(i))
+        self.assertFalse(repo.delete(1))
+        self.assertEqual(repo.count(), 150)
+        self.assertIsNone(repo.get_by_id(5))
+        self.assertEqual(repo.get_by_id(6).name, '学生6')
+
+        repo.update(200, age=18)
+        self.assertEqual(repo.get_by_id(200).age, 18)
+        ids = [s.id for s in repo.get_all()]
+        self.assertEqual(ids, sorted(ids))
+
+        repo.save_data()
+        saved = self._load_file()['in_memory_data']['students']
+        self.assertEqual(len(saved), 150)
+        self.assertNotIn(None, saved)
+
+    def test_secondary_index_lookup(self):
+        """find 使用声明的（组合）索引，增删改后索引保持同步"""
+        store = DataStore(self.data_file)
+        repo = EnrollmentRepository(store=store)
+        for i in range(1, 7):
+            repo.create(Enrollment(id=i, student_id=i % 3, course_id=i % 2))
+
+        self.assertEqual(repo.table._index_for({'student_id': 1, 'course_id': 1}), ('student_id', 'course_id'))
+        self.assertEqual(repo.table._index_for({'course_id': 1, 'exam_score': None}), ('course_id',))
+        self.assertEqual([e.id for e in repo.get_by_course_id(1)], [1, 3, 5])
+        self.assertEqual(repo.get_enrollment(2, 0).id, 2)
+
+        repo.update(1, course_id=0)
+        repo.delete(3)
+        self.assertEqual([e.id for e in repo.get_by_course_id(1)], [5])
+        self.assertEqual([e.id for e in repo.get_by_course_id(0)], [1, 2, 4, 6])
+        self.assertEqual(repo.get_enrollment_count(0), 4)
+        self.assertIsNone(repo.get_enrollment(0, 1))
+
+        repo.delete_by_student_id(2)
+        self.assertEqual([e.id for e in repo.get_by_student_id(2)], [])
+        self.assertEqual([e.id for e in repo.get_by_course_id(1)], [])
+
+    def test_compact_rows_roundtrip(self):
+        """紧凑表的记录使用 slots 保存，读写、索引和快照结果与字典记录一致"""
+        store = DataStore(self.data_file)
+        repo = AttendanceRepository(store=store)
+        for i in range(1, 4):
+            repo.create(Attendance(id=i, student_id=1, date='2025-03-0' + str(i), status='present', reason=''))
+
+        rows = repo.table.rows()
+        self.assertTrue(all(isinstance(row, CompactRow) for row in rows))
+        self.assertIs(rows[0]['status'], rows[1]['status'])
+        self.assertEqual(repo.get_by_id(2), Attendance(id=2, student_id=1, date='2025-03-02',
+                                                       status='present', reason=''))
+
+        repo.update(2, status='absent')
+        # 手工数据可能带有模型之外的字段，数据表需按新字段组合重新打包
+        repo.table.update(3, {'remark': '补录'})
+        self.assertEqual([a.id for a in repo.find(status='absent')], [2])
+        self.assertEqual(repo.table.get(3)['remark'], '补录')
+        self.assertEqual(repo.get_by_student_and_date(1, '2025-03-02').status, 'absent')
+
+        repo.save_data()
+        saved = self._load_file()['in_memory_data']['attendances']
+        self.assertEqual(saved[1], {'id': 2, 'student_id': 1, 'date': '2025-03-02', 'status': 'absent', 'reason': ''})
+        self.assertEqual(saved[2]['remark'], '补录')
+
+    def test_find_range_uses_sorted_index(self):
+        """find_range 按日期有序索引返回范围内记录，增删改后有序索引保持同步"""
+        store = DataStore(self.data_file)
+        repo = AttendanceRepository(store=store)
+        dates = ['2025-03-05', '2025-03-01', '2025-03-03', '2025-03-01', '2025-03-09']
+        for i, date in enumerate(dates, start=1):
+            repo.create(Attendance(id=i, student_id=i, date=date, status='present', reason=''))
+
+        self.assertEqual([a.id for a in repo.find_range('date', '2025-03-01', '2025-03-05')], [2, 4, 3, 1])
+        self.assertEqual([a.id for a in repo.find_range('date', '2025-03-04')], [1, 5])
+        self.assertEqual([a.id for a in repo.find_range('date', hi='2025-03-02')], [2, 4])
+        self.assertEqual(repo.table._sorted_keys[('date',)], ['2025-03-01', '2025-03-03', '2025-03-05', '2025-03-09'])
+
+        repo.update(3, date='2025-03-10')
+        repo.delete(5)
+        repo.create(Attendance(id=6, student_id=6, date='2025-02-28', status='absent', reason=''))
+        self.assertEqual(repo.table._sorted_keys[('date',)], ['2025-02-28', '2025-03-01', '2025-03-05', '2025-03-10'])
+        self.assertEqual([a.id for a in repo.find_range('date', '2025-02-01', '2025-03-31')], [6, 2, 4, 1, 3])
+        self.assertEqual(repo.get_attendance_stats('2025-02-28', '2025-03-01'),
+                         {'total': 3, 'present': 2, 'absent': 1, 'leave': 0})
+
+    def test_search_uses_gram_index(self):
+        """搜索由二元组倒排索引筛选候选，结果按匹配等级排序，增删改后索引保持同步"""
+        repo = StudentRepository(store=DataStore(self.data_file))
+        for i, name in enumerate(['王张三', '张三丰', '张三', '李四'], start=1):
+            repo.create(Student(id=i, name=name, gender='男', age=16, student_id=f'S00{i}'))
+
+        # 完全相等、前缀、包含依次靠前
+        self.assertEqual([s.id for s in repo.search('张三')], [3, 2, 1])
+        self.assertEqual([s.id for s in repo.search('张三', limit=2)], [3, 2])
+        self.assertEqual([s.id for s in repo.search('四')], [4])
+        self.assertEqual([s.id for s in repo.search('s00')], [1, 2, 3, 4])
+        self.assertIn('张三', repo.table._gram_indexes['name'])
+
+        repo.update(3, name='赵六')
+        repo.delete(1)
+        repo.create(Student(id=5, name='三张', gender='女', age=15, student_id='S005'))
+        self.assertEqual([s.id for s in repo.search('张三')], [2])
+        self.assertEqual([s.id for s in repo.search('赵')], [3])
+        self.assertEqual([s.id for s in repo.search('三')], [5, 2])
+        self.assertNotIn('王张', repo.table._gram_indexes['name'])
+
+    def test_query_planner_picks_index(self):
+        """query 选择估计行数最少的索引，其余条件作为剩余过滤，排序字段有有序索引时提前结束"""
+        repo = AttendanceRepository(store=DataStore(self.data_file))
+        for i in range(1, 41):
+            repo.create(Attendance(id=i, student_id=i % 4, date=f'2025-03-{i % 20 + 1:02d}',
+                                   status='absent' if i % 10 == 0 else 'present', reason=''))
+
+        query = QueryBuilder().where('student_id', 2).where('date', '2025-03-10', 'ge').where('status', 'present', 'ne')
+        plan = repo.explain(query)
+        self.assertEqual((plan['access'], plan['index'], plan['estimated_rows']), ('index', ('student_id',), 10))
+        self.assertEqual(plan['residual'], ["date ge '2025-03-10'", "status ne 'present'"])
+        self.assertEqual([a.id for a in repo.query(query)], [10, 30])
+
+        query = QueryBuilder().where('date', '2025-03-19', 'ge').order_by('date', descending=True).limit(3).offset(1)
+        plan = repo.explain(query)
+        self.assertEqual((plan['access'], plan['order']), ('range', 'index'))
+        self.assertEqual([a.id for a in repo.query(query)], [39, 18, 38])
+
+        query = QueryBuilder().where('reason', '', 'eq').order_by('student_id').limit(2)
+        self.assertEqual((repo.explain(query)['access'], repo.explain(query)['order']), ('scan', 'sort'))
+        self.assertEqual([a.id for a in repo.query(query)], [4, 8])
+        self.assertEqual(repo.explain(QueryBuilder().where('id', 5))['access'], 'primary')
+
+    def test_page_and_keyset_pagination(self):
+        """page 按有序索引只取本页并返回总数，page_after 按 (取值, id) 游标连续翻页"""
+        repo = StudentRepository(store=DataStore(self.data_file))
+        for i, student_id in enumerate(['S05', 'S01', 'S03', 'S03', 'S02', 'S04'], start=1):
+            repo.create(Student(id=i, name=f'学生{i}', gender='男', age=16, student_id=student_id,
+                                class_name='一班' if i % 2 else '二班'))
+
+        pagination = repo.page('student_id', 2, 4)
+        self.assertEqual(([s.id for s in pagination.items], pagination.page, pagination.pages, pagination.total),
+                         ([6, 1], 2, 2, 6))
+        self.assertEqual([s.id for s in repo.page('student_id', 9, 4).items], [6, 1])
+        pagination = repo.page('student_id', 1, 2, {'class_name': '一班'}, descending=True)
+        self.assertEqual(([s.id for s in pagination.items], pagination.total), ([1, 3], 3))
+        self.assertEqual(repo.distinct('class_name'), ['一班', '二班'])
+
+        pages = []
+        items, cursor = repo.page_after('student_id', None, 2)
+        while True:
+            pages.append([s.id for s in items])
+            if cursor is None:
+                break
+            items, cursor = repo.page_after('student_id', cursor, 2)
+        self.assertEqual(pages, [[2, 5], [3, 4], [6, 1], []])
+        items, cursor = repo.page_after('student_id', ('S03', 3), 3, descending=True)
+        self.assertEqual(([s.id for s in items], cursor), ([4, 5, 2], ('S01', 2)))
+
+        # 同一取值内按 id 排列，与插入顺序无关，分页不重复也不遗漏
+        repo.create(Student(id=9, name='学生9', gender='男', age=16, student_id='S03'))
+        repo.create(Student(id=7, name='学生7', gender='男', age=16, student_id='S03'))
+        ids = [s.id for page in (1, 2, 3) for s in repo.page('student_id', page, 3, descending=True).items]
+        self.assertEqual(ids, [1, 6, 3, 4, 7, 9, 5, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
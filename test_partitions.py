@@ -0,0 +1,70 @@
+"""
+单元测试：按月分区的数据表 PartitionedTable。
+覆盖点：按月分区与封存。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import json
+import unittest
+
+from models import Attendance, QueryCondition
+from repositories import AttendanceRepository
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class PartitionedAttendanceRepository(AttendanceRepository):
+    """开启按月分区的考勤仓储（对应配置 ATTENDANCE_PARTITIONS）"""
+    table_name = 'attendances'
+    partition_by = 'date'
+
+
+class TestPartitionedTable(StoreTestCase):
+    """围绕按月分区与封存的单元测试"""
+
+    def test_attendance_month_partitions(self):
+        """考勤按月分区：原有记录迁移到分区，查询只访问重叠的月份，封存的月份按需加载、写入时装回"""
+        rows = [{'id': 1, 'student_id': 1, 'date': '2025-01-10', 'status': 'present', 'reason': ''},
+                {'id': 2, 'student_id': 1, 'date': '2025-02-03', 'status': 'absent', 'reason': ''},
+                {'id': 3, 'student_id': 2, 'date': '2025-03-01', 'status': 'present', 'reason': ''}]
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump({'in_memory_data': {'attendances': rows}, 'next_id': {'attendances': 4}}, f)
+        repo = PartitionedAttendanceRepository(store=DataStore(self.data_file))
+        self.assertEqual([a.id for a in repo.find_range('date', '2025-01-01', '2025-03-31')], [1, 2, 3])
+        self.assertEqual(repo.table.explain([QueryCondition('date', '2025-02-01', 'ge')])['partitions'],
+                         ['attendances@2025-02', 'attendances@2025-03'])
+        self.assertEqual([a['id'] for a in repo.table.query([], order_by='date', descending=True, limit=2)], [3, 2])
+        repo.save_data()
+        self.assertEqual(sorted(self._load_file()['in_memory_data']),
+                         ['attendances', 'attendances@2025-01', 'attendances@2025-02', 'attendances@2025-03'])
+
+        self.assertEqual(repo.seal_partitions('2025-03'), ['2025-01', '2025-02'])
+        self.assertNotIn('attendances@2025-01', self._load_file()['in_memory_data'])
+        reloaded = PartitionedAttendanceRepository(store=DataStore(self.data_file))
+        # 封存月份的记录数取自清单，不加载分段
+        self.assertEqual(reloaded.count(), 3)
+        self.assertEqual(list(reloaded.table._cold), [])
+        self.assertEqual(reloaded.get_attendance_stats('2025-02-01', '2025-03-31'),
+                         {'total': 2, 'present': 1, 'absent': 1, 'leave': 0})
+        self.assertEqual(list(reloaded.table._cold), ['2025-02'])
+        self.assertEqual(reloaded.get_by_id(1).date, '2025-01-10')
+
+        # 写入封存的月份时装回为普通分区，事务回滚后仍以分段为准
+        with self.assertRaises(RuntimeError):
+            with reloaded.store.transaction():
+                reloaded.table.update(2, {'status': 'leave'})
+                raise RuntimeError('回滚')
+        self.assertNotIn('attendances@2025-02', reloaded.store.table_names())
+        self.assertEqual(reloaded.table.get(2)['status'], 'absent')
+        reloaded.update(2, status='leave')
+        reloaded.create(Attendance(id=reloaded.get_next_id(), student_id=2, date='2025-01-11', status='present', reason=''))
+        reloaded.save_data()
+
+        again = PartitionedAttendanceRepository(store=DataStore(self.data_file))
+        self.assertEqual(again.get_by_id(2).status, 'leave')
+        self.assertEqual(again.get_by_id(4).date, '2025-01-11')
+        self.assertEqual(again.count(), 4)
+        self.assertEqual([a.id for a in again.get_by_date('2025-01-11')], [4])
+
+
+if __name__ == '__main__':
+    unittest.main()
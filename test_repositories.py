@@ -0,0 +1,95 @@
+"""
+单元测试：仓储层。
+覆盖点：标识映射、物化选课人数。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import unittest
+
+from models import Student, Enrollment
+from repositories import StudentRepository, EnrollmentRepository
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class TestRepositories(StoreTestCase):
+    """围绕仓储的单元测试"""
+
+    def test_identity_map_reuses_models(self):
+        """重复读取复用同一模型实例，更新和删除后失效"""
+        store = DataStore(self.data_file)
+        repo = StudentRepository(store=store)
+        repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        repo.create(Student(id=2, name='李四', gender='女', age=15, student_id='S002'))
+
+        first = repo.get_by_id(1)
+        self.assertIs(repo.get_by_id(1), first)
+        self.assertIs(repo.get_all()[0], first)
+        self.assertIs(repo.get_by_student_id('S001'), first)
+
+        updated = repo.update(1, age=17)
+        self.assertIsNot(updated, first)
+        self.assertEqual(repo.get_by_id(1).age, 17)
+
+        repo.get_by_id(2)
+        repo.delete(2)
+        self.assertIsNone(repo.get_by_id(2))
+        self.assertEqual([s.id for s in repo.get_all()], [1])
+
+    def test_identity_map_skips_rows_read_before_a_write(self):
+        """读出记录后、构建模型前发生的更新或删除不会把旧记录留在标识映射中"""
+        repo = StudentRepository(store=DataStore(self.data_file))
+        repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        repo.create(Student(id=2, name='李四', gender='女', age=15, student_id='S002'))
+        table_get = repo.table.get
+
+        def read_then(write):
+            # 读线程取到记录后，写操作完成写入和失效，读线程再构建模型
+            def get(item_id):
+                item_dict = table_get(item_id)
+                del repo.table.get
+                write()
+                return item_dict
+            repo.table.get = get
+
+        read_then(lambda: repo.update(1, age=17))
+        self.assertEqual(repo.get_by_id(1).age, 16)
+        self.assertEqual(repo.get_by_id(1).age, 17)
+        self.assertEqual(repo.update(1, age=18).age, 18)
+        self.assertEqual(repo.get_by_id(1).age, 18)
+
+        read_then(lambda: repo.delete(2))
+        self.assertEqual(repo.get_by_id(2).name, '李四')
+        self.assertIsNone(repo.get_by_id(2))
+
+    def test_enrollment_counts(self):
+        """选课人数由变更事件增量维护：选课、退课、换课、级联删除和回滚后与选课记录一致，绕过仓储的写入由核对修正"""
+        store = DataStore(self.data_file)
+        repo = EnrollmentRepository(store=store)
+        for i in range(1, 7):
+            repo.create(Enrollment(id=i, student_id=i, course_id=i % 2))
+        self.assertEqual(repo.get_enrollment_counts(), {0: 3, 1: 3})
+
+        repo.delete(1)
+        repo.update(2, course_id=1)
+        with self.assertRaises(RuntimeError):
+            with store.transaction():
+                repo.delete_by_course_id(1)
+                self.assertEqual(repo.get_enrollment_count(1), 3)
+                raise RuntimeError('回滚')
+        self.assertEqual((repo.get_enrollment_count(0), repo.get_enrollment_count(1)), (2, 3))
+        with store.transaction():
+            repo.delete_by_course_id(1)
+        self.assertEqual(repo.get_enrollment_counts(), {0: 2})
+        # 另一个存储上的写入不影响本仓储的计数
+        EnrollmentRepository(store=DataStore(self.data_file)).create(Enrollment(id=9, student_id=9, course_id=0))
+        self.assertEqual(repo.get_enrollment_count(0), 2)
+
+        repo.table.insert({'id': 7, 'student_id': 7, 'course_id': 2})
+        self.assertEqual(repo.get_enrollment_count(2), 0)
+        self.assertEqual(repo.counts.reconcile(), {2: (0, 1)})
+        self.assertEqual(repo.get_enrollment_count(2), 1)
+        self.assertEqual(repo.counts.reconcile(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+单元测试：服务层。
+覆盖点：按 (日期, 学生姓名) 倒序分页、隐藏学生已删除的记录。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import types
+import unittest
+
+from models import Student, Attendance, QueryBuilder
+from repositories import StudentRepository, AttendanceRepository
+from services import BaseService
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class TestServices(StoreTestCase):
+    """围绕服务层的单元测试"""
+
+    def test_page_by_date_and_student(self):
+        """分页结果与关联全部记录后按 (日期, 姓名) 倒序整体排序相同，学生已删除的记录不显示、不计入总数"""
+        store = DataStore(self.data_file)
+        student_repo = StudentRepository(store=store)
+        attendance_repo = AttendanceRepository(store=store)
+        names = ['张三', '李四', '王五', '赵六']
+        for i, name in enumerate(names, 1):
+            student_repo.create(Student(id=i, name=name, gender='男', age=16, student_id=f'S00{i}'))
+        record_id = 0
+        for day in range(1, 6):
+            for student_id in (1, 2, 3, 4, 9):
+                record_id += 1
+                attendance_repo.create(Attendance(id=record_id, student_id=student_id,
+                                                  date=f'2024-03-0{day}', status='出勤', reason=''))
+        service = BaseService()
+        service.repo_manager = types.SimpleNamespace(student_repo=student_repo)
+
+        expected = sorted(((a.date, student_repo.get_by_id(a.student_id).name) for a in attendance_repo.get_all()
+                           if a.student_id != 9), reverse=True)
+        seen = []
+        for page in range(1, 5):
+            pagination = service._page_by_date_and_student(attendance_repo, page, 6)
+            self.assertEqual(pagination.total, 20)
+            seen += [(a.date, s.name) for a, s in pagination.items]
+        self.assertEqual(seen, expected)
+        # 页码超出范围时返回最后一页
+        self.assertEqual(service._page_by_date_and_student(attendance_repo, 9, 6).page, 4)
+
+        query = QueryBuilder().where('date', '2024-03-02', 'ge').where('date', '2024-03-03', 'le')
+        pagination = service._page_by_date_and_student(attendance_repo, 1, 10, query)
+        self.assertEqual(pagination.total, 8)
+        self.assertEqual([(a.date, s.name) for a, s in pagination.items],
+                         [pair for pair in expected if '2024-03-02' <= pair[0] <= '2024-03-03'])
+
+
+if __name__ == '__main__':
+    unittest.main()
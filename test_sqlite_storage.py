@@ -0,0 +1,140 @@
+"""
+单元测试：SQLite 存储。
+覆盖点：与JSON存储相同的仓储接口、复合索引、范围查询、搜索、查询翻译为SQL、事务回滚（含提交失败）、分页。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from models import Student, Enrollment, Attendance, QueryBuilder
+from repositories import StudentRepository, EnrollmentRepository, AttendanceRepository
+from sqlite_storage import SqliteStore
+
+
+class TestSqliteStore(unittest.TestCase):
+    """SQLite 存储与JSON存储遵循相同的仓储接口"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp_dir.name, 'app_data.db')
+        self.store = SqliteStore(self.db_file)
+
+    def tearDown(self):
+        self.store.connection().close()
+        self.tmp_dir.cleanup()
+
+    def test_crud_contract(self):
+        """get_all/get_by_id/find/find_one/create/update/delete/count"""
+        repo = StudentRepository(store=self.store)
+        for i in range(1, 4):
+            repo.create(Student(id=repo.get_next_id(), name=f'学生{i}', gender='男', age=15,
+                                student_id=f'S00{i}', class_name='一班' if i < 3 else '二班'))
+
+        self.assertEqual(repo.count(), 3)
+        self.assertEqual([s.id for s in repo.get_all()], [1, 2, 3])
+        self.assertEqual(repo.get_by_id(2).name, '学生2')
+        self.assertEqual(len(repo.get_by_class('一班')), 2)
+        self.assertEqual(repo.get_by_student_id('S003').id, 3)
+        self.assertEqual([s.id for s in repo.search('s00')], [1, 2, 3])
+
+        self.assertEqual(repo.update(1, age=16).age, 16)
+        self.assertIsNone(repo.update(99, age=16))
+        self.assertTrue(repo.delete(3))
+        self.assertFalse(repo.delete(3))
+        self.assertIsNone(repo.get_by_id(3))
+        self.assertEqual(repo.get_next_id(), 4)
+
+    def test_composite_lookup_uses_index(self):
+        """组合查询命中 json_extract 表达式索引"""
+        repo = EnrollmentRepository(store=self.store)
+        repo.create(Enrollment(id=1, student_id=1, course_id=2))
+        repo.create(Enrollment(id=2, student_id=1, course_id=3))
+
+        self.assertEqual(repo.get_enrollment(1, 3).id, 2)
+        repo.delete_by_student_id(1)
+        self.assertEqual(repo.count(), 0)
+
+        where, params = repo.table._where({'student_id': 1, 'course_id': 3})
+        plan = self.store.connection().execute(
+            f'EXPLAIN QUERY PLAN SELECT data FROM {repo.table.quoted}{where}', params
+        ).fetchall()
+        self.assertIn('idx_enrollments_student_id_course_id', str(plan))
+
+    def test_find_range(self):
+        """范围查询按日期排序，走 json_extract 表达式索引"""
+        repo = AttendanceRepository(store=self.store)
+        for i, date in enumerate(['2025-03-05', '2025-03-01', '2025-03-03'], start=1):
+            repo.create(Attendance(id=i, student_id=1, date=date, status='present', reason=''))
+
+        self.assertEqual([a.id for a in repo.find_range('date', '2025-03-01', '2025-03-04')], [2, 3])
+        self.assertEqual([a.id for a in repo.find_range('date', '2025-03-02')], [3, 1])
+
+    def test_search_ranking(self):
+        """搜索排序与内存表一致"""
+        repo = StudentRepository(store=self.store)
+        for i, name in enumerate(['王张三', '张三丰', '张三'], start=1):
+            repo.create(Student(id=i, name=name, gender='男', age=16, student_id=f'S00{i}'))
+
+        self.assertEqual([s.id for s in repo.search('张三')], [3, 2, 1])
+        self.assertEqual([s.id for s in repo.search('张三', limit=1)], [3])
+
+    def test_query_translates_to_sql(self):
+        """query 翻译为SQL条件、排序和分页，explain 返回 SQLite 的查询计划"""
+        repo = AttendanceRepository(store=self.store)
+        for i, date in enumerate(['2025-03-05', '2025-03-01', '2025-03-03', '2025-03-07'], start=1):
+            repo.create(Attendance(id=i, student_id=i % 2, date=date, status='present', reason=''))
+
+        query = QueryBuilder().where('date', '2025-03-02', 'gt').where('student_id', 0, 'ne').order_by('date')
+        self.assertEqual([a.id for a in repo.query(query)], [3, 1])
+        self.assertEqual([a.id for a in repo.query(QueryBuilder().order_by('date', True).limit(2).offset(1))], [1, 3])
+        self.assertEqual(repo.explain(QueryBuilder().where('student_id', 1))['access'], 'index')
+
+    def test_transaction_rollback(self):
+        """事务回滚撤销块内全部变更，块内的读-改-写并入同一个事务"""
+        repo = StudentRepository(store=self.store)
+        repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction():
+                repo.update(1, age=17)
+                repo.create(Student(id=repo.get_next_id(), name='李四', gender='女', age=15, student_id='S002'))
+                raise RuntimeError('boom')
+        self.assertEqual((repo.count(), repo.get_by_id(1).age), (1, 16))
+        self.assertFalse(self.store.in_transaction())
+
+    def test_transaction_commit_failure_rolls_back(self):
+        """COMMIT 失败时回滚整个事务并抛出原异常，连接不会停留在事务中，提交后回调不执行"""
+        repo = StudentRepository(store=self.store)
+        conn = self.store.connection()
+        # 延迟检查的外键约束在 COMMIT 时才报错
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('CREATE TABLE parent (id INTEGER PRIMARY KEY)')
+        conn.execute('CREATE TABLE child (parent_id INTEGER REFERENCES parent(id) DEFERRABLE INITIALLY DEFERRED)')
+        called = []
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.store.transaction():
+                repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+                conn.execute('INSERT INTO child (parent_id) VALUES (1)')
+                self.store.after_commit(lambda: called.append(True))
+        self.assertFalse(self.store.in_transaction())
+        self.assertEqual((repo.count(), called), (0, []))
+
+        repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        self.assertEqual(repo.count(), 1)
+
+    def test_page_and_keyset_pagination(self):
+        """分页与键集游标的顺序和内存表一致"""
+        repo = StudentRepository(store=self.store)
+        for i, student_id in enumerate(['S05', 'S01', 'S03', 'S03', 'S02'], start=1):
+            repo.create(Student(id=i, name=f'学生{i}', gender='男', age=16, student_id=student_id))
+
+        pagination = repo.page('student_id', 2, 2)
+        self.assertEqual(([s.id for s in pagination.items], pagination.total), ([3, 4], 5))
+        items, cursor = repo.page_after('student_id', ('S03', 3), 2)
+        self.assertEqual(([s.id for s in items], cursor), ([4, 1], ('S05', 1)))
+        self.assertEqual(repo.page_after('student_id', cursor, 2), ([], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,426 @@
+"""
+单元测试：共享数据存储 DataStore。
+覆盖点：共享数据存储、WAL日志模式、事务、推迟保存、多进程共享、外部修改重载、ID段分配、原子快照与组提交、读写锁、按表分文件存储、二进制快照。
+框架：unittest（标准库，无需额外依赖）。
+"""
+import json
+import os
+import threading
+import unittest
+
+from memory_table import MemoryTable
+from models import Student, Course, Attendance, QueryCondition
+from repositories import StudentRepository, CourseRepository, AttendanceRepository
+from storage import DataStore
+from store_testcase import StoreTestCase
+
+
+class TestDataStore(StoreTestCase):
+    """围绕共享数据存储的单元测试"""
+
+    def test_repositories_share_one_store(self):
+        """同一数据文件的仓储共享同一份内存数据"""
+        store = DataStore(self.data_file)
+        student_repo = StudentRepository(store=store)
+        course_repo = CourseRepository(store=store)
+
+        self.assertIs(student_repo.store, course_repo.store)
+        self.assertIs(DataStore.open(self.data_file), DataStore.open(self.data_file))
+
+    def test_save_keeps_other_tables(self):
+        """一个仓储保存时不会覆盖其他仓储未保存的表"""
+        store = DataStore(self.data_file)
+        student_repo = StudentRepository(store=store)
+        course_repo = CourseRepository(store=store)
+
+        course_repo.create(Course(id=1, name='数学', description='', credits=3))
+        student_repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        student_repo.save_data()
+
+        saved = self._load_file()['in_memory_data']
+        self.assertEqual(len(saved['students']), 1)
+        self.assertEqual(len(saved['courses']), 1)
+
+    def test_journal_mode_appends_and_replays(self):
+        """journal模式只追加日志，重新加载时重放快照+WAL"""
+        store = DataStore(self.data_file)
+        store.set_mode('journal')
+        repo = StudentRepository(store=store)
+        snapshot_before = self._load_file()
+
+        student_id = repo.get_next_id()
+        repo.create(Student(id=student_id, name='张三', gender='男', age=16, student_id='S001'))
+        repo.create(Student(id=repo.get_next_id(), name='李四', gender='女', age=15, student_id='S002'))
+        repo.update(student_id, age=17)
+        repo.save_data()
+        repo.delete(student_id + 1)
+        repo.save_data()
+
+        # 快照文件未被重写，变更只出现在WAL中
+        self.assertEqual(self._load_file(), snapshot_before)
+        self.assertTrue(os.path.exists(store.wal_file))
+
+        reloaded = StudentRepository(store=DataStore(self.data_file))
+        self.assertEqual(reloaded.count(), 1)
+        self.assertEqual(reloaded.get_by_id(student_id).age, 17)
+        # 预留过的ID段不会再次分配
+        self.assertEqual(reloaded.get_next_id(), student_id + MemoryTable.ID_BLOCK)
+
+    def test_transaction_commits_once_and_rolls_back(self):
+        """事务提交时跨表变更只写一次WAL，异常时恢复记录和索引，预留的ID不回收"""
+        store = DataStore(self.data_file)
+        store.set_mode('journal')
+        students = StudentRepository(store=store)
+        attendance = AttendanceRepository(store=store)
+        for i in (1, 2):
+            students.create(Student(id=students.get_next_id(), name=f'学生{i}', gender='男', age=16,
+                                    student_id=f'S00{i}'))
+            attendance.create(Attendance(id=attendance.get_next_id(), student_id=1, date=f'2025-03-0{i}',
+                                         status='present', reason=''))
+        store.save()
+
+        with store.transaction():
+            attendance.update(1, status='leave')
+            attendance.create(Attendance(id=attendance.get_next_id(), student_id=2, date='2025-03-03',
+                                         status='leave', reason=''))
+            students.update(2, age=17)
+            # 块内保存推迟到提交
+            self.assertTrue(students.save_data())
+            self.assertEqual(len(store._pending), 3)
+        self.assertEqual(store._pending, [])
+        with open(store.wal_file, encoding='utf-8') as f:
+            # 每张表只在预留ID段时记录一次 next_id
+            self.assertEqual(len(f.readlines()), 9)
+
+        next_id = store.data['next_id']['attendances']
+        with self.assertRaises(RuntimeError):
+            with store.transaction():
+                attendance.delete_by_student_id(1)
+                attendance.create(Attendance(id=attendance.get_next_id(), student_id=2, date='2025-03-04',
+                                             status='absent', reason=''))
+                students.update(1, name='改名')
+                attendance.reserve_ids(5)
+                raise RuntimeError('boom')
+        self.assertEqual([json.loads(line)['op'] for line in store._pending], ['next_id'])
+        self.assertEqual(store.data['next_id']['attendances'], next_id + 5)
+        self.assertEqual([a.id for a in attendance.get_by_student_id(1)], [1, 2])
+        self.assertEqual(attendance.get_by_id(1).status, 'leave')
+        self.assertIsNone(attendance.get_by_id(4))
+        self.assertEqual(students.table.get(1)['name'], '学生1')
+        self.assertEqual([a.id for a in attendance.find_range('date', '2025-03-01')], [1, 2, 3])
+
+        reloaded = DataStore(self.data_file)
+        self.assertEqual(AttendanceRepository(store=reloaded).count(), 3)
+        self.assertEqual(StudentRepository(store=reloaded).get_by_id(2).age, 17)
+
+    def test_deferred_saves_flush_once(self):
+        """推迟保存期间 save() 不写盘，flush() 一次写出全部变更，没有变更时不写"""
+        store = DataStore(self.data_file)
+        repo = StudentRepository(store=store)
+        store.defer_saves()
+        repo.create(Student(id=repo.get_next_id(), name='张三', gender='男', age=16, student_id='S001'))
+        repo.save_data()
+        repo.update(1, age=17)
+        repo.save_data()
+        self.assertEqual(self._load_file()['in_memory_data'], {})
+        self.assertTrue(store.has_unsaved_changes())
+
+        mtime = os.path.getmtime(self.data_file)
+        self.assertTrue(store.flush())
+        self.assertEqual(self._load_file()['in_memory_data']['students'][0]['age'], 17)
+        self.assertFalse(store.has_unsaved_changes())
+        os.utime(self.data_file, (mtime, mtime))
+        self.assertTrue(store.flush())
+        self.assertEqual(os.path.getmtime(self.data_file), mtime)
+
+    def test_shared_mode_syncs_between_stores(self):
+        """共享模式下两个存储（模拟两个进程）写入互不覆盖，增量读入对方的变更，压缩后只重载有变更的表"""
+        first, second = DataStore(self.data_file), DataStore(self.data_file)
+        first.set_shared()
+        second.set_shared()
+        students_a, students_b = StudentRepository(store=first), StudentRepository(store=second)
+        courses_a, courses_b = CourseRepository(store=first), CourseRepository(store=second)
+        self.assertFalse(students_a._use_identity_map)
+
+        students_a.create(Student(id=students_a.get_next_id(), name='张三', gender='男', age=16, student_id='S001'))
+        courses_a.create(Course(id=courses_a.get_next_id(), name='数学', description='', credits=3))
+        self.assertTrue(second.refresh())
+        self.assertFalse(second.refresh())
+        self.assertEqual(students_b.get_by_student_id('S001').name, '张三')
+        # 预留ID段前先读入对方预留的ID段，不会冲突
+        block = MemoryTable.ID_BLOCK
+        students_b.create(Student(id=students_b.get_next_id(), name='李四', gender='女', age=15, student_id='S002'))
+        students_b.update(1, age=17)
+        self.assertEqual(students_b.table.get(1 + block)['id'], 1 + block)
+
+        first.refresh()
+        self.assertEqual([(s.id, s.age) for s in students_a.get_all()], [(1, 17), (1 + block, 15)])
+
+        self.assertTrue(second.compact())
+        first.refresh()
+        course = courses_a.table.get(1)
+        students_b.delete(1 + block)
+        self.assertTrue(second.compact())
+        first.refresh()
+        self.assertEqual([s.id for s in students_a.get_all()], [1])
+        self.assertEqual(students_a.get_by_id(1).age, 17)
+        # 第二次压缩时课程表没有变更，不会重新加载
+        self.assertIs(courses_a.table.get(1), course)
+        self.assertEqual((first._generation, first._table_versions), (2, {'students': 2, 'courses': 1}))
+
+        reloaded = StudentRepository(store=DataStore(self.data_file))
+        self.assertEqual([s.id for s in reloaded.get_all()], [1])
+        self.assertEqual(reloaded.get_next_id(), 1 + 2 * block)
+
+    def test_reload_external_changes(self):
+        """手工编辑数据文件后只重新加载有变化的表，WAL中的变更重新应用，自身的写入不算外部修改"""
+        store = DataStore(self.data_file)
+        store.set_mode('journal')
+        students = StudentRepository(store=store)
+        courses = CourseRepository(store=store)
+        students.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        courses.create(Course(id=1, name='数学', description='', credits=3))
+        store.compact()
+        students.update(1, age=17)
+        students.save_data()
+        self.assertEqual(store.reload_external_changes(), [])
+        self.assertEqual(students.get_by_student_id('S001').name, '张三')
+        course = courses.table.get(1)
+
+        data = self._load_file()
+        data['in_memory_data']['students'][0]['name'] = '张三丰'
+        data['in_memory_data']['students'].append(
+            Student(id=10, name='王五', gender='男', age=15, student_id='S010').to_dict())
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        stat = os.stat(self.data_file)
+        os.utime(self.data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.assertEqual(store.reload_external_changes(), ['students'])
+        self.assertEqual(store.reload_external_changes(), [])
+        student = students.table.get(1)
+        self.assertEqual((student['name'], student['age']), ('张三丰', 17))
+        # 已建立的索引随新数据一起换上
+        self.assertIn('student_id', {fields[0] for fields in students.table._indexes})
+        self.assertEqual(students.table.find({'student_id': 'S010'})[0]['name'], '王五')
+        self.assertIs(courses.table.get(1), course)
+        self.assertEqual(students.get_next_id(), 11)
+
+    def test_block_id_allocation(self):
+        """多线程并发取号不重复，每个ID段只记录一次 next_id；批量预留得到连续的ID"""
+        store = DataStore(self.data_file)
+        store.set_mode('journal')
+        repo = AttendanceRepository(store=store)
+        ids = []
+
+        def allocate():
+            ids.extend(repo.get_next_id() for _ in range(400))
+
+        threads = [threading.Thread(target=allocate) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(ids), list(range(1, 3201)))
+        self.assertEqual(len(store._pending), 3200 // MemoryTable.ID_BLOCK)
+        self.assertEqual(repo.reserve_ids(5), range(3201, 3206))
+        self.assertEqual(repo.get_next_id(), 3206)
+
+    def test_compact_keeps_state(self):
+        """压缩后快照包含全部数据，重放剩余WAL结果不变"""
+        store = DataStore(self.data_file)
+        store.set_mode('journal')
+        repo = StudentRepository(store=store)
+        for i in range(1, 4):
+            repo.create(Student(id=i, name=f'学生{i}', gender='男', age=16, student_id=f'S00{i}'))
+        repo.save_data()
+        store.compact()
+
+        self.assertEqual(len(self._load_file()['in_memory_data']['students']), 3)
+        reloaded = StudentRepository(store=DataStore(self.data_file))
+        self.assertEqual(reloaded.count(), 3)
+
+    def test_snapshot_write_is_atomic(self):
+        """快照通过临时文件原子替换，不留下临时文件"""
+        store = DataStore(self.data_file)
+        repo = StudentRepository(store=store)
+        repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        self.assertTrue(repo.save_data())
+
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['app_data.json'])
+        self.assertEqual(len(self._load_file()['in_memory_data']['students']), 1)
+
+    def test_corrupt_file_is_preserved(self):
+        """数据文件损坏时先备份，后续保存不会覆盖原始内容"""
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            f.write('{"in_memory_data": {"students": [')
+        # 数据在首次访问时加载
+        self.assertEqual(DataStore(self.data_file).table('students').count(), 0)
+
+        backups = [name for name in os.listdir(self.tmp_dir.name) if '.corrupt-' in name]
+        self.assertEqual(len(backups), 1)
+
+    def test_group_commit_coalesces_saves(self):
+        """并发保存请求合并为少量物理写入"""
+        store = DataStore(self.data_file)
+        store.group_commit_window = 0.05
+        repo = StudentRepository(store=store)
+        commits = []
+        original_commit = store._commit
+
+        def counting_commit():
+            commits.append(1)
+            return original_commit()
+
+        store._commit = counting_commit
+        results = []
+
+        def worker(i):
+            repo.create(Student(id=i, name=f'学生{i}', gender='男', age=16, student_id=f'S{i:03d}'))
+            results.append(repo.save_data())
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(1, 21)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertTrue(all(results))
+        self.assertLess(len(commits), 20)
+        self.assertEqual(len(self._load_file()['in_memory_data']['students']), 20)
+
+    def test_concurrent_reads_see_consistent_rows(self):
+        """并发写入时读者互不阻塞，且只会读到完整的记录（压力测试）"""
+        store = DataStore(self.data_file)
+        table = AttendanceRepository(store=store).table
+        for i in range(1, 301):
+            table.insert({'id': i, 'student_id': i % 10, 'date': '2025-03-01', 'status': 'v0', 'reason': 'v0'})
+        stop = threading.Event()
+        errors = []
+        reads = []
+
+        def check(rows, total=None):
+            if total is not None and len(rows) != total:
+                errors.append(len(rows))
+            for row in rows:
+                if row['status'] != row['reason']:
+                    errors.append(row)
+
+        def reader():
+            count = 0
+            try:
+                while not stop.is_set():
+                    check(table.rows(), 300)
+                    check(table.find({'student_id': count % 10}), 30)
+                    check(table.query([QueryCondition('date', '2025-03-01')], limit=50), 50)
+                    count += 3
+            except Exception as e:
+                errors.append(e)
+            reads.append(count)
+
+        def writer(seed):
+            n = 0
+            try:
+                while not stop.is_set():
+                    n += 1
+                    item_id = (seed * 7919 + n * 31) % 300 + 1
+                    table.update(item_id, {'status': f'v{n}', 'reason': f'v{n}'})
+                    # 在写锁内批量删除再插回，触发墓碑清理和索引桶的增删，读者只能看到前后两个状态
+                    with store.lock:
+                        table.delete_where({'student_id': n % 10})
+                        for i in range(n % 10 or 10, 301, 10):
+                            table.insert({'id': i, 'student_id': n % 10, 'date': '2025-03-01',
+                                          'status': 'v0', 'reason': 'v0'})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        threads += [threading.Thread(target=writer, args=(seed,)) for seed in range(2)]
+        for t in threads:
+            t.start()
+        stop.wait(0.5)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(all(reads))
+        self.assertEqual(table.count(), 300)
+        with store.lock.read():
+            self.assertRaises(RuntimeError, store.lock.acquire)
+
+    def test_split_layout_lazy_load_and_dirty_save(self):
+        """split 布局按需加载表，保存时只重写有变更的表文件"""
+        repo = StudentRepository(store=DataStore(self.data_file))
+        CourseRepository(store=repo.store).create(Course(id=1, name='数学', description='', credits=3))
+        repo.create(Student(id=1, name='张三', gender='男', age=16, student_id='S001'))
+        repo.save_data()
+
+        data_dir = os.path.join(self.tmp_dir.name, 'data')
+        store = DataStore(data_dir, layout='split', seed_file=self.data_file)
+        self.assertTrue(os.path.exists(os.path.join(data_dir, 'courses.jsonl')))
+        student_repo = StudentRepository(store=store)
+        course_repo = CourseRepository(store=store)
+        self.assertNotIn('courses', store.data['in_memory_data'])
+
+        written = []
+        original_write = store._atomic_write
+        store._atomic_write = lambda path, text: (written.append(os.path.basename(path)), original_write(path, text))
+        student_repo.update(1, age=17)
+        student_repo.save_data()
+        self.assertEqual(sorted(written), ['next_id.json', 'students.jsonl'])
+        self.assertNotIn('courses', store.data['in_memory_data'])
+
+        reloaded = DataStore(data_dir, layout='split')
+        self.assertEqual(StudentRepository(store=reloaded).get_by_id(1).age, 17)
+        self.assertEqual(CourseRepository(store=reloaded).get_by_id(1).name, '数学')
+        self.assertEqual(course_repo.count(), 1)
+
+    def test_split_layout_journal_replay(self):
+        """split 布局的WAL在对应表首次加载时重放，压缩后写入表文件"""
+        data_dir = os.path.join(self.tmp_dir.name, 'data')
+        store = DataStore(data_dir, layout='split')
+        store.set_mode('journal')
+        repo = StudentRepository(store=store)
+        repo.create(Student(id=repo.get_next_id(), name='张三', gender='男', age=16, student_id='S001'))
+        repo.save_data()
+        self.assertFalse(os.path.exists(os.path.join(data_dir, 'students.jsonl')))
+
+        reloaded = DataStore(data_dir, layout='split')
+        self.assertEqual(StudentRepository(store=reloaded).count(), 1)
+        self.assertTrue(reloaded.compact())
+        self.assertFalse(os.path.exists(reloaded.wal_file))
+        self.assertEqual(StudentRepository(store=DataStore(data_dir, layout='split')).get_next_id(),
+                         1 + MemoryTable.ID_BLOCK)
+
+    def test_binary_snapshot_preferred_when_newer(self):
+        """二进制快照不比JSON旧时优先加载，JSON更新或格式不符时回退到JSON"""
+        store = DataStore(self.data_file)
+        store.binary_snapshot = True
+        repo = AttendanceRepository(store=store)
+        repo.create(Attendance(id=1, student_id=1, date='2025-03-01', status='present', reason=''))
+        repo.save_data()
+        binary_file = os.path.join(self.tmp_dir.name, 'app_data.bin')
+        self.assertTrue(os.path.exists(binary_file))
+
+        # JSON 与二进制内容不同，便于区分实际加载的是哪一份
+        data = self._load_file()
+        data['in_memory_data']['attendances'][0]['status'] = 'absent'
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        json_mtime = os.path.getmtime(self.data_file)
+
+        os.utime(binary_file, (json_mtime + 1, json_mtime + 1))
+        self.assertEqual(AttendanceRepository(store=DataStore(self.data_file)).get_by_id(1).status, 'present')
+
+        os.utime(binary_file, (json_mtime - 1, json_mtime - 1))
+        self.assertEqual(AttendanceRepository(store=DataStore(self.data_file)).get_by_id(1).status, 'absent')
+
+        with open(binary_file, 'wb') as f:
+            f.write(b'SMSSNAP\x00garbage')
+        os.utime(binary_file, (json_mtime + 1, json_mtime + 1))
+        self.assertEqual(AttendanceRepository(store=DataStore(self.data_file)).get_by_id(1).status, 'absent')
+
+
+if __name__ == '__main__':
+    unittest.main()